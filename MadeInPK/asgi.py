@@ -12,9 +12,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MadeInPK.settings')
 django_asgi_app = get_asgi_application()
 
 # Import routing and middleware after Django is initialized
-from api import routing
+from api import reference_data, routing
 from api.middleware import TokenAuthMiddlewareStack
 
+reference_data.warm()
+
 websocket_application = TokenAuthMiddlewareStack(
     URLRouter(
         routing.websocket_urlpatterns
@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from datetime import timedelta
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MadeInPK.settings')
@@ -18,11 +19,15 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'check-auction-endings': {
         'task': 'api.tasks.check_auction_endings',
-        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+        'schedule': crontab(minute='*/15'),  # Reconciliation only - see dispatch-deadlines
     },
     'check-payment-deadlines': {
         'task': 'api.tasks.check_payment_deadlines',
-        'schedule': crontab(minute='*/30'),  # Every 30 minutes
+        'schedule': crontab(minute=0),  # Reconciliation only - see dispatch-deadlines
+    },
+    'sync-deadlines': {
+        'task': 'api.tasks.sync_deadlines',
+        'schedule': crontab(minute=30),  # Every hour, restores deadlines lost by Redis
     },
     'send-pending-notifications': {
         'task': 'api.tasks.send_pending_notifications',
@@ -30,6 +35,23 @@ app.conf.beat_schedule = {
     },
 }
 
+from django.conf import settings
+
+# Exact-time deadlines (auction ends, payment deadlines, discount windows)
+app.conf.beat_schedule['dispatch-deadlines'] = {
+    'task': 'api.tasks.dispatch_deadlines',
+    'schedule': timedelta(seconds=settings.DEADLINE_POLL_INTERVAL_SECONDS),
+    'options': {'expires': 10},  # Don't pile up polls while workers are down
+}
+
+# Write-behind flush for the Redis bid ledger (only when BID_ENGINE=redis)
+
+if settings.BID_ENGINE == 'redis':
+    app.conf.beat_schedule['flush-bid-ledger'] = {
+        'task': 'api.tasks.flush_bid_ledger',
+        'schedule': timedelta(seconds=settings.BID_LEDGER_FLUSH_INTERVAL_SECONDS),
+    }
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third-party apps
     'rest_framework',
@@ -152,7 +153,7 @@ AUTH_USER_MODEL = 'api.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -183,6 +184,7 @@ CORS_ALLOW_CREDENTIALS = True
 # Channels Configuration (for WebSockets)
 REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
 REDIS_PORT = int(os.getenv('REDIS_PORT', '6379'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
 CHANNEL_LAYERS = {
     'default': {
@@ -193,8 +195,17 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache (Django cache framework, used by the response cache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'madeinpk',
+    }
+}
+
 # Celery Configuration
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -221,6 +232,66 @@ STRIPE_PLATFORM_FEE_PERCENTAGE = 0.02  # 2% platform fee
 PAYMENT_DEADLINE_HOURS = 24  # Hours to pay after winning auction
 MAX_FAILED_PAYMENTS_BEFORE_BLOCK = 3  # Block user after 3 failed payments
 
+# Bid Engine Configuration
+# 'database': bids are validated and written straight to PostgreSQL
+# 'redis': bids are accepted against a Redis ledger and written to the bids table in batches
+BID_ENGINE = os.getenv('BID_ENGINE', 'database')
+BID_LEDGER_FLUSH_INTERVAL_SECONDS = 2.0  # How often accepted bids are persisted
+BID_LEDGER_FLUSH_BATCH_SIZE = 500  # Max bids written per auction per flush
+
+# Deadline Scheduler Configuration
+DEADLINE_POLL_INTERVAL_SECONDS = 1.0  # How often due deadlines are dispatched
+DEADLINE_RETRY_DELAY_SECONDS = 30  # Delay before retrying a failed deadline handler
+
+# Auction Closing Configuration
+AUCTION_CLOSE_BATCH_SIZE = 50  # Auctions closed per worker task
+AUCTION_CLOSE_STRIPE_WORKERS = 8  # Parallel Stripe Checkout Session requests per batch
+AUCTION_CLOSE_RETRY_SECONDS = 5  # Delay before retrying auctions a batch couldn't close
+AUCTION_CLOSE_MAX_RETRY_SECONDS = 3600  # Retries back off up to this while a winner has no shipping address
+AUCTION_ADDRESS_WAIT_HOURS = 24  # Hours a winner has to add a shipping address before the auction ends unsold
+AUCTION_SNAPSHOT_TTL_SECONDS = 600  # How long an auction's WebSocket connect payload stays cached
+AUCTION_BROADCAST_TICK_MS = 50  # new_bid broadcasts to a room are coalesced within this window
+WEBSOCKET_MAX_SUBSCRIPTIONS = 200  # Auctions one multiplexed feed connection can follow
+BID_EVENT_STREAM_MAXLEN = 500  # Events kept per auction for reconnect replay
+BID_EVENT_STREAM_TTL_SECONDS = 86400  # Event streams expire a day after the last event
+BID_EVENT_REPLAY_LIMIT = 100  # Larger gaps get a fresh snapshot instead of a replay
+
+# Outbid Notifications
+OUTBID_DIGEST_WINDOW_SECONDS = 120  # Outbids of a user on one auction within this window become one notification; 0 sends each at once
+OUTBID_DIGEST_MAX_ATTEMPTS = 5  # Failed digest emails are retried this many times, then only the in-app notification is kept
+
+# Proxy (maximum) bids outbid the runner-up by this much, in Rs (database bid engine only)
+PROXY_BID_INCREMENT = '1.00'
+
+# Token Authentication Cache
+AUTH_TOKEN_CACHE_TTL_SECONDS = 300  # Token -> user entries in Redis
+AUTH_TOKEN_LOCAL_CACHE_TTL_SECONDS = 5  # Per-process LRU; bounds staleness in other processes
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 10000
+
+# Search Typeahead
+SEARCH_SUGGEST_DEFAULT_LIMIT = 5  # Suggestions per group (products, categories, brands)
+SEARCH_SUGGEST_MAX_LIMIT = 20
+SEARCH_SUGGEST_CACHE_SECONDS = 60  # How long results for a query stay cached
+
+# Feed Pagination (products, auctions, listings)
+FEED_COUNT_CACHE_SECONDS = 60  # How long a filter set's total count is reused across pages
+
+# Listing Facets
+LISTING_PRICE_FACET_BOUNDARIES = [1000, 5000, 10000, 50000]  # Rs; buckets are 0-1000, ..., 50000+
+LISTING_FACETS_CACHE_SECONDS = 60  # Counts for unfiltered (status-only) views
+
+# Category Tree
+CATEGORY_TREE_CACHE_SECONDS = 3600  # Also dropped whenever a category changes
+
+# Reference Data Bundle (/api/reference/)
+REFERENCE_DATA_MAX_AGE_SECONDS = 3600  # Clients revalidate with If-None-Match after this
+REFERENCE_DATA_CHECK_SECONDS = 30  # How often a process looks for a newer version in Redis
+
+# Response Cache (anonymous product, auction and listing GETs)
+RESPONSE_CACHE_SECONDS = 30  # Upper bound on staleness for changes that bypass model signals
+RESPONSE_CACHE_LOCK_SECONDS = 10  # How long one request may hold a missing entry's recomputation
+RESPONSE_CACHE_WAIT_SECONDS = 2  # How long other requests wait for it before computing their own
+
 # Media Files (for product images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
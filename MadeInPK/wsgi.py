@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MadeInPK.settings')
 
 application = get_wsgi_application()
+
+from api import reference_data  # noqa: E402
+
+reference_data.warm()
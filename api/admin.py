@@ -1,16 +1,22 @@
+import redis
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.urls import path
 from django.shortcuts import redirect
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Sum
 from decimal import Decimal
 from .models import (
     User, Province, City, Address, Category, Product, ProductImage,
-    AuctionListing, Bid, FixedPriceListing, Order, Payment,
+    AuctionListing, Bid, ProxyBid, FixedPriceListing, Order, Payment,
     Feedback, Conversation, Message, Notification, Complaint, PaymentViolation, SellerProfile, Wishlist, ProductReview,
     Cart, CartItem, OrderItem, SellerTransfer
 )
+from . import bid_engine, ratings
+from .signals import (
+    invalidate_responses_on_commit, invalidate_snapshot_on_commit, invalidate_user_tokens_on_commit,
+)
 
 
 # Custom Admin Site
@@ -92,13 +98,19 @@ class UserAdmin(BaseUserAdmin):
     
     def block_users(self, request, queryset):
         """Block selected users"""
+        user_ids = list(queryset.values_list('id', flat=True))
         updated = queryset.update(is_blocked=True)
+        # update() skips post_save, so drop cached token lookups here
+        invalidate_user_tokens_on_commit(user_ids)
         self.message_user(request, f'{updated} user(s) blocked successfully.')
     block_users.short_description = 'Block selected users'
     
     def unblock_users(self, request, queryset):
         """Unblock selected users"""
+        user_ids = list(queryset.values_list('id', flat=True))
         updated = queryset.update(is_blocked=False)
+        # update() skips post_save, so drop cached token lookups here
+        invalidate_user_tokens_on_commit(user_ids)
         self.message_user(request, f'{updated} user(s) unblocked successfully.')
     unblock_users.short_description = 'Unblock selected users'
     
@@ -239,7 +251,8 @@ class AuctionListingAdmin(admin.ModelAdmin):
                     'time_remaining', 'winner', 'created_at']
     list_filter = ['status', 'start_time', 'end_time', 'created_at']
     search_fields = ['product__name', 'winner__username', 'product__seller__username']
-    readonly_fields = ['current_price', 'winner', 'created_at', 'updated_at', 'bid_count', 'time_remaining']
+    readonly_fields = ['current_price', 'winner', 'created_at', 'updated_at', 'bid_count',
+                       'leading_bidder', 'last_bid_at', 'time_remaining']
     autocomplete_fields = ['product']
     actions = ['end_auction', 'cancel_auction']
     date_hierarchy = 'start_time'
@@ -255,7 +268,7 @@ class AuctionListingAdmin(admin.ModelAdmin):
             'fields': ('status', 'winner')
         }),
         ('Statistics', {
-            'fields': ('bid_count',),
+            'fields': ('bid_count', 'leading_bidder', 'last_bid_at'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -264,11 +277,6 @@ class AuctionListingAdmin(admin.ModelAdmin):
         }),
     )
     
-    def bid_count(self, obj):
-        """Number of bids placed"""
-        return obj.bids.count()
-    bid_count.short_description = 'Bids'
-    
     def time_remaining(self, obj):
         """Time remaining in auction"""
         if obj.status != 'active':
@@ -286,15 +294,36 @@ class AuctionListingAdmin(admin.ModelAdmin):
             return f"{delta.days}d {hours}h {minutes}m"
     time_remaining.short_description = 'Time Remaining'
     
+    def auctions_changed(self, auction_ids):
+        """queryset.update() skips the post_save handlers; do their work here"""
+        invalidate_responses_on_commit('auction', *[f'auction:{auction_id}' for auction_id in auction_ids])
+        for auction_id in auction_ids:
+            invalidate_snapshot_on_commit(auction_id, reset_events=True)
+        if not bid_engine.is_enabled():
+            return
+
+        def apply():
+            for auction in AuctionListing.objects.filter(id__in=auction_ids):
+                try:
+                    bid_engine.sync_auction(auction)
+                except redis.RedisError as e:
+                    print(f"Failed to sync bid ledger for auction {auction.id}: {str(e)}")
+
+        transaction.on_commit(apply)
+    
     def end_auction(self, request, queryset):
         """End selected auctions"""
-        updated = queryset.filter(status='active').update(status='ended')
+        auction_ids = list(queryset.filter(status='active').values_list('id', flat=True))
+        updated = AuctionListing.objects.filter(id__in=auction_ids).update(status='ended', updated_at=timezone.now())
+        self.auctions_changed(auction_ids)
         self.message_user(request, f'{updated} auction(s) ended.')
     end_auction.short_description = 'End selected auctions'
     
     def cancel_auction(self, request, queryset):
         """Cancel selected auctions"""
-        updated = queryset.update(status='cancelled')
+        auction_ids = list(queryset.values_list('id', flat=True))
+        updated = queryset.update(status='cancelled', updated_at=timezone.now())
+        self.auctions_changed(auction_ids)
         self.message_user(request, f'{updated} auction(s) cancelled.')
     cancel_auction.short_description = 'Cancel selected auctions'
 
@@ -320,6 +349,15 @@ class BidAdmin(admin.ModelAdmin):
     bid_rank.short_description = 'Rank'
 
 
+@admin.register(ProxyBid, site=admin_site)
+class ProxyBidAdmin(admin.ModelAdmin):
+    list_display = ['id', 'auction', 'bidder', 'max_amount', 'is_active', 'updated_at']
+    list_filter = ['is_active', 'updated_at']
+    search_fields = ['auction__product__name', 'bidder__username']
+    readonly_fields = ['created_at', 'updated_at']
+    autocomplete_fields = ['auction', 'bidder']
+
+
 @admin.register(FixedPriceListing, site=admin_site)
 class FixedPriceListingAdmin(admin.ModelAdmin):
     list_display = ['id', 'product', 'price', 'discounted_price', 'quantity', 'status', 'featured', 'created_at']
@@ -830,10 +868,9 @@ class SellerProfileAdmin(admin.ModelAdmin):
     unverify_sellers.short_description = 'Unverify selected sellers'
     
     def update_ratings(self, request, queryset):
-        """Update average ratings"""
-        for profile in queryset:
-            profile.update_rating()
-        self.message_user(request, f'Ratings updated for {queryset.count()} seller(s).')
+        """Recompute rating totals and averages from feedback"""
+        corrected = ratings.rebuild_seller_ratings(queryset.values_list('user_id', flat=True))
+        self.message_user(request, f'Ratings recomputed for {queryset.count()} seller(s), {corrected} corrected.')
     update_ratings.short_description = 'Update average ratings'
 
 
@@ -959,6 +996,7 @@ class OrderItemAdmin(admin.ModelAdmin):
             is_shipped=True,
             shipped_at=timezone.now()
         )
+        Order.objects.filter(items__in=queryset).update(updated_at=timezone.now())
         
         # Check if all items in related orders are shipped
         for item in queryset:
@@ -0,0 +1,362 @@
+"""
+Auction snapshot cache for WebSocket connects
+
+The auction_status payload sent on connect is built from the database once,
+stored in Redis and then patched in place: every accepted bid updates the
+price, bid count and latest bids, and closing the auction sets the status
+and winner. Connects are served from Redis without touching PostgreSQL.
+
+Redis keys:
+    auction_snapshot:<id>          hash: static payload JSON + live fields
+    auction_snapshot:<id>:bids     list of the latest bids (JSON, newest first)
+    auction_snapshot:<id>:version  bumped on every change; a snapshot built from
+                                   the database is only stored if no change
+                                   happened while it was being built
+"""
+import json
+from datetime import datetime
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from . import bid_engine, bid_events
+from .redis_utils import get_redis_connection
+
+LATEST_BIDS_COUNT = 5
+
+STORE_SCRIPT = """
+local version = redis.call('GET', KEYS[3]) or '0'
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+local field_count = tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], unpack(ARGV, 4, 3 + field_count))
+if #ARGV > 3 + field_count then
+    redis.call('RPUSH', KEYS[2], unpack(ARGV, 4 + field_count))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+APPLY_BID_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if tonumber(ARGV[1]) <= tonumber(redis.call('HGET', KEYS[1], 'current_price')) then
+    -- Patches arrived out of order; let the next connect rebuild from the database
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'current_price', ARGV[1], 'sequence', ARGV[5])
+redis.call('HINCRBY', KEYS[1], 'total_bids', ARGV[6])
+redis.call('LPUSH', KEYS[2], ARGV[2])
+redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[3]) - 1)
+return 1
+"""
+
+APPLY_END_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], 'winner', ARGV[2], 'current_price', ARGV[3],
+           'sequence', ARGV[5])
+return 1
+"""
+
+INVALIDATE_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+"""
+
+
+def snapshot_keys(auction_id):
+    key = f'auction_snapshot:{auction_id}'
+    return [key, f'{key}:bids', f'{key}:version']
+
+
+def get_cached(auction_id):
+    """
+    Get the auction_status payload from Redis
+
+    Returns:
+        payload dict, or None if the snapshot isn't cached
+    """
+    snapshot_key, bids_key, _ = snapshot_keys(auction_id)
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.hgetall(snapshot_key)
+    pipe.lrange(bids_key, 0, LATEST_BIDS_COUNT - 1)
+    fields, latest_bids = pipe.execute()
+    if not fields:
+        return None
+
+    data = json.loads(fields[b'static'])
+    data.update({
+        'current_price': fields[b'current_price'].decode(),
+        'status': fields[b'status'].decode(),
+        'winner': json.loads(fields[b'winner']),
+        'latest_bids': [json.loads(bid) for bid in latest_bids],
+        'total_bids': int(fields[b'total_bids']),
+        'sequence': int(fields[b'sequence']),
+    })
+    # Time-dependent, so computed on read rather than stored
+    now = timezone.now()
+    data['is_active'] = (
+        data['status'] == 'active'
+        and datetime.fromisoformat(data['start_time']) <= now <= datetime.fromisoformat(data['end_time'])
+    )
+    return data
+
+
+def load(auction_id):
+    """
+    Build the payload from the database and cache it (database callers only)
+
+    Without Redis the payload is still built, just not cached.
+    """
+    try:
+        version = get_redis_connection().get(snapshot_keys(auction_id)[2]) or b'0'
+    except redis.RedisError as e:
+        print(f"Failed to read auction snapshot version {auction_id}: {str(e)}")
+        return build_auction_data(auction_id)
+
+    data = build_auction_data(auction_id)
+    if 'error' not in data:
+        try:
+            store(auction_id, data, version.decode())
+        except redis.RedisError as e:
+            print(f"Failed to cache auction snapshot {auction_id}: {str(e)}")
+    return data
+
+
+def store(auction_id, data, version):
+    """Cache a payload built from the database, unless it changed meanwhile"""
+    live_fields = {'current_price', 'status', 'winner', 'is_active', 'latest_bids', 'total_bids', 'sequence'}
+    static = {key: value for key, value in data.items() if key not in live_fields}
+    fields = {
+        'static': json.dumps(static),
+        'current_price': data['current_price'],
+        'status': data['status'],
+        'winner': json.dumps(data['winner']),
+        'total_bids': data['total_bids'],
+        'sequence': data['sequence'],
+    }
+    args = [version, settings.AUCTION_SNAPSHOT_TTL_SECONDS, len(fields) * 2]
+    for name, value in fields.items():
+        args.extend([name, value])
+    args.extend(json.dumps(bid) for bid in data['latest_bids'])
+
+    get_redis_connection().eval(STORE_SCRIPT, 3, *snapshot_keys(auction_id), *args)
+
+
+def apply_bid(auction_id, bid_data, bid_count=1):
+    """Patch the snapshot with an accepted bid (bid_count: bids it stands for)"""
+    bid = {
+        'bidder': bid_data['bidder'],
+        'amount': bid_data['amount'],
+        'time': bid_data['time'],
+    }
+    get_redis_connection().eval(
+        APPLY_BID_SCRIPT, 3, *snapshot_keys(auction_id),
+        bid_data['current_price'], json.dumps(bid), LATEST_BIDS_COUNT,
+        settings.AUCTION_SNAPSHOT_TTL_SECONDS, bid_data.get('sequence') or 0, bid_count
+    )
+
+
+def apply_endings(endings):
+    """
+    Patch the snapshots of auctions that just closed
+
+    Args:
+        endings: iterable of (auction_id, status, winner dict or None, final_price, sequence)
+    """
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for auction_id, status, winner, final_price, sequence in endings:
+        pipe.eval(
+            APPLY_END_SCRIPT, 3, *snapshot_keys(auction_id),
+            status, json.dumps(winner), final_price, settings.AUCTION_SNAPSHOT_TTL_SECONDS, sequence or 0
+        )
+    pipe.execute()
+
+
+def invalidate(auction_id):
+    """Drop the snapshot so the next connect rebuilds it from the database"""
+    get_redis_connection().eval(
+        INVALIDATE_SCRIPT, 3, *snapshot_keys(auction_id), settings.AUCTION_SNAPSHOT_TTL_SECONDS
+    )
+
+
+def get_summaries(auction_ids):
+    """
+    Compact live state for many auctions (multiplexed subscriptions)
+
+    Cached snapshots are read in one pipelined round trip; the rest come from
+    a single database query, so call this from a database thread.
+
+    Returns:
+        dict of auction id -> {'id', 'price', 'bids', 'status', 'end_time'}
+    """
+    from .models import AuctionListing
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for auction_id in auction_ids:
+        pipe.hmget(snapshot_keys(auction_id)[0], 'current_price', 'total_bids', 'status', 'static')
+    try:
+        cached = pipe.execute()
+    except redis.RedisError as e:
+        # Everything comes from the database instead
+        print(f"Failed to read auction snapshots: {str(e)}")
+        cached = []
+
+    summaries = {}
+    for auction_id, (price, total_bids, status, static) in zip(auction_ids, cached):
+        if price is None:
+            continue
+        summaries[auction_id] = {
+            'id': auction_id,
+            'price': price.decode(),
+            'bids': int(total_bids),
+            'status': status.decode(),
+            'end_time': json.loads(static)['end_time'],
+        }
+
+    missing = [auction_id for auction_id in auction_ids if auction_id not in summaries]
+    if missing:
+        auctions = AuctionListing.objects.filter(id__in=missing).values(
+            'id', 'current_price', 'bid_count', 'status', 'end_time'
+        )
+        for auction in auctions:
+            price, total_bids = auction['current_price'], auction['bid_count']
+            if bid_engine.is_enabled():
+                # The ledger is ahead of the database until the next flush
+                try:
+                    live_state = bid_engine.get_live_state(auction['id'])
+                except redis.RedisError as e:
+                    print(f"Failed to read bid ledger for auction {auction['id']}: {str(e)}")
+                    live_state = None
+                if live_state:
+                    price, total_bids = live_state['current_price'], live_state['bid_count']
+            summaries[auction['id']] = {
+                'id': auction['id'],
+                'price': str(price),
+                'bids': total_bids,
+                'status': auction['status'],
+                'end_time': auction['end_time'].isoformat(),
+            }
+    return summaries
+
+
+def build_auction_data(auction_id):
+    """Build the auction_status payload from the database"""
+    from .models import AuctionListing
+
+    # Read before the database so replayed events can only overlap, never miss
+    try:
+        sequence = bid_events.current_sequence(auction_id)
+    except redis.RedisError as e:
+        # Without a sequence number reconnecting clients fall back to a snapshot
+        print(f"Failed to read event sequence for auction {auction_id}: {str(e)}")
+        sequence = None
+
+    try:
+        auction = AuctionListing.objects.select_related(
+            'product',
+            'product__seller',
+            'product__seller__seller_profile',
+            'product__category',
+            'winner'
+        ).prefetch_related('product__images').get(id=auction_id)
+    except (AuctionListing.DoesNotExist, ValueError):
+        return {'error': 'Auction not found'}
+
+    latest_bids = auction.bids.select_related('bidder').order_by('-bid_time')[:LATEST_BIDS_COUNT]
+
+    # Get seller information
+    seller = auction.product.seller
+    seller_data = {
+        'id': seller.id,
+        'username': seller.username,
+        'email': seller.email,
+    }
+
+    # Add seller profile data if exists
+    if hasattr(seller, 'seller_profile'):
+        profile = seller.seller_profile
+        seller_data.update({
+            'brand_name': profile.brand_name,
+            'biography': profile.biography,
+            'is_verified': profile.is_verified,
+            'average_rating': str(profile.average_rating),
+            'total_feedbacks': profile.total_feedbacks,
+        })
+
+    # Get product images
+    images = sorted(auction.product.images.all(), key=lambda img: img.order)
+    image_urls = []
+    for img in images:
+        if img.image:
+            # Build full URL for image
+            image_url = img.image.url
+            if not image_url.startswith('http'):
+                # Prepend media URL if it's a relative path
+                image_url = f"{settings.MEDIA_URL}{img.image.name}" if not image_url.startswith('/') else image_url
+            image_urls.append({
+                'url': image_url,
+                'is_primary': img.is_primary,
+                'order': img.order
+            })
+
+    current_price = auction.current_price
+    total_bids = auction.bid_count
+    if bid_engine.is_enabled():
+        # The ledger is ahead of the database until the next flush
+        try:
+            live_state = bid_engine.get_live_state(auction.id)
+        except redis.RedisError as e:
+            print(f"Failed to read bid ledger for auction {auction.id}: {str(e)}")
+            live_state = None
+        if live_state:
+            current_price = live_state['current_price']
+            total_bids = live_state['bid_count']
+
+    return {
+        'auction_id': auction.id,
+        'product': {
+            'id': auction.product.id,
+            'name': auction.product.name,
+            'description': auction.product.description,
+            'condition': auction.product.condition,
+            'category': auction.product.category.name if auction.product.category else None,
+            'images': image_urls,
+        },
+        'seller': seller_data,
+        'starting_price': str(auction.starting_price),
+        'current_price': str(current_price),
+        'start_time': auction.start_time.isoformat(),
+        'end_time': auction.end_time.isoformat(),
+        'status': auction.status,
+        'is_active': auction.is_active(),
+        'winner': {
+            'id': auction.winner.id,
+            'username': auction.winner.username
+        } if auction.winner else None,
+        'latest_bids': [
+            {
+                'bidder': bid.bidder.username,
+                'amount': str(bid.amount),
+                'time': bid.bid_time.isoformat()
+            }
+            for bid in latest_bids
+        ],
+        'total_bids': total_bids,
+        'sequence': sequence,
+    }
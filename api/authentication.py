@@ -0,0 +1,24 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    DRF token authentication served from the token cache.
+    Same header format and errors as TokenAuthentication.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get_user(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # request.auth keeps being a Token, without another query
+        return (user, Token(key=key, user=user))
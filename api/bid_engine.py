@@ -0,0 +1,363 @@
+"""
+Redis-backed bid ledger for live auctions
+
+When settings.BID_ENGINE is 'redis', every active auction keeps its current
+price, leader and bid count in a Redis hash. Bids are accepted or rejected
+by a single Lua script (an atomic compare-and-set), so the hot path does no SQL.
+The same script appends accepted bids to the auction's event stream
+(see bid_events), so sequence numbers follow the order bids were accepted.
+Accepted bids are queued per auction and written to the bids table in batches
+by the flush_bid_ledger Celery task (write-behind).
+
+Redis keys:
+    bid_ledger:auction:<id>          hash with the live auction state
+    bid_ledger:auction:<id>:pending  list of accepted bids not yet persisted
+    bid_ledger:dirty                 set of auction ids with pending bids
+"""
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import bid_events, outbid_digest, response_cache
+from .redis_utils import get_redis_connection
+
+DIRTY_KEY = 'bid_ledger:dirty'
+
+# Ledger state is kept for a day after the auction ends so late flushes still find it
+STATE_TTL_AFTER_END = timedelta(days=1)
+
+PRIME_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('PEXPIREAT', KEYS[1], ARGV[1])
+return 1
+"""
+
+PLACE_BID_SCRIPT = bid_events.APPEND_EVENT_LUA + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {'missing'}
+end
+local state = redis.call('HMGET', KEYS[1], 'status', 'start_ms', 'end_ms', 'seller_id',
+                         'price_cents', 'leader_id')
+local now = tonumber(ARGV[4])
+if state[1] ~= 'active' or now < tonumber(state[2]) or now > tonumber(state[3]) then
+    return {'error', 'Auction is not active'}
+end
+if state[4] == ARGV[1] then
+    return {'error', 'You cannot bid on your own auction'}
+end
+if tonumber(ARGV[3]) <= tonumber(state[5]) then
+    return {'error', 'Bid must be higher than current price'}
+end
+local seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+redis.call('HSET', KEYS[1], 'price_cents', ARGV[3], 'leader_id', ARGV[1], 'leader_name', ARGV[2])
+redis.call('RPUSH', KEYS[2], cjson.encode({
+    seq = seq,
+    bidder_id = tonumber(ARGV[1]),
+    amount_cents = tonumber(ARGV[3]),
+    ts = now,
+}))
+redis.call('SADD', KEYS[3], ARGV[5])
+local event_seq = append_event(KEYS[4], KEYS[5], ARGV[6], ARGV[7], 'new_bid', ARGV[8])
+return {'ok', tostring(event_seq), state[6] or ''}
+"""
+
+SYNC_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[2], 'start_ms', ARGV[3], 'end_ms', ARGV[4])
+redis.call('PEXPIREAT', KEYS[1], ARGV[1])
+return 1
+"""
+
+TRIM_PENDING_SCRIPT = """
+redis.call('LTRIM', KEYS[1], tonumber(ARGV[1]), -1)
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+def is_enabled():
+    """Check if bids should go through the Redis ledger"""
+    return settings.BID_ENGINE == 'redis'
+
+
+def state_key(auction_id):
+    return f'bid_ledger:auction:{auction_id}'
+
+
+def pending_key(auction_id):
+    return f'bid_ledger:auction:{auction_id}:pending'
+
+
+def to_cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return (Decimal(int(cents)) / 100).quantize(Decimal('0.01'))
+
+
+def to_millis(value):
+    return int(value.timestamp() * 1000)
+
+
+def from_millis(ms):
+    return datetime.fromtimestamp(int(ms) / 1000, tz=dt_timezone.utc)
+
+
+def prime_auction(auction_id):
+    """
+    Load an auction's state from the database into Redis (no-op if already loaded)
+
+    Returns:
+        False if the auction does not exist, True otherwise
+    """
+    from .models import AuctionListing
+
+    try:
+        auction = AuctionListing.objects.select_related('product', 'leading_bidder').get(id=auction_id)
+    except AuctionListing.DoesNotExist:
+        return False
+
+    leader = auction.leading_bidder
+
+    expire_at = to_millis(auction.end_time + STATE_TTL_AFTER_END)
+    fields = {
+        'status': auction.status,
+        'start_ms': to_millis(auction.start_time),
+        'end_ms': to_millis(auction.end_time),
+        'seller_id': auction.product.seller_id,
+        'product_name': auction.product.name,
+        'price_cents': to_cents(auction.current_price),
+        'leader_id': leader.id if leader else '',
+        'leader_name': leader.username if leader else '',
+        'seq': auction.bid_count,
+    }
+    args = [expire_at]
+    for name, value in fields.items():
+        args.extend([name, value])
+
+    client = get_redis_connection()
+    client.eval(PRIME_SCRIPT, 1, state_key(auction.id), *args)
+    return True
+
+
+def sync_auction(auction):
+    """
+    Copy an auction's status and timing into its ledger state, if loaded
+
+    The ledger is primed once, so edits made in the database afterwards
+    (ending, cancelling, moving end_time) must be pushed to it or it keeps
+    accepting bids on the old terms. Live price and leader are left alone.
+    """
+    client = get_redis_connection()
+    client.eval(
+        SYNC_SCRIPT, 1, state_key(auction.id),
+        to_millis(auction.end_time + STATE_TTL_AFTER_END), auction.status,
+        to_millis(auction.start_time), to_millis(auction.end_time),
+    )
+
+
+def place_bid(auction_id, user, bid_amount, notify=True):
+    """
+    Accept or reject a bid against the Redis ledger
+
+    Callers go through bidding.place_bid, which handles account checks.
+
+    Args:
+        auction_id: AuctionListing id
+        user: authenticated User placing the bid
+        bid_amount: bid amount (str, int, float or Decimal)
+        notify: whether to notify the bidder who was outbid
+
+    Returns:
+        {'success': True, 'bid_data': {...}} or {'success': False, 'error': '...'}
+    """
+    try:
+        amount = Decimal(str(bid_amount)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return {'success': False, 'error': 'Invalid bid amount'}
+
+    client = get_redis_connection()
+    now = timezone.now()
+    bid_data = {
+        'bidder': user.username,
+        'amount': str(amount),
+        'time': now.isoformat(),
+        'current_price': str(amount),
+    }
+    keys = [
+        state_key(auction_id), pending_key(auction_id), DIRTY_KEY,
+        bid_events.stream_key(auction_id), bid_events.counter_key(auction_id),
+    ]
+    args = [
+        user.id, user.username, to_cents(amount), to_millis(now), auction_id,
+        *bid_events.stream_args(), json.dumps(bid_data),
+    ]
+
+    result = client.eval(PLACE_BID_SCRIPT, len(keys), *keys, *args)
+    if result[0] == b'missing':
+        # First bid since the ledger was (re)started - load state and retry once
+        if not prime_auction(auction_id):
+            return {'success': False, 'error': 'Auction not found'}
+        result = client.eval(PLACE_BID_SCRIPT, len(keys), *keys, *args)
+
+    status = result[0].decode()
+    if status != 'ok':
+        return {'success': False, 'error': result[1].decode()}
+
+    bid_data['sequence'] = int(result[1])
+    previous_leader_id = result[2].decode()
+
+    # Notify the previous highest bidder outside of the hot path
+    if notify and previous_leader_id and int(previous_leader_id) != user.id:
+        product_name = client.hget(state_key(auction_id), 'product_name')
+        outbid_digest.notify(
+            user_id=int(previous_leader_id),
+            auction_id=int(auction_id),
+            new_bid_amount=str(amount),
+            product_name=product_name.decode() if product_name else '',
+        )
+
+    return {
+        'success': True,
+        'bid_data': bid_data
+    }
+
+
+def get_live_state(auction_id):
+    """
+    Get the live price and leader for an auction from the ledger
+
+    Returns:
+        dict with current_price, leader and bid_count, or None if not loaded
+    """
+    client = get_redis_connection()
+    price_cents, leader_name, seq = client.hmget(
+        state_key(auction_id), 'price_cents', 'leader_name', 'seq'
+    )
+    if price_cents is None:
+        return None
+    return {
+        'current_price': from_cents(price_cents),
+        'leader': leader_name.decode() or None,
+        'bid_count': int(seq or 0),
+    }
+
+
+def flush_auction(auction_id, batch_size=None):
+    """
+    Persist pending ledger bids for one auction to the bids table
+
+    Bids are read, written in a single transaction and only then trimmed from
+    the pending list, so a crash mid-flush never loses an accepted bid.
+    Bids for an auction that is no longer active in the database, or placed
+    after its end time, are dropped instead of written.
+
+    Returns:
+        Number of pending entries consumed (written or dropped)
+    """
+    from .models import AuctionListing, Bid
+
+    batch_size = batch_size or settings.BID_LEDGER_FLUSH_BATCH_SIZE
+    client = get_redis_connection()
+    raw_entries = client.lrange(pending_key(auction_id), 0, batch_size - 1)
+    if not raw_entries:
+        client.srem(DIRTY_KEY, auction_id)
+        return 0
+
+    entries = [json.loads(raw) for raw in raw_entries]
+    bids = [
+        Bid(
+            auction_id=auction_id,
+            bidder_id=entry['bidder_id'],
+            amount=from_cents(entry['amount_cents']),
+            bid_time=from_millis(entry['ts']),
+            is_winning=False,
+        )
+        for entry in entries
+    ]
+
+    with transaction.atomic():
+        auction = AuctionListing.objects.select_for_update().filter(
+            id=auction_id
+        ).values('status', 'end_time').first()
+        if auction is None or auction['status'] != 'active':
+            # Ended or cancelled in the database before the ledger heard of it;
+            # these bids never counted
+            print(f"Dropping {len(bids)} ledger bid(s) for inactive auction {auction_id}")
+            bids = []
+        else:
+            bids = [bid for bid in bids if bid.bid_time <= auction['end_time']]
+
+        if bids:
+            # The ledger only accepts increasing bids, so the last one leads
+            bids[-1].is_winning = True
+            last_amount = bids[-1].amount
+
+            Bid.objects.filter(auction_id=auction_id, is_winning=True).update(is_winning=False)
+            Bid.objects.bulk_create(bids)
+            AuctionListing.objects.filter(id=auction_id).update(
+                bid_count=F('bid_count') + len(bids),
+                last_bid_at=bids[-1].bid_time,
+            )
+            AuctionListing.objects.filter(
+                id=auction_id, current_price__lt=last_amount
+            ).update(
+                current_price=last_amount,
+                leading_bidder_id=bids[-1].bidder_id,
+                updated_at=timezone.now(),
+            )
+
+    client.eval(
+        TRIM_PENDING_SCRIPT, 2, pending_key(auction_id), DIRTY_KEY,
+        len(raw_entries), auction_id
+    )
+    # The price update bypasses model signals
+    response_cache.invalidate(f'auction:{auction_id}')
+    return len(raw_entries)
+
+
+def flush_all(auction_ids=None):
+    """
+    Persist pending ledger bids for the given auctions (or every dirty auction)
+
+    Returns:
+        Total number of pending bids processed
+    """
+    client = get_redis_connection()
+    if auction_ids is None:
+        auction_ids = [int(member) for member in client.smembers(DIRTY_KEY)]
+
+    written = 0
+    for auction_id in auction_ids:
+        # Drain the whole backlog, one batch per transaction
+        while True:
+            count = flush_auction(auction_id)
+            written += count
+            if count < settings.BID_LEDGER_FLUSH_BATCH_SIZE:
+                break
+    return written
+
+
+def close_auction(auction_id):
+    """
+    Stop accepting bids for an auction and drop its ledger state
+
+    Pending bids are flushed first so the winner can be read from the database.
+    """
+    client = get_redis_connection()
+    client.hset(state_key(auction_id), 'status', 'ended')
+    flush_all([auction_id])
+    client.delete(state_key(auction_id))
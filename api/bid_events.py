@@ -0,0 +1,136 @@
+"""
+Sequence-numbered auction event stream
+
+Every event broadcast to an auction room (accepted bids, auction end) gets a
+per-auction sequence number and is appended to a capped Redis Stream, using
+the sequence number as the stream entry id ('<seq>-0'). A client that
+reconnects with the last sequence it saw gets only the events it missed;
+the full auction_status snapshot is only needed when those events have been
+trimmed from the stream (or were too many to be worth replaying).
+
+Redis keys:
+    auction_events:<id>       stream of {'type', 'data'} entries, id '<seq>-0'
+    auction_events:<id>:seq   last sequence number handed out
+"""
+import json
+
+from django.conf import settings
+
+from .redis_utils import get_redis_connection
+
+# Shared with the bid ledger script so ledger bids are sequenced atomically.
+# If the counter was lost but the stream wasn't, numbering continues from the
+# stream so entry ids keep increasing.
+APPEND_EVENT_LUA = """
+local function append_event(stream_key, counter_key, maxlen, ttl, event_type, event_data)
+    local seq = redis.call('INCR', counter_key)
+    if seq == 1 then
+        local last = redis.call('XREVRANGE', stream_key, '+', '-', 'COUNT', 1)
+        if #last > 0 then
+            seq = tonumber(string.match(last[1][1], '^(%d+)')) + 1
+            redis.call('SET', counter_key, seq)
+        end
+    end
+    redis.call('XADD', stream_key, 'MAXLEN', '~', maxlen, seq .. '-0', 'type', event_type, 'data', event_data)
+    redis.call('EXPIRE', stream_key, ttl)
+    redis.call('EXPIRE', counter_key, ttl)
+    return seq
+end
+"""
+
+APPEND_SCRIPT = APPEND_EVENT_LUA + """
+return append_event(KEYS[1], KEYS[2], ARGV[1], ARGV[2], ARGV[3], ARGV[4])
+"""
+
+# Event types that can't be replayed; the client needs a fresh snapshot
+RESET = 'reset'
+
+
+def stream_key(auction_id):
+    return f'auction_events:{auction_id}'
+
+
+def counter_key(auction_id):
+    return f'auction_events:{auction_id}:seq'
+
+
+def stream_args():
+    """MAXLEN and TTL arguments for APPEND_EVENT_LUA"""
+    return [settings.BID_EVENT_STREAM_MAXLEN, settings.BID_EVENT_STREAM_TTL_SECONDS]
+
+
+def append(auction_id, event_type, data):
+    """
+    Append an event to the auction's stream
+
+    Returns:
+        The event's sequence number
+    """
+    return get_redis_connection().eval(
+        APPEND_SCRIPT, 2, stream_key(auction_id), counter_key(auction_id),
+        *stream_args(), event_type, json.dumps(data)
+    )
+
+
+def append_many(events):
+    """
+    Append events for several auctions in one round trip
+
+    Args:
+        events: list of (auction_id, event_type, data)
+
+    Returns:
+        List of sequence numbers, in the same order
+    """
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for auction_id, event_type, data in events:
+        pipe.eval(
+            APPEND_SCRIPT, 2, stream_key(auction_id), counter_key(auction_id),
+            *stream_args(), event_type, json.dumps(data)
+        )
+    return pipe.execute()
+
+
+def current_sequence(auction_id):
+    """Sequence number of the auction's latest event (0 if none yet)"""
+    return int(get_redis_connection().get(counter_key(auction_id)) or 0)
+
+
+def since(auction_id, last_sequence):
+    """
+    Events after last_sequence, in order
+
+    Returns:
+        List of {'type', 'data'} events (data includes 'sequence'), or None if
+        the gap can't be replayed and the client needs a full snapshot
+    """
+    key = stream_key(auction_id)
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.xrange(key, '-', '+', count=1)
+    pipe.xrange(key, f'{last_sequence + 1}-0', '+', count=settings.BID_EVENT_REPLAY_LIMIT + 1)
+    pipe.get(counter_key(auction_id))
+    oldest, entries, current = pipe.execute()
+
+    current = int(current or 0)
+    if last_sequence > current:
+        # Counter was reset (or the client is confused)
+        return None
+    if last_sequence < current and (not oldest or entry_sequence(oldest[0][0]) > last_sequence + 1):
+        # The missed events were trimmed away
+        return None
+    if len(entries) > settings.BID_EVENT_REPLAY_LIMIT:
+        return None
+
+    events = []
+    for entry_id, fields in entries:
+        event_type = fields[b'type'].decode()
+        if event_type == RESET:
+            return None
+        data = json.loads(fields[b'data'])
+        data['sequence'] = entry_sequence(entry_id)
+        events.append({'type': event_type, 'data': data})
+    return events
+
+
+def entry_sequence(entry_id):
+    return int(entry_id.split(b'-')[0])
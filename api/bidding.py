@@ -0,0 +1,342 @@
+"""
+Bid placement service shared by the REST API and the auction WebSocket
+
+Database bids are serialized per auction by a single conditional UPDATE on
+the auction row: it re-checks status, timing and price, and takes the row
+lock for the rest of the short transaction. A partial unique index on bids
+guarantees at most one winning bid per auction. Accepted bids are appended
+to the auction's event stream (see bid_events) while the lock is held.
+Registered maximum bids (ProxyBid) are resolved under the same lock.
+"""
+from decimal import Decimal, InvalidOperation
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+
+from . import auction_snapshot, bid_engine, bid_events, outbid_digest, response_cache
+from .broadcast import broadcaster
+
+
+def _error(message, status_code=status.HTTP_400_BAD_REQUEST):
+    return {'success': False, 'error': message, 'status_code': status_code}
+
+
+def place_bid(auction_id, user, bid_amount, notify=True):
+    """
+    Validate and place a bid
+
+    Args:
+        auction_id: AuctionListing id
+        user: authenticated User placing the bid
+        bid_amount: bid amount (str, int, float or Decimal)
+        notify: whether to notify the bidder who was outbid
+
+    Returns:
+        dict with success, bid_data (and bid for database bids) on success,
+        or success, error and status_code on failure. bid and bid_data are
+        the bid that leads afterwards; when a maximum bid answered at once,
+        outbid is True and placed_bid / placed_bid_data are the user's own
+    """
+    if user.is_blocked:
+        return _error('Your account is blocked', status.HTTP_403_FORBIDDEN)
+
+    if bid_engine.is_enabled():
+        result = bid_engine.place_bid(auction_id, user, bid_amount, notify=notify)
+        if result['success']:
+            _patch_snapshot(auction_id, result['bid_data'])
+        else:
+            result['status_code'] = status.HTTP_400_BAD_REQUEST
+        return result
+
+    try:
+        amount = Decimal(str(bid_amount)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return _error('Invalid bid amount')
+
+    return _place_database_bid(auction_id, user, amount, notify)
+
+
+def _place_database_bid(auction_id, user, amount, notify):
+    from .models import AuctionListing, Bid
+
+    try:
+        auction = AuctionListing.objects.select_related('product').get(id=auction_id)
+    except (AuctionListing.DoesNotExist, ValueError):
+        return _error('Auction not found', status.HTTP_404_NOT_FOUND)
+
+    if not auction.is_active():
+        return _error('Auction is not active')
+
+    if auction.product.seller_id == user.id:
+        return _error('You cannot bid on your own auction')
+
+    if amount <= auction.current_price:
+        return _error(f'Bid must be higher than current price of {auction.current_price}')
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Re-check everything in the WHERE clause; the row lock serializes competing bids
+        updated = AuctionListing.objects.filter(
+            id=auction.id,
+            status='active',
+            start_time__lte=now,
+            end_time__gte=now,
+            current_price__lt=amount,
+        ).update(
+            current_price=amount,
+            bid_count=F('bid_count') + 1,
+            leading_bidder=user,
+            last_bid_at=now,
+            updated_at=now,
+        )
+
+        if not updated:
+            # Lost the race to a higher bid (or the auction just closed)
+            auction.refresh_from_db(fields=['status', 'current_price', 'end_time'])
+            if not auction.is_active():
+                return _error('Auction is not active')
+            return _error(f'Bid must be higher than current price of {auction.current_price}')
+
+        previous_leader_id = Bid.objects.filter(
+            auction_id=auction.id, is_winning=True
+        ).values_list('bidder_id', flat=True).first()
+        Bid.objects.filter(auction_id=auction.id, is_winning=True).update(is_winning=False)
+
+        bid = Bid.objects.create(
+            auction=auction,
+            bidder=user,
+            amount=amount,
+            bid_time=now,
+            is_winning=True
+        )
+
+        # A registered maximum bid may answer right away; only the outcome is announced
+        proxy_bid = _resolve_proxy_bids(auction.id, user.id, amount, now)
+        if proxy_bid is None:
+            return _announce_bid(auction, bid, [previous_leader_id], 1, notify)
+        if proxy_bid.bidder_id == user.id:
+            # Their own maximum outbid a competing one; they still lead
+            return _announce_bid(auction, proxy_bid, [previous_leader_id], 2, notify)
+
+        # The bid stands in the history, but its bidder lost the lead at once
+        bid.is_winning = False
+        result = _announce_bid(auction, proxy_bid, [previous_leader_id, user.id], 2, notify)
+        result['outbid'] = True
+        result['placed_bid'] = bid
+        result['placed_bid_data'] = {
+            'bidder': user.username,
+            'amount': str(amount),
+            'time': now.isoformat(),
+            'current_price': str(proxy_bid.amount),
+        }
+        return result
+
+
+def place_proxy_bid(auction_id, user, max_amount, notify=True):
+    """
+    Register (or change) a maximum bid; the engine bids on the user's behalf
+
+    Competing maximums are resolved in one step, second-price style: the
+    highest maximum leads at one increment above the runner-up (capped at its
+    own maximum, earlier maximums winning ties). Only the resulting bid is
+    recorded, announced and notified.
+
+    Returns:
+        dict like place_bid, plus proxy_bid; bid and bid_data are None when
+        the user already leads and only their maximum changed
+    """
+    if user.is_blocked:
+        return _error('Your account is blocked', status.HTTP_403_FORBIDDEN)
+
+    if bid_engine.is_enabled():
+        # The ledger's Lua script accepts single bids only
+        return _error('Maximum bids are not available right now')
+
+    try:
+        max_amount = Decimal(str(max_amount)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return _error('Invalid maximum bid amount')
+
+    return _place_database_proxy_bid(auction_id, user, max_amount, notify)
+
+
+def _place_database_proxy_bid(auction_id, user, max_amount, notify):
+    from .models import AuctionListing, Bid, ProxyBid
+
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            auction = AuctionListing.objects.select_for_update(of=('self',)).select_related(
+                'product'
+            ).get(id=auction_id)
+        except (AuctionListing.DoesNotExist, ValueError):
+            return _error('Auction not found', status.HTTP_404_NOT_FOUND)
+
+        if not auction.is_active():
+            return _error('Auction is not active')
+
+        if auction.product.seller_id == user.id:
+            return _error('You cannot bid on your own auction')
+
+        if max_amount <= auction.current_price:
+            return _error(f'Maximum bid must be higher than current price of {auction.current_price}')
+
+        proxy_bid, _ = ProxyBid.objects.update_or_create(
+            auction=auction,
+            bidder=user,
+            defaults={'max_amount': max_amount, 'is_active': True}
+        )
+
+        previous_leader_id = auction.leading_bidder_id or Bid.objects.filter(
+            auction_id=auction.id, is_winning=True
+        ).values_list('bidder_id', flat=True).first()
+        bid = _resolve_proxy_bids(auction.id, previous_leader_id, auction.current_price, now)
+        if bid is None:
+            # Already leading; the new maximum is used when someone bids against it
+            return {
+                'success': True,
+                'proxy_bid': proxy_bid,
+                'bid': None,
+                'bid_data': None,
+                'bid_count': 0
+            }
+
+        result = _announce_bid(auction, bid, [previous_leader_id], 1, notify)
+        result['proxy_bid'] = proxy_bid
+        return result
+
+
+def cancel_proxy_bid(auction_id, user):
+    """Stop bidding on the user's behalf (bids already placed stand)"""
+    from .models import ProxyBid
+
+    return ProxyBid.objects.filter(
+        auction_id=auction_id, bidder=user, is_active=True
+    ).update(is_active=False)
+
+
+def _resolve_proxy_bids(auction_id, leader_id, price, now):
+    """
+    Let registered maximum bids answer the current price (auction row must be locked)
+
+    Returns:
+        The resulting Bid, or None if the leader and price stand
+    """
+    from .models import ProxyBid
+
+    increment = Decimal(str(settings.PROXY_BID_INCREMENT))
+    contenders = list(ProxyBid.objects.filter(
+        auction_id=auction_id, is_active=True, max_amount__gt=price
+    ).select_related('bidder').order_by('-max_amount', 'updated_at')[:2])
+
+    bid = None
+    if contenders:
+        top = contenders[0]
+        runner_up = contenders[1].max_amount if len(contenders) > 1 else None
+        if top.bidder_id != leader_id:
+            new_price = min(top.max_amount, max(price, runner_up or price) + increment)
+        elif runner_up is not None:
+            new_price = min(top.max_amount, runner_up + increment)
+        else:
+            new_price = None
+
+        if new_price is not None:
+            bid = _take_lead(auction_id, top.bidder, new_price, now)
+            leader_id, price = top.bidder_id, new_price
+
+    # Maximums at or below the price can't win any more
+    ProxyBid.objects.filter(
+        auction_id=auction_id, is_active=True, max_amount__lte=price
+    ).exclude(bidder_id=leader_id).update(is_active=False)
+    return bid
+
+
+def _take_lead(auction_id, bidder, amount, now):
+    """Record a bid that takes the lead (auction row must be locked)"""
+    from .models import AuctionListing, Bid
+
+    Bid.objects.filter(auction_id=auction_id, is_winning=True).update(is_winning=False)
+    bid = Bid.objects.create(
+        auction_id=auction_id,
+        bidder=bidder,
+        amount=amount,
+        bid_time=now,
+        is_winning=True
+    )
+    AuctionListing.objects.filter(id=auction_id).update(
+        current_price=amount,
+        bid_count=F('bid_count') + 1,
+        leading_bidder=bidder,
+        last_bid_at=now,
+        updated_at=now,
+    )
+    return bid
+
+
+def _announce_bid(auction, bid, outbid_user_ids, bid_count, notify):
+    """
+    Sequence the resulting bid and queue its side effects (inside the bid's transaction)
+
+    Args:
+        outbid_user_ids: users who lost the lead in this step (the previous
+            leader, and a manual bidder a maximum bid answered)
+        bid_count: bids recorded in this step (a proxy answer adds one)
+    """
+    bid_data = {
+        'bidder': bid.bidder.username,
+        'amount': str(bid.amount),
+        'time': bid.bid_time.isoformat(),
+        'current_price': str(bid.amount),
+    }
+    # Sequenced while the row lock is held, so numbering follows bid order
+    bid_data['sequence'] = _append_event(auction.id, bid_data)
+    transaction.on_commit(lambda: _patch_snapshot(auction.id, bid_data, bid_count))
+    # The price update bypasses model signals
+    transaction.on_commit(lambda: response_cache.invalidate(f'auction:{auction.id}'))
+
+    outbid_user_ids = {user_id for user_id in outbid_user_ids if user_id and user_id != bid.bidder_id}
+    for user_id in outbid_user_ids if notify else ():
+        transaction.on_commit(lambda user_id=user_id: outbid_digest.notify(
+            user_id=user_id,
+            auction_id=auction.id,
+            new_bid_amount=str(bid.amount),
+            product_name=auction.product.name
+        ))
+
+    return {
+        'success': True,
+        'bid': bid,
+        'bid_data': bid_data,
+        'bid_count': bid_count
+    }
+
+
+def _append_event(auction_id, bid_data):
+    try:
+        return bid_events.append(auction_id, 'new_bid', bid_data)
+    except redis.RedisError as e:
+        # Without a sequence number reconnecting clients fall back to a snapshot
+        print(f"Failed to append bid event for auction {auction_id}: {str(e)}")
+        return None
+
+
+def _patch_snapshot(auction_id, bid_data, bid_count=1):
+    try:
+        auction_snapshot.apply_bid(auction_id, bid_data, bid_count)
+    except redis.RedisError as e:
+        # The bid stands; the stale snapshot expires on its own
+        print(f"Failed to update auction snapshot {auction_id}: {str(e)}")
+
+
+def broadcast_new_bid(auction_id, bid_data, bid_count=1):
+    """Send an accepted bid to everyone watching the auction (sync callers)"""
+    channel_layer = get_channel_layer()
+    if channel_layer:
+        # Same per-room coalescing as bids placed over the WebSocket
+        async_to_sync(broadcaster.publish)(channel_layer, auction_id, bid_data, bid_count)
@@ -0,0 +1,71 @@
+"""
+Coalesced new_bid broadcasts for auction rooms
+
+During a bidding war every accepted bid used to trigger its own group_send to
+every socket in the room. The broadcaster instead sends the first bid of a
+quiet period immediately, then collects bids for one tick
+(settings.AUCTION_BROADCAST_TICK_MS) and sends only the latest state with
+the number of bids it covers. Each process runs its own broadcaster, so a
+room gets at most one new_bid frame per tick from each ASGI process.
+"""
+import asyncio
+from decimal import Decimal
+
+from django.conf import settings
+
+
+def newer_bid(current, candidate):
+    """Pick the bid_data with the higher price (bids can finish out of order)"""
+    if current is None:
+        return candidate
+    if Decimal(candidate['current_price']) > Decimal(current['current_price']):
+        return candidate
+    return current
+
+
+class BidBroadcaster:
+    """Per-process, per-room new_bid coalescer (event loop only)"""
+
+    def __init__(self):
+        # auction id -> [latest bid_data, bids collected, event loop] for rooms inside a tick
+        self.windows = {}
+
+    @property
+    def tick(self):
+        return settings.AUCTION_BROADCAST_TICK_MS / 1000
+
+    async def publish(self, channel_layer, auction_id, bid_data, bid_count=1):
+        auction_id = int(auction_id)
+        loop = asyncio.get_running_loop()
+        window = self.windows.get(auction_id)
+        if window is not None and window[2].is_closed():
+            # Opened from a throwaway loop (async_to_sync outside the server); its tick never ends
+            window = None
+        if window is not None:
+            # Inside a tick: keep only the latest state, sent when the tick ends
+            window[0] = newer_bid(window[0], bid_data)
+            window[1] += bid_count
+            return
+
+        self.windows[auction_id] = [None, 0, loop]
+        await self.send(channel_layer, auction_id, bid_data, bid_count)
+        loop.call_later(self.tick, self.end_tick, channel_layer, auction_id)
+
+    def end_tick(self, channel_layer, auction_id):
+        bid_data, bid_count, loop = self.windows.pop(auction_id)
+        if bid_count:
+            # Still busy: send what was collected and start the next tick
+            self.windows[auction_id] = [None, 0, loop]
+            asyncio.ensure_future(self.send(channel_layer, auction_id, bid_data, bid_count))
+            loop.call_later(self.tick, self.end_tick, channel_layer, auction_id)
+
+    async def send(self, channel_layer, auction_id, bid_data, bid_count):
+        await channel_layer.group_send(f'auction_{auction_id}', {
+            'type': 'new_bid',
+            'auction_id': auction_id,
+            'bid_data': bid_data,
+            'bid_count': bid_count,
+        })
+
+
+broadcaster = BidBroadcaster()
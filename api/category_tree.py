@@ -0,0 +1,105 @@
+"""
+Cached category tree
+
+CategorySerializer used to walk the tree with an exists() and a query per
+node. The whole tree is now built from one query (categories ordered by
+materialized path, so parents come before their children), kept in Redis
+and dropped whenever a category changes (see signals).
+
+Redis keys:
+    category_tree   JSON list of root nodes, each
+                    {id, name, description, parent, subcategories: [...]}
+"""
+import json
+
+import redis
+from django.conf import settings
+
+from .models import Category
+from .redis_utils import get_redis_connection
+
+CACHE_KEY = 'category_tree'
+
+
+def build_tree():
+    nodes = {}
+    roots = []
+    for category in Category.objects.order_by('path').values('id', 'name', 'description', 'parent_id'):
+        node = {
+            'id': category['id'],
+            'name': category['name'],
+            'description': category['description'],
+            'parent': category['parent_id'],
+            'subcategories': [],
+        }
+        nodes[node['id']] = node
+        parent = nodes.get(node['parent'])
+        (parent['subcategories'] if parent else roots).append(node)
+    return roots
+
+
+def get_tree():
+    """
+    Returns:
+        List of root category nodes with their subcategories nested
+    """
+    try:
+        cached = get_redis_connection().get(CACHE_KEY)
+    except redis.RedisError as e:
+        print(f"Failed to read category tree: {str(e)}")
+        cached = None
+    if cached:
+        return json.loads(cached)
+
+    tree = build_tree()
+    try:
+        get_redis_connection().set(CACHE_KEY, json.dumps(tree), ex=settings.CATEGORY_TREE_CACHE_SECONDS)
+    except redis.RedisError as e:
+        print(f"Failed to cache category tree: {str(e)}")
+    return tree
+
+
+def get_subcategories():
+    """
+    Returns:
+        dict of category id -> its subcategory nodes, from the cached tree
+    """
+    subcategories = {}
+    pending = list(get_tree())
+    while pending:
+        node = pending.pop()
+        subcategories[node['id']] = node['subcategories']
+        pending.extend(node['subcategories'])
+    return subcategories
+
+
+def get_path(category_id):
+    """
+    Materialized path of a category ('3/17/42/'), from the cached tree
+
+    Filtering on the literal (path__startswith='3/17/') lets the database use
+    category_path_idx; a subquery for the prefix can't.
+
+    Returns:
+        The path, or None if there is no such category
+    """
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+
+    pending = [(node, '') for node in get_tree()]
+    while pending:
+        node, parent_path = pending.pop()
+        path = f'{parent_path}{node["id"]}/'
+        if node['id'] == category_id:
+            return path
+        pending.extend((child, path) for child in node['subcategories'])
+    return None
+
+
+def invalidate():
+    try:
+        get_redis_connection().delete(CACHE_KEY)
+    except redis.RedisError as e:
+        print(f"Failed to invalidate category tree: {str(e)}")
@@ -1,12 +1,78 @@
+import asyncio
 import json
+from decimal import Decimal
+from urllib.parse import parse_qs
+import redis
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from . import auction_snapshot, bid_engine, bid_events, bidding
+from .broadcast import broadcaster, newer_bid
+
 User = get_user_model()
 
 
-class AuctionConsumer(AsyncWebsocketConsumer):
+class BufferedWebsocketConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer with a coalescing outbound queue
+    
+    Broadcast frames are queued and written by a single writer task, at most
+    one batch per tick. A frame queued with a coalesce key is folded into the
+    queued frame with the same key, so each tick carries only the latest
+    state.
+    
+    This limits how often a connection is written to, not the client's read
+    speed: the ASGI server buffers sent frames itself and send() doesn't wait
+    for the socket, so a client reading slowly isn't detected here.
+    """
+    
+    def start_writer(self):
+        self.outbox = []
+        self.coalescible = {}  # coalesce key -> queued frame
+        self.outbox_ready = asyncio.Event()
+        self.writer = asyncio.ensure_future(self.write_outbox())
+    
+    def stop_writer(self):
+        writer = getattr(self, 'writer', None)
+        if writer:
+            writer.cancel()
+    
+    async def queue_frame(self, frame, coalesce_key=None, merge=None):
+        """Queue a frame; merge(queued, frame) folds it into a queued frame with the same key"""
+        if coalesce_key is not None:
+            if coalesce_key in self.coalescible:
+                merge(self.coalescible[coalesce_key], frame)
+                return
+            self.coalescible[coalesce_key] = frame
+        
+        self.outbox.append(frame)
+        self.outbox_ready.set()
+    
+    async def write_outbox(self):
+        tick = settings.AUCTION_BROADCAST_TICK_MS / 1000
+        while True:
+            await self.outbox_ready.wait()
+            self.outbox_ready.clear()
+            
+            frames, self.outbox = self.outbox, []
+            self.coalescible = {}
+            for frame in frames:
+                await self.send(text_data=json.dumps(frame))
+            
+            # Frames arriving meanwhile coalesce into the next batch
+            await asyncio.sleep(tick)
+
+
+def merge_bid_frames(queued, frame):
+    """Fold a new_bid frame into a queued one: latest state, summed bid count"""
+    queued['data'] = newer_bid(queued['data'], frame['data'])
+    queued['bid_count_delta'] += frame['bid_count_delta']
+
+
+class AuctionConsumer(BufferedWebsocketConsumer):
     """WebSocket consumer for real-time auction bidding"""
     
     async def connect(self):
@@ -21,14 +87,25 @@ class AuctionConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Send current auction status
-        auction_data = await self.get_auction_data()
-        await self.send(text_data=json.dumps({
-            'type': 'auction_status',
-            'data': auction_data
-        }))
+        # Reconnecting clients pass the last sequence they saw and only get what they missed
+        events = await self.get_missed_events()
+        if events is not None:
+            await self.send(text_data=json.dumps({
+                'type': 'replay',
+                'data': {'events': events}
+            }))
+        else:
+            # Send current auction status
+            auction_data = await self.get_auction_data()
+            await self.send(text_data=json.dumps({
+                'type': 'auction_status',
+                'data': auction_data
+            }))
+        self.start_writer()
     
     async def disconnect(self, close_code):
+        self.stop_writer()
+        
         # Leave auction group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -53,16 +130,31 @@ class AuctionConsumer(AsyncWebsocketConsumer):
                 return
             
             # Validate and place bid
-            result = await self.place_bid(self.auction_id, user, bid_amount)
+            if bid_engine.is_enabled():
+                # Ledger bids only touch Redis, so they don't need the serialized DB thread
+                result = await sync_to_async(bidding.place_bid, thread_sensitive=False)(
+                    self.auction_id, user, bid_amount
+                )
+            else:
+                result = await self.place_bid(self.auction_id, user, bid_amount)
             
             if result['success']:
+                # Acknowledge right away; the room broadcast may be coalesced
+                if result.get('outbid'):
+                    # A maximum bid answered straight away
+                    await self.send(text_data=json.dumps({
+                        'type': 'bid_outbid',
+                        'data': result['placed_bid_data']
+                    }))
+                else:
+                    await self.send(text_data=json.dumps({
+                        'type': 'bid_accepted',
+                        'data': result['bid_data']
+                    }))
+                
                 # Broadcast new bid to all users watching this auction
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'new_bid',
-                        'bid_data': result['bid_data']
-                    }
+                await broadcaster.publish(
+                    self.channel_layer, self.auction_id, result['bid_data'], result.get('bid_count', 1)
                 )
             else:
                 # Send error only to the user who placed the bid
@@ -70,186 +162,209 @@ class AuctionConsumer(AsyncWebsocketConsumer):
                     'type': 'error',
                     'message': result['error']
                 }))
+        
+        elif message_type == 'place_max_bid':
+            user = self.scope.get('user')
+            if not user or user.is_anonymous:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'You must be authenticated to place a bid'
+                }))
+                return
+            
+            result = await self.place_proxy_bid(self.auction_id, user, data.get('max_amount'))
+            if result['success']:
+                await self.send(text_data=json.dumps({
+                    'type': 'max_bid_accepted',
+                    'data': {
+                        'max_amount': str(result['proxy_bid'].max_amount),
+                        'bid': result['bid_data'],
+                    }
+                }))
+                if result['bid_data']:
+                    await broadcaster.publish(
+                        self.channel_layer, self.auction_id, result['bid_data'], result['bid_count']
+                    )
+            else:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': result['error']
+                }))
     
     async def new_bid(self, event):
-        """Send new bid to WebSocket"""
-        await self.send(text_data=json.dumps({
+        """Send new bid to WebSocket (coalesced while the client is behind)"""
+        await self.queue_frame({
             'type': 'new_bid',
-            'data': event['bid_data']
-        }))
+            'data': event['bid_data'],
+            'bid_count_delta': event.get('bid_count', 1)
+        }, coalesce_key='new_bid', merge=merge_bid_frames)
     
     async def auction_ended(self, event):
         """Notify when auction ends"""
-        await self.send(text_data=json.dumps({
+        await self.queue_frame({
             'type': 'auction_ended',
             'data': event['data']
-        }))
+        })
     
-    @database_sync_to_async
-    def get_auction_data(self):
-        """Get current auction status"""
-        from .models import AuctionListing, Bid
-        from django.conf import settings
-        
+    async def get_missed_events(self):
+        """Events after the client's last_seq query parameter, or None if a snapshot is needed"""
+        last_seq = parse_qs(self.scope.get('query_string', b'').decode()).get('last_seq')
+        if not last_seq:
+            return None
         try:
-            auction = AuctionListing.objects.select_related(
-                'product', 
-                'product__seller',
-                'product__seller__seller_profile',
-                'product__category',
-                'winner'
-            ).prefetch_related('product__images').get(id=self.auction_id)
-            
-            latest_bids = auction.bids.select_related('bidder').order_by('-bid_time')[:5]
-            
-            # Get seller information
-            seller = auction.product.seller
-            seller_data = {
-                'id': seller.id,
-                'username': seller.username,
-                'email': seller.email,
-            }
-            
-            # Add seller profile data if exists
-            if hasattr(seller, 'seller_profile'):
-                profile = seller.seller_profile
-                seller_data.update({
-                    'brand_name': profile.brand_name,
-                    'biography': profile.biography,
-                    'is_verified': profile.is_verified,
-                    'average_rating': str(profile.average_rating),
-                    'total_feedbacks': profile.total_feedbacks,
-                })
-            
-            # Get product images
-            images = auction.product.images.all().order_by('order')
-            image_urls = []
-            for img in images:
-                if img.image:
-                    # Build full URL for image
-                    image_url = img.image.url
-                    if not image_url.startswith('http'):
-                        # Prepend media URL if it's a relative path
-                        image_url = f"{settings.MEDIA_URL}{img.image.name}" if not image_url.startswith('/') else image_url
-                    image_urls.append({
-                        'url': image_url,
-                        'is_primary': img.is_primary,
-                        'order': img.order
-                    })
-            
-            return {
-                'auction_id': auction.id,
-                'product': {
-                    'id': auction.product.id,
-                    'name': auction.product.name,
-                    'description': auction.product.description,
-                    'condition': auction.product.condition,
-                    'category': auction.product.category.name if auction.product.category else None,
-                    'images': image_urls,
-                },
-                'seller': seller_data,
-                'starting_price': str(auction.starting_price),
-                'current_price': str(auction.current_price),
-                'start_time': auction.start_time.isoformat(),
-                'end_time': auction.end_time.isoformat(),
-                'status': auction.status,
-                'is_active': auction.is_active(),
-                'winner': {
-                    'id': auction.winner.id,
-                    'username': auction.winner.username
-                } if auction.winner else None,
-                'latest_bids': [
-                    {
-                        'bidder': bid.bidder.username,
-                        'amount': str(bid.amount),
-                        'time': bid.bid_time.isoformat()
-                    }
-                    for bid in latest_bids
-                ],
-                'total_bids': auction.bids.count(),
-            }
-        except AuctionListing.DoesNotExist:
-            return {'error': 'Auction not found'}
+            last_seq = int(last_seq[0])
+        except ValueError:
+            return None
+        try:
+            return await sync_to_async(bid_events.since, thread_sensitive=False)(self.auction_id, last_seq)
+        except redis.RedisError:
+            return None
+    
+    async def get_auction_data(self):
+        """Get current auction status (served from the snapshot cache when possible)"""
+        try:
+            auction_data = await sync_to_async(auction_snapshot.get_cached, thread_sensitive=False)(
+                self.auction_id
+            )
+        except redis.RedisError:
+            # Built from the database instead
+            auction_data = None
+        if auction_data is None:
+            auction_data = await database_sync_to_async(auction_snapshot.load)(self.auction_id)
+        return auction_data
     
     @database_sync_to_async
     def place_bid(self, auction_id, user, bid_amount):
-        """Place a new bid"""
-        from .models import AuctionListing, Bid, Notification
-        from decimal import Decimal
-        from django.utils import timezone
+        """Place a new bid through the shared bid service"""
+        return bidding.place_bid(auction_id, user, bid_amount)
+    
+    @database_sync_to_async
+    def place_proxy_bid(self, auction_id, user, max_amount):
+        """Register a maximum bid through the shared bid service"""
+        return bidding.place_proxy_bid(auction_id, user, max_amount)
+
+
+class AuctionFeedConsumer(BufferedWebsocketConsumer):
+    """
+    Multiplexed WebSocket for pages showing many live auctions
+    
+    One connection can follow any number of auctions (up to
+    WEBSOCKET_MAX_SUBSCRIPTIONS) and whole category lobbies, and gets compact
+    price ticks for all of them. Bidding still goes through the auction socket
+    or the REST API.
+    """
+    
+    async def connect(self):
+        self.auction_ids = set()
+        self.category_ids = set()
+        await self.accept()
+        self.start_writer()
+    
+    async def disconnect(self, close_code):
+        self.stop_writer()
+        
+        for auction_id in self.auction_ids:
+            await self.channel_layer.group_discard(f'auction_{auction_id}', self.channel_name)
+        for category_id in self.category_ids:
+            await self.channel_layer.group_discard(f'auction_lobby_{category_id}', self.channel_name)
+    
+    async def receive(self, text_data):
+        """Handle subscribe/unsubscribe requests"""
+        data = json.loads(text_data)
+        message_type = data.get('type')
         
         try:
-            auction = AuctionListing.objects.select_related('product').get(id=auction_id)
-            
-            # Validate bid
-            if not auction.is_active():
-                return {'success': False, 'error': 'Auction is not active'}
-            
-            if user.is_blocked:
-                return {'success': False, 'error': 'Your account is blocked'}
-            
-            bid_amount = Decimal(str(bid_amount))
-            
-            # Check if bid is higher than current price
-            if bid_amount <= auction.current_price:
-                return {'success': False, 'error': 'Bid must be higher than current price'}
-            
-            # Check if user is not the seller
-            if auction.product.seller == user:
-                return {'success': False, 'error': 'You cannot bid on your own auction'}
-            
-            # Get the previous winning bid before updating
-            previous_winning_bid = Bid.objects.filter(
-                auction=auction, 
-                is_winning=True
-            ).select_related('bidder').first()
-            
-            # Mark previous winning bid as not winning
-            Bid.objects.filter(auction=auction, is_winning=True).update(is_winning=False)
-            
-            # Create new bid
-            bid = Bid.objects.create(
-                auction=auction,
-                bidder=user,
-                amount=bid_amount,
-                is_winning=True
+            if message_type == 'subscribe':
+                await self.subscribe([int(auction_id) for auction_id in data.get('auction_ids', [])])
+            elif message_type == 'unsubscribe':
+                await self.unsubscribe([int(auction_id) for auction_id in data.get('auction_ids', [])])
+            elif message_type == 'subscribe_category':
+                await self.subscribe_category(int(data.get('category_id')))
+            elif message_type == 'unsubscribe_category':
+                await self.unsubscribe_category(int(data.get('category_id')))
+            else:
+                await self.send_error('Unknown message type')
+        except (TypeError, ValueError):
+            await self.send_error('Invalid auction or category id')
+    
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+    
+    async def subscribe(self, auction_ids):
+        new_ids = [auction_id for auction_id in dict.fromkeys(auction_ids) if auction_id not in self.auction_ids]
+        if len(self.auction_ids) + len(new_ids) > settings.WEBSOCKET_MAX_SUBSCRIPTIONS:
+            await self.send_error(
+                f'You can follow at most {settings.WEBSOCKET_MAX_SUBSCRIPTIONS} auctions per connection'
             )
-            
-            # Update auction current price
-            auction.current_price = bid_amount
-            auction.save()
-            
-            # Notify the previous highest bidder that they were outbid
-            if previous_winning_bid and previous_winning_bid.bidder != user:
-                # Create in-app notification
-                Notification.objects.create(
-                    user=previous_winning_bid.bidder,
-                    notification_type='bid_outbid',
-                    title='You have been outbid',
-                    message=f'Someone placed a higher bid of Rs. {bid_amount} on {auction.product.name}',
-                    auction=auction
-                )
-                
-                # Send email notification asynchronously
-                from .tasks import send_outbid_notification_email
-                send_outbid_notification_email.delay(
-                    user_id=previous_winning_bid.bidder.id,
-                    auction_id=auction.id,
-                    new_bid_amount=str(bid_amount),
-                    product_name=auction.product.name
-                )
-            
-            return {
-                'success': True,
-                'bid_data': {
-                    'bidder': user.username,
-                    'amount': str(bid_amount),
-                    'time': bid.bid_time.isoformat(),
-                    'current_price': str(auction.current_price)
-                }
-            }
-            
-        except AuctionListing.DoesNotExist:
-            return {'success': False, 'error': 'Auction not found'}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+            return
+        
+        # Join first so no tick is missed between the summary and the subscription
+        for auction_id in new_ids:
+            await self.channel_layer.group_add(f'auction_{auction_id}', self.channel_name)
+        self.auction_ids.update(new_ids)
+        
+        summaries = await database_sync_to_async(auction_snapshot.get_summaries)(new_ids)
+        await self.send(text_data=json.dumps({
+            'type': 'subscribed',
+            'auctions': [summaries[auction_id] for auction_id in new_ids if auction_id in summaries]
+        }))
+    
+    async def unsubscribe(self, auction_ids):
+        for auction_id in auction_ids:
+            if auction_id in self.auction_ids:
+                await self.channel_layer.group_discard(f'auction_{auction_id}', self.channel_name)
+                self.auction_ids.discard(auction_id)
+        await self.send(text_data=json.dumps({
+            'type': 'unsubscribed',
+            'auction_ids': auction_ids
+        }))
+    
+    async def subscribe_category(self, category_id):
+        """Follow every active auction in a category, including ones listed later"""
+        await self.channel_layer.group_add(f'auction_lobby_{category_id}', self.channel_name)
+        self.category_ids.add(category_id)
+        await self.subscribe(await self.get_category_auction_ids(category_id))
+    
+    async def unsubscribe_category(self, category_id):
+        if category_id in self.category_ids:
+            await self.channel_layer.group_discard(f'auction_lobby_{category_id}', self.channel_name)
+            self.category_ids.discard(category_id)
+        await self.unsubscribe(await self.get_category_auction_ids(category_id))
+    
+    @database_sync_to_async
+    def get_category_auction_ids(self, category_id):
+        from .models import AuctionListing
+        return list(AuctionListing.objects.filter(
+            status='active', product__category_id=category_id
+        ).values_list('id', flat=True)[:settings.WEBSOCKET_MAX_SUBSCRIPTIONS])
+    
+    async def new_bid(self, event):
+        """Compact price tick (coalesced per auction while the client is behind)"""
+        await self.queue_frame({
+            'type': 'tick',
+            'id': event['auction_id'],
+            'price': event['bid_data']['current_price'],
+            'bids': event.get('bid_count', 1),
+        }, coalesce_key=event['auction_id'], merge=merge_ticks)
+    
+    async def auction_ended(self, event):
+        await self.queue_frame({
+            'type': 'ended',
+            'id': event['data']['auction_id'],
+            'price': event['data']['final_price'],
+            'winner': event['data']['winner'],
+        })
+    
+    async def auction_listed(self, event):
+        """A new auction opened in a followed category"""
+        await self.subscribe([event['auction_id']])
+
+
+def merge_ticks(queued, frame):
+    """Fold a tick into a queued one for the same auction"""
+    if Decimal(frame['price']) > Decimal(queued['price']):
+        queued['price'] = frame['price']
+    queued['bids'] += frame['bids']
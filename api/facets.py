@@ -0,0 +1,128 @@
+"""
+Facet counts for fixed price listings
+
+Counts per category, condition, province and price bucket for the listings
+matching the current filters, so the client can show "Textiles (12)" next to
+each filter option. All facets come from one query: the filtered listings
+are wrapped in a subquery and grouped with GROUPING SETS, one set per facet
+plus () for the total, instead of one COUNT per facet value.
+
+The unfiltered views (optionally by status) are what most visitors land on,
+so their counts are cached in Redis for settings.LISTING_FACETS_CACHE_SECONDS.
+
+Redis keys:
+    listing_facets:<status or 'all'>   JSON facet counts
+"""
+import json
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Product
+from .redis_utils import get_redis_connection
+
+# Query parameters that don't change which listings match
+NON_FILTER_PARAMS = {'cursor', 'page_size', 'ordering', 'format'}
+
+FACETS_SQL = """
+SELECT
+    GROUPING(f.facet_category), GROUPING(f.facet_condition),
+    GROUPING(f.facet_province), GROUPING(f.facet_price_bucket),
+    f.facet_category, c.name, f.facet_condition, f.facet_province, p.name,
+    f.facet_price_bucket, COUNT(*)
+FROM ({listings}) AS f
+LEFT JOIN categories c ON c.id = f.facet_category
+LEFT JOIN provinces p ON p.id = f.facet_province
+GROUP BY GROUPING SETS (
+    (f.facet_category, c.name),
+    (f.facet_condition),
+    (f.facet_province, p.name),
+    (f.facet_price_bucket),
+    ()
+)
+"""
+
+
+def price_buckets():
+    """[(min, max), ...] from settings.LISTING_PRICE_FACET_BOUNDARIES; the last max is None"""
+    bounds = [0] + list(settings.LISTING_PRICE_FACET_BOUNDARIES)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def cache_key(status):
+    return f'listing_facets:{status or "all"}'
+
+
+def get_listing_facets(queryset, cacheable=False, status=None):
+    """
+    Facet counts for a filtered FixedPriceListing queryset
+
+    Args:
+        cacheable: True when the only filter applied is status, so the
+            result can be shared between requests
+
+    Returns:
+        dict with 'total' and a list of {..., 'count'} per facet
+    """
+    if cacheable:
+        try:
+            cached = get_redis_connection().get(cache_key(status))
+        except redis.RedisError as e:
+            print(f"Failed to read listing facets: {str(e)}")
+            cached = None
+        if cached:
+            return json.loads(cached)
+
+    facets = count_facets(queryset)
+
+    if cacheable:
+        try:
+            get_redis_connection().set(
+                cache_key(status), json.dumps(facets), ex=settings.LISTING_FACETS_CACHE_SECONDS
+            )
+        except redis.RedisError as e:
+            print(f"Failed to cache listing facets: {str(e)}")
+    return facets
+
+
+def count_facets(queryset):
+    buckets = price_buckets()
+    listings = queryset.order_by().annotate(
+        facet_category=F('product__category_id'),
+        facet_condition=F('product__condition'),
+        facet_province=F('product__province_id'),
+        facet_price_bucket=Case(
+            *[When(price__lt=upper, then=Value(index)) for index, (_, upper) in enumerate(buckets[:-1])],
+            default=Value(len(buckets) - 1),
+            output_field=IntegerField(),
+        ),
+    # id keeps rows apart if a filter made the queryset DISTINCT
+    ).values('id', 'facet_category', 'facet_condition', 'facet_province', 'facet_price_bucket')
+
+    sql, params = listings.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(FACETS_SQL.format(listings=sql), params)
+        rows = cursor.fetchall()
+
+    conditions = dict(Product._meta.get_field('condition').choices)
+    facets = {'total': 0, 'category': [], 'condition': [], 'province': [], 'price': []}
+    for (no_category, no_condition, no_province, no_bucket,
+         category_id, category_name, condition, province_id, province_name, bucket, count) in rows:
+        if not no_category:
+            facets['category'].append({'id': category_id, 'name': category_name, 'count': count})
+        elif not no_condition:
+            facets['condition'].append({'value': condition, 'label': conditions.get(condition), 'count': count})
+        elif not no_province:
+            facets['province'].append({'id': province_id, 'name': province_name, 'count': count})
+        elif not no_bucket:
+            low, high = buckets[bucket]
+            facets['price'].append({'min': low, 'max': high, 'count': count})
+        else:
+            facets['total'] = count
+
+    for name in ('category', 'condition', 'province'):
+        facets[name].sort(key=lambda entry: -entry['count'])
+    facets['price'].sort(key=lambda entry: entry['min'])
+    return facets
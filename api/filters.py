@@ -0,0 +1,47 @@
+"""
+Catalog search filters
+
+Product search used DRF's SearchFilter, i.e. ILIKE '%term%' over name and
+description across joins, which can't use an index. ProductSearchFilter
+matches the GIN-indexed Product.search_vector instead (name weighted A,
+description B, kept up to date by a trigger, see migration 0022) and ranks
+results by relevance.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+from rest_framework.filters import SearchFilter
+
+# Must match the config used by the products_search_vector_update trigger
+SEARCH_CONFIG = 'english'
+
+
+def to_prefix_query(terms):
+    """
+    'hand kurt' -> 'hand:* & kurt:*' so partial words still match, like the
+    old substring search did for word starts
+    """
+    words = re.findall(r'\w+', terms)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Full-text ?search= over products, best matches first
+
+    Views point search_vector_field at the product's vector, e.g.
+    'product__search_vector' for listings. An explicit ?ordering= still wins
+    over relevance (OrderingFilter runs after this filter).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        raw_query = to_prefix_query(request.query_params.get(self.search_param, ''))
+        if not raw_query:
+            return queryset
+
+        field = getattr(view, 'search_vector_field', 'search_vector')
+        query = SearchQuery(raw_query, config=SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(**{field: query}).annotate(
+            search_rank=SearchRank(F(field), query)
+        ).order_by('-search_rank', '-pk')
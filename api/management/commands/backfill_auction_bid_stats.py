@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from api import bid_engine
+from api.models import AuctionListing, Bid
+
+
+class Command(BaseCommand):
+    help = 'Recompute bid_count, leading_bidder and last_bid_at on auctions from the bids table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Auctions updated per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if bid_engine.is_enabled():
+            # Ledger bids only count once they are in the bids table
+            flushed = bid_engine.flush_all()
+            self.stdout.write(f'Flushed {flushed} pending ledger bid(s)')
+
+        self.stdout.write('Backfilling auction bid statistics...')
+        bids = Bid.objects.filter(auction=OuterRef('pk'))
+        bid_count = bids.order_by().values('auction').annotate(total=Count('id')).values('total')
+        last_bid_at = bids.order_by('-bid_time').values('bid_time')[:1]
+        leading_bidder = bids.filter(is_winning=True).values('bidder')[:1]
+
+        auction_ids = list(AuctionListing.objects.order_by('id').values_list('id', flat=True))
+        updated = 0
+        for start in range(0, len(auction_ids), batch_size):
+            batch = auction_ids[start:start + batch_size]
+            with transaction.atomic():
+                # Hold the rows so bids accepted meanwhile can't be counted twice or missed
+                list(AuctionListing.objects.select_for_update().filter(id__in=batch).values_list('id'))
+                updated += AuctionListing.objects.filter(id__in=batch).update(
+                    bid_count=Coalesce(Subquery(bid_count), Value(0)),
+                    last_bid_at=Subquery(last_bid_at),
+                    leading_bidder=Subquery(leading_bidder),
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Backfilled bid statistics for {updated} auction(s)'))
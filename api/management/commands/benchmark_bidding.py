@@ -0,0 +1,168 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api import bid_engine, bidding
+from api.models import AuctionListing, Bid, Product, User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent bidding on a single auction and verify bid integrity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bidders',
+            type=int,
+            default=50,
+            help='Number of parallel bidders (default: 50)',
+        )
+        parser.add_argument(
+            '--bids-per-bidder',
+            type=int,
+            default=20,
+            help='Bids each bidder attempts (default: 20)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark auction and users instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        bidders_count = options['bidders']
+        bids_per_bidder = options['bids_per_bidder']
+        if bidders_count < 1 or bids_per_bidder < 1:
+            raise CommandError('--bidders and --bids-per-bidder must be positive')
+
+        run_id = uuid.uuid4().hex[:8]
+        self.stdout.write(
+            f'Benchmarking {bidders_count} bidders x {bids_per_bidder} bids '
+            f'(engine: {"redis" if bid_engine.is_enabled() else "database"})...'
+        )
+
+        seller, bidders, auction = self.create_fixtures(run_id, bidders_count)
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=bidders_count) as executor:
+                results = list(executor.map(
+                    lambda bidder: self.run_bidder(auction.id, bidder, bids_per_bidder),
+                    bidders
+                ))
+            elapsed = time.perf_counter() - started
+
+            if bid_engine.is_enabled():
+                bid_engine.close_auction(auction.id)
+
+            latencies = [latency for bidder_latencies, _ in results for latency in bidder_latencies]
+            accepted = [amount for _, amounts in results for amount in amounts]
+            self.report(elapsed, latencies, accepted)
+            self.verify(auction, accepted)
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Kept auction {auction.id} (run {run_id})')
+            else:
+                seller.products.all().delete()
+                User.objects.filter(id__in=[seller.id] + [bidder.id for bidder in bidders]).delete()
+
+    def create_fixtures(self, run_id, bidders_count):
+        """Create a seller, an active auction and the bidder accounts"""
+        seller = User.objects.create_user(
+            username=f'bench_seller_{run_id}',
+            email=f'bench_seller_{run_id}@example.com',
+            password=uuid.uuid4().hex,
+            role='seller'
+        )
+        bidders = [
+            User(
+                username=f'bench_bidder_{run_id}_{i}',
+                email=f'bench_bidder_{run_id}_{i}@example.com',
+                role='buyer'
+            )
+            for i in range(bidders_count)
+        ]
+        for bidder in bidders:
+            bidder.set_unusable_password()
+        bidders = User.objects.bulk_create(bidders)
+
+        product = Product.objects.create(
+            seller=seller,
+            name=f'Benchmark item {run_id}',
+            description='Created by benchmark_bidding',
+            condition='new'
+        )
+        now = timezone.now()
+        auction = AuctionListing.objects.create(
+            product=product,
+            starting_price=Decimal('1.00'),
+            current_price=Decimal('1.00'),
+            start_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(hours=1)
+        )
+        return seller, bidders, auction
+
+    def run_bidder(self, auction_id, bidder, bids_per_bidder):
+        """Repeatedly outbid the current price; returns (latencies, accepted amounts)"""
+        latencies = []
+        accepted = []
+        try:
+            for _ in range(bids_per_bidder):
+                current_price = self.current_price(auction_id)
+                amount = current_price + Decimal('1.00')
+                started = time.perf_counter()
+                result = bidding.place_bid(auction_id, bidder, amount, notify=False)
+                latencies.append(time.perf_counter() - started)
+                if result['success']:
+                    accepted.append(amount)
+        finally:
+            connection.close()
+        return latencies, accepted
+
+    def current_price(self, auction_id):
+        if bid_engine.is_enabled():
+            state = bid_engine.get_live_state(auction_id)
+            if state:
+                return state['current_price']
+        return AuctionListing.objects.values_list(
+            'current_price', flat=True
+        ).get(id=auction_id)
+
+    def report(self, elapsed, latencies, accepted):
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        percentiles = statistics.quantiles(latencies_ms, n=100) if len(latencies_ms) > 1 else latencies_ms * 99
+        self.stdout.write(f'Attempts:   {len(latencies_ms)}')
+        self.stdout.write(f'Accepted:   {len(accepted)}')
+        self.stdout.write(f'Throughput: {len(latencies_ms) / elapsed:.1f} attempts/s')
+        self.stdout.write(
+            f'Latency:    p50={percentiles[49]:.1f}ms '
+            f'p95={percentiles[94]:.1f}ms p99={percentiles[98]:.1f}ms'
+        )
+
+    def verify(self, auction, accepted):
+        """Check the bids table is consistent with what the bidders were told"""
+        auction.refresh_from_db()
+        bids = list(Bid.objects.filter(auction=auction).order_by('id'))
+        winners = [bid for bid in bids if bid.is_winning]
+        highest = max(accepted) if accepted else auction.starting_price
+
+        errors = []
+        if len(bids) != len(accepted):
+            errors.append(f'{len(bids)} bids stored but {len(accepted)} accepted')
+        if accepted and len(winners) != 1:
+            errors.append(f'{len(winners)} winning bids')
+        if winners and winners[0].amount != highest:
+            errors.append(f'winning bid {winners[0].amount} is not the highest accepted {highest}')
+        if auction.current_price != highest:
+            errors.append(f'current price {auction.current_price} is not the highest accepted {highest}')
+        if any(earlier.amount >= later.amount for earlier, later in zip(bids, bids[1:])):
+            errors.append('bid amounts are not strictly increasing')
+
+        if errors:
+            raise CommandError('Integrity check failed: ' + '; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('✓ Integrity check passed'))
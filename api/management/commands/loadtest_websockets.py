@@ -0,0 +1,299 @@
+import asyncio
+import json
+import resource
+import statistics
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api import bid_engine, routing
+from api.middleware import TokenAuthMiddlewareStack
+from api.models import AuctionListing, Product, User
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS (KB on Linux) where /proc isn't available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values_ms):
+    values_ms = sorted(values_ms)
+    if not values_ms:
+        return None
+    if len(values_ms) == 1:
+        return values_ms * 99
+    return statistics.quantiles(values_ms, n=100)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test auction WebSockets: open many connections to ws/auction/<id>/ '
+        'in this process, drive bids and report latencies and memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=1000,
+            help='Total WebSocket connections, bidders included (default: 1000)',
+        )
+        parser.add_argument(
+            '--bidders',
+            type=int,
+            default=50,
+            help='Authenticated connections that place bids (default: 50)',
+        )
+        parser.add_argument(
+            '--bid-rate',
+            type=float,
+            default=20.0,
+            help='Bids per second across all bidders (default: 20)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help='Seconds to keep bidding (default: 10)',
+        )
+        parser.add_argument(
+            '--connect-concurrency',
+            type=int,
+            default=100,
+            help='Connections opened at the same time during ramp-up (default: 100)',
+        )
+        parser.add_argument(
+            '--in-memory',
+            action='store_true',
+            help='Use the in-memory channel layer instead of CHANNEL_LAYERS (no Redis pub/sub)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the load-test auction and users instead of deleting them',
+        )
+
+    def handle(self, *args, **options):
+        connections = options['connections']
+        bidders_count = options['bidders']
+        if connections < 1 or bidders_count < 0 or bidders_count > connections:
+            raise CommandError('--connections must be positive and at least --bidders')
+        if options['bid_rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--bid-rate and --duration must be positive')
+
+        if options['in_memory']:
+            settings.CHANNEL_LAYERS = {
+                'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+            }
+            channel_layers.backends.clear()
+
+        run_id = uuid.uuid4().hex[:8]
+        self.stdout.write(
+            f'Load-testing {connections} connections ({bidders_count} bidders) at '
+            f'{options["bid_rate"]:g} bids/s for {options["duration"]:g}s '
+            f'(engine: {"redis" if bid_engine.is_enabled() else "database"}, '
+            f'channel layer: {settings.CHANNEL_LAYERS["default"]["BACKEND"].rsplit(".", 1)[-1]})...'
+        )
+
+        seller, bidders, auction = self.create_fixtures(run_id, bidders_count)
+        try:
+            stats = asyncio.run(self.run(auction, bidders, options))
+            if bid_engine.is_enabled():
+                bid_engine.close_auction(auction.id)
+            self.report(stats)
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Kept auction {auction.id} (run {run_id})')
+            else:
+                seller.products.all().delete()
+                User.objects.filter(id__in=[seller.id] + [bidder.id for bidder, _ in bidders]).delete()
+
+    def create_fixtures(self, run_id, bidders_count):
+        """Create a seller, an active auction and the bidder accounts with tokens"""
+        seller = User.objects.create_user(
+            username=f'load_seller_{run_id}',
+            email=f'load_seller_{run_id}@example.com',
+            password=uuid.uuid4().hex,
+            role='seller'
+        )
+        bidders = [
+            User(
+                username=f'load_bidder_{run_id}_{i}',
+                email=f'load_bidder_{run_id}_{i}@example.com',
+                role='buyer'
+            )
+            for i in range(bidders_count)
+        ]
+        for bidder in bidders:
+            bidder.set_unusable_password()
+        bidders = User.objects.bulk_create(bidders)
+        tokens = Token.objects.bulk_create([
+            Token(key=Token.generate_key(), user=bidder) for bidder in bidders
+        ])
+
+        product = Product.objects.create(
+            seller=seller,
+            name=f'Load test item {run_id}',
+            description='Created by loadtest_websockets',
+            condition='new'
+        )
+        now = timezone.now()
+        auction = AuctionListing.objects.create(
+            product=product,
+            starting_price=Decimal('1.00'),
+            current_price=Decimal('1.00'),
+            start_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(hours=1)
+        )
+        return seller, [(bidder, token.key) for bidder, token in zip(bidders, tokens)], auction
+
+    async def run(self, auction, bidders, options):
+        application = TokenAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+        path = f'/ws/auction/{auction.id}/'
+        stats = {
+            'rss_start': current_rss_mb(),
+            'connect_ms': [],
+            'connect_failures': 0,
+            'ack_ms': [],
+            'accepted': 0,
+            'rejected': 0,
+            'fanout_ms': [],
+            'new_bid_frames': 0,
+        }
+        # amount -> perf_counter() when the bid was sent, for fan-out delay
+        sent_at = {}
+
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def open_connection(token_key=None):
+            query = f'?token={token_key}' if token_key else ''
+            communicator = WebsocketCommunicator(application, path + query)
+            async with semaphore:
+                started = time.perf_counter()
+                connected, _ = await communicator.connect(timeout=30)
+                if connected:
+                    # The connect is complete once the auction_status snapshot arrives
+                    await communicator.receive_json_from(timeout=30)
+                    stats['connect_ms'].append((time.perf_counter() - started) * 1000)
+                else:
+                    stats['connect_failures'] += 1
+                    return None
+            return communicator
+
+        connect_started = time.perf_counter()
+        bidder_sockets = await asyncio.gather(*[open_connection(token_key) for _, token_key in bidders])
+        watcher_sockets = await asyncio.gather(*[
+            open_connection() for _ in range(options['connections'] - len(bidders))
+        ])
+        connect_elapsed = time.perf_counter() - connect_started
+        stats['rss_connected'] = current_rss_mb()
+        stats['connect_elapsed'] = connect_elapsed
+
+        # Bidders' in-flight bids, oldest first; replies arrive in send order
+        in_flight = {index: deque() for index in range(len(bidder_sockets))}
+
+        async def read_frames(communicator, bidder_index=None):
+            while True:
+                message = await communicator.receive_output(timeout=3600)
+                if message['type'] == 'websocket.close':
+                    return
+                frame = json.loads(message['text'])
+                received = time.perf_counter()
+                if frame['type'] in ('bid_accepted', 'error') and bidder_index is not None:
+                    queue = in_flight[bidder_index]
+                    if queue:
+                        stats['ack_ms'].append((received - queue.popleft()) * 1000)
+                    stats['accepted' if frame['type'] == 'bid_accepted' else 'rejected'] += 1
+                elif frame['type'] == 'new_bid':
+                    stats['new_bid_frames'] += 1
+                    started = sent_at.get(Decimal(frame['data']['current_price']))
+                    if started is not None:
+                        stats['fanout_ms'].append((received - started) * 1000)
+
+        readers = [
+            asyncio.ensure_future(read_frames(communicator, index))
+            for index, communicator in enumerate(bidder_sockets) if communicator
+        ] + [
+            asyncio.ensure_future(read_frames(communicator))
+            for communicator in watcher_sockets if communicator
+        ]
+
+        live_bidders = [index for index, communicator in enumerate(bidder_sockets) if communicator]
+        interval = 1 / options['bid_rate']
+        amount = auction.starting_price
+        bids_sent = 0
+        bidding_started = time.perf_counter()
+        while live_bidders and time.perf_counter() - bidding_started < options['duration']:
+            index = live_bidders[bids_sent % len(live_bidders)]
+            amount += Decimal('1.00')
+            now = time.perf_counter()
+            sent_at[amount] = now
+            in_flight[index].append(now)
+            await bidder_sockets[index].send_json_to({'type': 'place_bid', 'amount': str(amount)})
+            bids_sent += 1
+            # Keep the overall rate steady even if sends fall behind
+            await asyncio.sleep(max(0, bidding_started + bids_sent * interval - time.perf_counter()))
+
+        # Let the last acks and broadcasts drain
+        deadline = time.perf_counter() + 5
+        while time.perf_counter() < deadline and any(in_flight.values()):
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(max(settings.AUCTION_BROADCAST_TICK_MS / 1000 * 2, 0.2))
+        stats['bids_sent'] = bids_sent
+        stats['bidding_elapsed'] = time.perf_counter() - bidding_started
+        stats['rss_end'] = current_rss_mb()
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(*[
+            communicator.disconnect() for communicator in bidder_sockets + watcher_sockets if communicator
+        ], return_exceptions=True)
+        return stats
+
+    def report(self, stats):
+        self.stdout.write(
+            f'Connections: {len(stats["connect_ms"])} open, {stats["connect_failures"]} failed '
+            f'in {stats["connect_elapsed"]:.1f}s'
+        )
+        self.write_latency('Connect', stats['connect_ms'])
+        self.stdout.write(
+            f'Bids:        {stats["bids_sent"]} sent, {stats["accepted"]} accepted, '
+            f'{stats["rejected"]} rejected ({stats["bids_sent"] / stats["bidding_elapsed"]:.1f}/s)'
+        )
+        self.write_latency('Bid ack', stats['ack_ms'])
+        self.stdout.write(f'Broadcasts:  {stats["new_bid_frames"]} new_bid frames delivered')
+        self.write_latency('Fan-out', stats['fanout_ms'])
+        # Clients run in the same process as the consumers, so this includes their memory too
+        self.stdout.write(
+            f'RSS:         start={stats["rss_start"]:.0f}MB connected={stats["rss_connected"]:.0f}MB '
+            f'end={stats["rss_end"]:.0f}MB'
+        )
+        self.stdout.write(self.style.SUCCESS('✓ Load test finished'))
+
+    def write_latency(self, label, values_ms):
+        result = percentiles(values_ms)
+        if result is None:
+            self.stdout.write(f'{label + ":":<13}n/a')
+            return
+        self.stdout.write(
+            f'{label + ":":<13}p50={result[49]:.1f}ms p95={result[94]:.1f}ms p99={result[98]:.1f}ms'
+        )
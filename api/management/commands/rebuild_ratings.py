@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute running rating totals on products and seller profiles from reviews and feedback'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product ratings...')
+        products = ratings.rebuild_product_ratings()
+        self.stdout.write('Rebuilding seller ratings...')
+        sellers = ratings.rebuild_seller_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Corrected {products} product(s) and {sellers} seller profile(s)'
+        ))
@@ -1,18 +1,20 @@
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
 from urllib.parse import parse_qs
 
+from . import token_cache
 
-@database_sync_to_async
-def get_user_from_token(token_key):
-    """Get user from token"""
-    try:
-        token = Token.objects.select_related('user').get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
+
+async def get_user_from_token(token_key):
+    """Get user from token (cache first, database only on a miss)"""
+    user = await sync_to_async(token_cache.get_cached_user, thread_sensitive=False)(token_key)
+    if user is None:
+        user = await database_sync_to_async(token_cache.get_user)(token_key)
+    if user is None or not user.is_active:
         return AnonymousUser()
+    return user
 
 
 class TokenAuthMiddleware(BaseMiddleware):
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bid',
+            name='bid_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
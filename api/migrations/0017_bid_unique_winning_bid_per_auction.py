@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+def clear_duplicate_winning_bids(apps, schema_editor):
+    """Keep only the highest (latest) winning bid per auction before adding the constraint"""
+    Bid = apps.get_model('api', 'Bid')
+    duplicated = (
+        Bid.objects.filter(is_winning=True)
+        .values('auction_id')
+        .annotate(winners=models.Count('id'))
+        .filter(winners__gt=1)
+        .values_list('auction_id', flat=True)
+    )
+    for auction_id in duplicated:
+        keep = Bid.objects.filter(
+            auction_id=auction_id, is_winning=True
+        ).order_by('-amount', '-bid_time', '-id').first()
+        Bid.objects.filter(
+            auction_id=auction_id, is_winning=True
+        ).exclude(id=keep.id).update(is_winning=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_alter_bid_bid_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_winning_bids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_winning', True)), fields=('auction',), name='unique_winning_bid_per_auction'),
+        ),
+    ]
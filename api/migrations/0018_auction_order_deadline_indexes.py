@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_bid_unique_winning_bid_per_auction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(fields=['status', 'end_time'], name='auction_lis_status_179fd2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'payment_deadline'], name='orders_status_e9a0e6_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_bid_stats(apps, schema_editor):
+    AuctionListing = apps.get_model('api', 'AuctionListing')
+    Bid = apps.get_model('api', 'Bid')
+    bids = Bid.objects.filter(auction=models.OuterRef('pk'))
+    AuctionListing.objects.update(
+        bid_count=Coalesce(
+            models.Subquery(bids.order_by().values('auction').annotate(total=models.Count('id')).values('total')), 0
+        ),
+        last_bid_at=models.Subquery(bids.order_by('-bid_time').values('bid_time')[:1]),
+        leading_bidder=models.Subquery(bids.filter(is_winning=True).values('bidder')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_auction_order_deadline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auctionlisting',
+            name='leading_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_auctions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_auction_bid_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', 'bid_time', 'id'], name='bids_auction_694249_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_province(apps, schema_editor):
+    """Same rule as Product.find_seller_province_id, in one UPDATE"""
+    Product = apps.get_model('api', 'Product')
+    SellerProfile = apps.get_model('api', 'SellerProfile')
+    Address = apps.get_model('api', 'Address')
+    business = SellerProfile.objects.filter(
+        user_id=models.OuterRef('seller_id')
+    ).values('business_address_id__city__province_id')[:1]
+    address = Address.objects.filter(
+        user_id=models.OuterRef('seller_id')
+    ).order_by('-is_default', 'id').values('city__province_id')[:1]
+    Product.objects.update(province_id=Coalesce(
+        models.Subquery(business), models.Subquery(address)
+    ))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_search_suggest_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='province',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='api.province'),
+        ),
+        migrations.RunPython(backfill_product_province, migrations.RunPython.noop),
+    ]
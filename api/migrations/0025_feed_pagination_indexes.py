@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_product_province'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='auctionlisting',
+            name='auction_lis_status_179fd2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(fields=['status', 'end_time', 'id'], name='auction_lis_status_3cf98f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(fields=['status', 'current_price', 'id'], name='auction_lis_status_1d9cb4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auctionlisting',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='auction_lis_status_7a3f9c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixedpricelisting',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='fixed_price_status_cd7265_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fixedpricelisting',
+            index=models.Index(fields=['status', 'price', 'id'], name='fixed_price_status_3ecabf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='products_created_8097c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='products_name_ce0fc8_idx'),
+        ),
+    ]
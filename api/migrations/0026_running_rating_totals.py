@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:00
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_sums(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    ProductReview = apps.get_model('api', 'ProductReview')
+    SellerProfile = apps.get_model('api', 'SellerProfile')
+    Feedback = apps.get_model('api', 'Feedback')
+    reviews = ProductReview.objects.filter(product=models.OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(models.Subquery(reviews.annotate(total=models.Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(models.Subquery(reviews.annotate(total=models.Count('id')).values('total')), 0),
+    )
+    feedbacks = Feedback.objects.filter(seller=models.OuterRef('user')).order_by().values('seller')
+    SellerProfile.objects.update(
+        rating_sum=Coalesce(models.Subquery(feedbacks.annotate(total=models.Sum('seller_rating')).values('total')), 0),
+        total_feedbacks=Coalesce(models.Subquery(feedbacks.annotate(total=models.Count('id')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_feed_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sellerprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
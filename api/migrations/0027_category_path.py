@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:03
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    """Walk the tree from the roots, one level at a time"""
+    Category = apps.get_model('api', 'Category')
+    paths = {None: ''}
+    level = list(Category.objects.filter(parent=None).values_list('id', 'parent_id'))
+    while level:
+        for category_id, parent_id in level:
+            paths[category_id] = f'{paths[parent_id]}{category_id}/'
+            Category.objects.filter(pk=category_id).update(path=paths[category_id])
+        level = list(Category.objects.filter(
+            parent_id__in=[category_id for category_id, _ in level]
+        ).values_list('id', 'parent_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_running_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
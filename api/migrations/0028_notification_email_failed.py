@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='email_failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,259 @@
+"""
+Conditional GET for read endpoints
+
+Polling clients used to re-download the same list and detail payloads and
+the server serialized them again every time. ConditionalGetMixin derives a
+validator from the ids and timestamps of the rows a response contains,
+answers If-None-Match / If-Modified-Since with 304 Not Modified before the
+serializer runs, and sends ETag (and Last-Modified on detail endpoints) on
+full responses.
+
+ETags are weak (W/"..."): values the serializer computes from the current
+time, like an auction's time_remaining, aren't covered by them.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models import Case, Count, F, Max, Sum, When
+from django.db.models.constants import LOOKUP_SEP
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date
+from rest_framework.response import Response
+
+from . import response_cache
+from .models import Wishlist
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for a viewset's list and retrieve
+
+    validator_fields: auto_now timestamps the representation is built
+        from, including related rows', e.g. ('updated_at', 'product__updated_at')
+    validator_schedule_fields: timestamps at which the representation
+        changes without a write, once they've passed (discount start/end)
+
+    A list's ETag covers only the page being returned: the page is fetched
+    as usual, and its ids and timestamps are read from the loaded rows
+    before anything is serialized, so a list GET costs no more queries than
+    before. A detail ETag comes from one aggregate over the matching row.
+
+    Values that aren't timestamps can be added with get_validator_extra().
+    Last-Modified is only sent on details, and only when there are none,
+    since it can't express them.
+
+    Meant for viewsets without object-level read permissions: a detail 304
+    is decided from the filtered queryset without calling get_object().
+    """
+    validator_fields = ('updated_at',)
+    validator_schedule_fields = ()
+
+    def get_validator_extra(self):
+        return []
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(page if page is not None else queryset)
+
+        def render(request, *args, **kwargs):
+            serializer = self.get_serializer(rows, many=True)
+            if page is not None:
+                return self.get_paginated_response(serializer.data)
+            return Response(serializer.data)
+
+        # count / next links are part of the page too
+        pagination = self.get_paginated_response([]).data if page is not None else None
+        return self.respond_conditionally(self.get_page_validators(rows, pagination), render, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+            validators = self.get_validators(queryset)
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookup; get_object() turns it into a 404
+            validators = None
+        return self.respond_conditionally(validators, super().retrieve, request, *args, **kwargs)
+
+    def get_page_validators(self, rows, pagination):
+        """
+        Returns:
+            (etag, None) for the loaded rows of a list page
+        """
+        now = timezone.now()
+        state = [
+            (
+                row.pk,
+                [_field_value(row, field) for field in self.validator_fields],
+                [_passed(_field_value(row, field), now) for field in self.validator_schedule_fields],
+            )
+            for row in rows
+        ]
+        return self.make_etag([state, pagination]), None
+
+    def get_validators(self, queryset):
+        """
+        Returns:
+            (etag, last_modified datetime or None) for a detail lookup, or
+            None when it matches nothing
+        """
+        now = timezone.now()
+        aggregates = {'rows': Count('pk'), 'id_sum': Sum('pk')}
+        for index, field in enumerate(self.validator_fields):
+            aggregates[f'changed_{index}'] = Max(field)
+        for index, field in enumerate(self.validator_schedule_fields):
+            aggregates[f'scheduled_{index}'] = Max(Case(When(**{f'{field}__lte': now}, then=F(field))))
+        state = queryset.order_by().aggregate(**aggregates)
+        if not state['rows']:
+            return None
+
+        timestamps = [value for key, value in state.items() if key not in ('rows', 'id_sum') and value]
+        etag = self.make_etag(sorted(state.items()))
+        last_modified = max(timestamps) if timestamps and not self.get_validator_extra() else None
+        return etag, last_modified
+
+    def make_etag(self, state):
+        fingerprint = repr([
+            self.request.user.pk, self.request.accepted_renderer.format, state, self.get_validator_extra(),
+        ])
+        return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+
+    def respond_conditionally(self, validators, render, request, *args, **kwargs):
+        if validators is None:
+            return render(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+        )
+        if response is None:
+            response = render(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        # Representations differ per user (wishlist flags, order items)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def _field_value(row, path):
+    """Follow a 'product__updated_at' style path through already loaded relations"""
+    value = row
+    for name in path.split(LOOKUP_SEP):
+        try:
+            value = getattr(value, name)
+        except ObjectDoesNotExist:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+def _passed(moment, now):
+    return moment if moment is not None and moment <= now else None
+
+
+class WishlistConditionalGetMixin(ConditionalGetMixin):
+    """For views whose payload embeds products, which carry is_in_wishlist"""
+
+    def get_validator_extra(self):
+        if not self.request.user.is_authenticated:
+            return []
+        wishlist = Wishlist.objects.filter(user=self.request.user).aggregate(
+            items=Count('id'), latest=Max('created_at')
+        )
+        return [wishlist['items'], wishlist['latest']]
+
+
+class ResponseCacheMixin:
+    """
+    Serve list and retrieve from the response cache for anonymous JSON GETs
+
+    cache_tag: collection tag, bumped whenever one of the view's rows is
+        added, removed or saved
+    get_cache_tags(): tags for one loaded object
+
+    Tag versions are read before anything is serialized: the collection's
+    before the queryset runs, the objects' as soon as they're loaded (the
+    list page or the detail object). Lists are only cached when paginated.
+
+    Goes before a ConditionalGetMixin in the bases; cached entries keep
+    their ETag, so If-None-Match is answered without touching the database.
+    """
+    cache_tag = None
+    # Tag versions the response being rendered depends on; None when it isn't cached
+    cache_versions = None
+
+    def get_cache_tags(self, obj):
+        return [f'{self.cache_tag}:{obj.pk}']
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            # The rows aren't seen before serialization; don't cache
+            self.cache_versions = None
+        else:
+            self.read_tag_versions(page)
+        return page
+
+    def get_object(self):
+        obj = super().get_object()
+        self.read_tag_versions([obj])
+        return obj
+
+    def read_tag_versions(self, objects):
+        if self.cache_versions is None:
+            return
+        tags = {tag for obj in objects for tag in self.get_cache_tags(obj)}
+        versions = response_cache.current_versions(tags - set(self.cache_versions))
+        self.cache_versions = None if versions is None else {**self.cache_versions, **versions}
+
+    def cached_response(self, render, request, *args, **kwargs):
+        if request.user.is_authenticated or request.accepted_renderer.format != 'json':
+            return render(request, *args, **kwargs)
+
+        key = response_cache.cache_key(request)
+        entry = response_cache.get(key)
+        if entry is None:
+            if response_cache.acquire(key):
+                try:
+                    return self.render_and_store(key, render, request, *args, **kwargs)
+                finally:
+                    response_cache.release(key)
+            entry = response_cache.wait(key)
+            if entry is None:
+                # Whoever holds the lock is taking too long; don't queue behind it
+                return render(request, *args, **kwargs)
+
+        return self.respond_conditionally(
+            entry['validators'], lambda *args, **kwargs: Response(entry['data']), request
+        )
+
+    def render_and_store(self, key, render, request, *args, **kwargs):
+        # Read before the queryset runs, so a change committed meanwhile invalidates the entry
+        self.cache_versions = response_cache.current_versions([self.cache_tag])
+        response = render(request, *args, **kwargs)
+        versions, self.cache_versions = self.cache_versions, None
+        if response.status_code != 200 or versions is None:
+            return response
+
+        last_modified = response.get('Last-Modified')
+        validators = (
+            response['ETag'],
+            datetime.fromtimestamp(parse_http_date(last_modified), tz=dt_timezone.utc) if last_modified else None,
+        )
+        response_cache.store(key, response.data, validators, versions)
+        return response
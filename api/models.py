@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from decimal import Decimal
 
@@ -50,11 +54,16 @@ class SellerProfile(models.Model):
     is_verified = models.BooleanField(default=False)  # Admin verification
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00, validators=[MinValueValidator(0), MaxValueValidator(5)])
     total_feedbacks = models.IntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)  # Sum of seller_rating over total_feedbacks (see api/ratings.py)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'seller_profiles'
+        indexes = [
+            # Typeahead (api/suggest.py)
+            GinIndex(fields=['brand_name'], name='seller_brand_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
     
     def __str__(self):
         return f"Seller Profile: {self.user.username} - {self.brand_name or 'No Brand'}"
@@ -68,18 +77,6 @@ class SellerProfile(models.Model):
         if default_address:
             return default_address.city.province
         return None
-    
-    def update_rating(self):
-        """Update average rating from feedbacks"""
-        feedbacks = Feedback.objects.filter(seller=self.user)
-        if feedbacks.exists():
-            avg_rating = feedbacks.aggregate(models.Avg('seller_rating'))['seller_rating__avg']
-            self.average_rating = round(avg_rating, 2)
-            self.total_feedbacks = feedbacks.count()
-        else:
-            self.average_rating = 0.00
-            self.total_feedbacks = 0
-        self.save()
 
 
 # Address Models (Normalized)
@@ -130,13 +127,49 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subcategories')
+    # Materialized path of ids from the root, e.g. '3/17/42/'; a category's
+    # subtree is every category whose path starts with its own
+    path = models.CharField(max_length=255, default='', editable=False)
     
     class Meta:
         db_table = 'categories'
         verbose_name_plural = 'Categories'
+        indexes = [
+            # Typeahead (api/suggest.py)
+            GinIndex(fields=['name'], name='category_name_trgm', opclasses=['gin_trgm_ops']),
+            # Subtree lookups (path LIKE '3/17/%')
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
     
     def __str__(self):
         return self.name
+    
+    def clean(self):
+        if self.pk and self.parent_id and (
+            self.parent_id == self.pk or
+            (self.path and Category.objects.filter(pk=self.parent_id, path__startswith=self.path).exists())
+        ):
+            raise ValidationError({'parent': 'A category cannot be moved under itself or its subcategories'})
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_path()
+    
+    def update_path(self):
+        """Recompute this category's path and move its subtree along if the parent changed"""
+        old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+        new_path = f'{parent_path}{self.pk}/'
+        if new_path != old_path:
+            Category.objects.filter(pk=self.pk).update(path=new_path)
+            if old_path:
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1))
+                )
+        self.path = new_path
 
 
 # Product Model
@@ -152,25 +185,53 @@ class Product(models.Model):
         ('good', 'Good'),
         ('fair', 'Fair'),
     ])
+    # Running review totals (see api/ratings.py)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Seller's region, denormalized for filtering and display (see refresh_region)
+    province = models.ForeignKey(Province, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='products')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Weighted name (A) + description (B) document, maintained by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         db_table = 'products'
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            # Feed pagination (api.pagination.FeedPagination) per ordering
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['name', 'id']),
+            # Typeahead (api/suggest.py)
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
     
     def __str__(self):
         return self.name
     
     def get_region(self):
-        """Get the region (province) this product belongs to based on seller's default address"""
-        default_address = self.seller.addresses.filter(is_default=True).first()
-        if default_address:
-            return default_address.city.province
-        # If no default address, get any address
-        any_address = self.seller.addresses.first()
-        if any_address:
-            return any_address.city.province
-        return None
+        """Get the region (province) this product belongs to based on seller's location"""
+        return self.province
+    
+    @staticmethod
+    def find_seller_province_id(seller_id):
+        """Province of the seller's business address, else default address, else any address"""
+        province_id = SellerProfile.objects.filter(user_id=seller_id).values_list(
+            'business_address_id__city__province_id', flat=True
+        ).first()
+        if province_id:
+            return province_id
+        return Address.objects.filter(user_id=seller_id).order_by('-is_default', 'id').values_list(
+            'city__province_id', flat=True
+        ).first()
+    
+    @classmethod
+    def refresh_region(cls, seller_id):
+        """Re-derive the region of all of a seller's products after their addresses changed"""
+        province_id = cls.find_seller_province_id(seller_id)
+        cls.objects.filter(seller_id=seller_id).exclude(province_id=province_id).update(
+            province_id=province_id, updated_at=timezone.now()
+        )
 
 
 class ProductImage(models.Model):
@@ -205,11 +266,22 @@ class AuctionListing(models.Model):
     end_time = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='won_auctions')
+    # Bid statistics, updated together with current_price whenever bids are accepted
+    bid_count = models.PositiveIntegerField(default=0)
+    leading_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='leading_auctions')
+    last_bid_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'auction_listings'
+        indexes = [
+            # Feed pagination (api.pagination.FeedPagination) per ordering;
+            # (status, end_time) also serves the closing sweeps
+            models.Index(fields=['status', 'end_time', 'id']),
+            models.Index(fields=['status', 'current_price', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Auction: {self.product.name}"
@@ -225,7 +297,7 @@ class Bid(models.Model):
     auction = models.ForeignKey(AuctionListing, on_delete=models.CASCADE, related_name='bids')
     bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bids')
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
-    bid_time = models.DateTimeField(auto_now_add=True)
+    bid_time = models.DateTimeField(default=timezone.now)  # Set explicitly when bids are persisted in batches
     is_winning = models.BooleanField(default=False)  # Current winning bid
     
     class Meta:
@@ -233,12 +305,43 @@ class Bid(models.Model):
         ordering = ['-bid_time']
         indexes = [
             models.Index(fields=['auction', '-amount']),
+            # Keyset pagination of bid history
+            models.Index(fields=['auction', 'bid_time', 'id']),
+        ]
+        constraints = [
+            # Concurrent bids can never leave an auction with two leaders
+            models.UniqueConstraint(
+                fields=['auction'],
+                condition=models.Q(is_winning=True),
+                name='unique_winning_bid_per_auction'
+            ),
         ]
     
     def __str__(self):
         return f"Bid by {self.bidder.username} on {self.auction.product.name}: ${self.amount}"
 
 
+# Proxy Bid Model
+class ProxyBid(models.Model):
+    """Maximum bid a bidder lets the engine bid up to on their behalf"""
+    auction = models.ForeignKey(AuctionListing, on_delete=models.CASCADE, related_name='proxy_bids')
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='proxy_bids')
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
+    is_active = models.BooleanField(default=True)  # False once outbid or cancelled
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # When max_amount was last set; earlier wins ties
+    
+    class Meta:
+        db_table = 'proxy_bids'
+        unique_together = ['auction', 'bidder']
+        indexes = [
+            models.Index(fields=['auction', 'is_active', '-max_amount']),
+        ]
+    
+    def __str__(self):
+        return f"Proxy bid by {self.bidder.username} on auction {self.auction_id}: up to ${self.max_amount}"
+
+
 # Fixed Price Listing
 class FixedPriceListing(models.Model):
     """Fixed price listing for products (can have quantity)"""
@@ -270,6 +373,11 @@ class FixedPriceListing(models.Model):
     
     class Meta:
         db_table = 'fixed_price_listings'
+        indexes = [
+            # Feed pagination (api.pagination.FeedPagination) per ordering
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['status', 'price', 'id']),
+        ]
     
     def __str__(self):
         return f"Fixed Price: {self.product.name} - ${self.price}"
@@ -349,6 +457,9 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'payment_deadline']),
+        ]
     
     def __str__(self):
         return f"Order {self.order_number} - {self.buyer.username}"
@@ -482,12 +593,6 @@ class Feedback(models.Model):
     
     def __str__(self):
         return f"Feedback by {self.buyer.username} for Order {self.order.order_number}"
-    
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update seller's average rating
-        if hasattr(self.seller, 'seller_profile'):
-            self.seller.seller_profile.update_rating()
 
 
 # Message Model (for buyer-seller communication)
@@ -550,6 +655,7 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     is_sent_via_email = models.BooleanField(default=False)
     email_sent_at = models.DateTimeField(null=True, blank=True)
+    email_failed = models.BooleanField(default=False)  # Email given up on; the pending sweep skips it
     
     # Optional references
     order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
@@ -0,0 +1,169 @@
+"""
+Debounced outbid notifications
+
+A bidder caught in a bidding war used to get one notification and one email
+per outbid. Outbid events are now buffered per (user, auction) in Redis: the
+first one opens a window of settings.OUTBID_DIGEST_WINDOW_SECONDS on the
+deadline scheduler, later ones only bump the count and keep the highest
+price. When the window closes, the send_outbid_digests task drains the user's
+buffer and sends a single notification and email per auction.
+
+Draining renames the buffer aside first, so events arriving meanwhile open a
+new window, and a failed send can be retried without losing anything. Each
+digest is removed from the drained buffer as soon as its email is out, so a
+retry only sends the rest. Failed sends are counted per user so a bad
+address isn't retried forever.
+
+Redis keys:
+    outbid_buffer:<user id>            hash: auction id -> {amount, product_name, count}
+    outbid_buffer:<user id>:draining   buffer being sent
+    outbid_buffer:<user id>:attempts   failed sends of the draining buffer
+"""
+import json
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from . import scheduler
+from .redis_utils import get_redis_connection
+
+# Buffers outlive any sane window, so a lost deadline can't leak memory forever
+BUFFER_TTL_SECONDS = 86400
+
+ADD_SCRIPT = """
+local existing = redis.call('HGET', KEYS[1], ARGV[1])
+local count = 1
+local amount = ARGV[2]
+if existing then
+    local entry = cjson.decode(existing)
+    count = entry.count + 1
+    if tonumber(entry.amount) > tonumber(amount) then
+        amount = entry.amount
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode({amount = amount, product_name = ARGV[3], count = count}))
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+-- NX: later events must not push the window back
+redis.call('ZADD', KEYS[2], 'NX', ARGV[4], ARGV[5])
+return count
+"""
+
+DRAIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+FINISH_SCRIPT = """
+redis.call('DEL', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    -- Events buffered while draining still need their window
+    redis.call('ZADD', KEYS[3], 'NX', ARGV[1], ARGV[2])
+end
+return 1
+"""
+
+
+def buffer_keys(user_id):
+    key = f'outbid_buffer:{user_id}'
+    return [key, f'{key}:draining']
+
+
+def attempts_key(user_id):
+    return f'outbid_buffer:{user_id}:attempts'
+
+
+def window_end():
+    return scheduler.to_millis(timezone.now()) + int(settings.OUTBID_DIGEST_WINDOW_SECONDS * 1000)
+
+
+def notify(user_id, auction_id, new_bid_amount, product_name):
+    """Tell a user they were outbid, debounced unless the window is disabled"""
+    if settings.OUTBID_DIGEST_WINDOW_SECONDS > 0:
+        try:
+            add(user_id, auction_id, new_bid_amount, product_name)
+            return
+        except redis.RedisError as e:
+            print(f"Failed to buffer outbid notification for user {user_id}: {str(e)}")
+
+    from .tasks import notify_outbid_bidder
+    notify_outbid_bidder.delay(
+        user_id=user_id,
+        auction_id=auction_id,
+        new_bid_amount=new_bid_amount,
+        product_name=product_name
+    )
+
+
+def add(user_id, auction_id, new_bid_amount, product_name):
+    """
+    Buffer an outbid event
+
+    Returns:
+        Number of outbids buffered for this (user, auction) in the current window
+    """
+    return get_redis_connection().eval(
+        ADD_SCRIPT, 2, buffer_keys(user_id)[0], scheduler.DEADLINES_KEY,
+        auction_id, str(new_bid_amount), product_name, window_end(),
+        scheduler.member(scheduler.OUTBID_DIGEST, user_id), BUFFER_TTL_SECONDS
+    )
+
+
+def drain(user_ids):
+    """
+    Move the users' buffers aside and read them (one round trip)
+
+    Returns:
+        dict of user id -> {auction id: {'amount', 'product_name', 'count'}}
+    """
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.eval(DRAIN_SCRIPT, 2, *buffer_keys(user_id))
+
+    digests = {}
+    for user_id, fields in zip(user_ids, pipe.execute()):
+        entries = {
+            int(fields[i]): json.loads(fields[i + 1])
+            for i in range(0, len(fields), 2)
+        }
+        if entries:
+            digests[user_id] = entries
+    return digests
+
+
+def finish(user_ids):
+    """Drop drained buffers once their digests are sent"""
+    pipe = get_redis_connection().pipeline(transaction=False)
+    due = window_end()
+    for user_id in user_ids:
+        pipe.eval(
+            FINISH_SCRIPT, 3, *buffer_keys(user_id), scheduler.DEADLINES_KEY,
+            due, scheduler.member(scheduler.OUTBID_DIGEST, user_id)
+        )
+        pipe.delete(attempts_key(user_id))
+    pipe.execute()
+
+
+def mark_sent(user_id, auction_id):
+    """Drop one digest from the user's drained buffer once its email is out"""
+    get_redis_connection().hdel(buffer_keys(user_id)[1], auction_id)
+
+
+def get_attempts(user_ids):
+    """
+    Returns:
+        dict of user id -> failed sends of the user's draining buffer so far
+    """
+    counts = get_redis_connection().mget([attempts_key(user_id) for user_id in user_ids]) if user_ids else []
+    return {user_id: int(count or 0) for user_id, count in zip(user_ids, counts)}
+
+
+def record_failures(user_ids):
+    """Count a failed send for each user's draining buffer"""
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.incr(attempts_key(user_id))
+        pipe.expire(attempts_key(user_id), BUFFER_TTL_SECONDS)
+    pipe.execute()
@@ -0,0 +1,295 @@
+"""
+Keyset pagination
+
+Offset pagination gets slower the deeper a client pages, because the
+database still walks every skipped row. Keyset pagination instead remembers
+the (ordering field, id) of the last row served and seeks straight past it
+using a matching composite index, so every page costs the same.
+
+Cursors are opaque base64 strings. For bid history a client can:
+    ?cursor=<next cursor>   page backwards through history (newest first)
+    ?since=<since cursor>   poll for rows newer than the ones it already has
+                            (oldest first)
+
+Polling can key on a different field than paging (since_field). A
+timestamp taken before the row's transaction commits isn't in commit order,
+so a row can appear behind a since cursor that was already handed out and
+never be polled; bid history polls on the id instead, which bids get under
+the auction's row lock.
+
+The product and listing feeds use FeedPagination, which pages the same way
+in whichever direction ?ordering= asks for, and serves the total count from
+a short-lived cache instead of running COUNT(*) for every page.
+"""
+import base64
+import binascii
+import hashlib
+
+import redis
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .redis_utils import get_redis_connection
+
+INVALID_CURSOR_MESSAGE = 'Invalid cursor'
+
+
+def encode_cursor(value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(f'{value}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor, to_python=parse_datetime):
+    """
+    Args:
+        to_python: converts the encoded ordering value back
+
+    Returns:
+        (value, id) tuple
+
+    Raises:
+        NotFound: if the cursor is malformed
+    """
+    try:
+        value, _, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rpartition('|')
+        value = to_python(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError, ValidationError):
+        raise NotFound(INVALID_CURSOR_MESSAGE)
+    if value is None:
+        raise NotFound(INVALID_CURSOR_MESSAGE)
+    return value, pk
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination on (ordering_field, id), polling on (since_field, id)"""
+    ordering_field = 'created_at'
+    since_field = None  # defaults to ordering_field
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        field = self.ordering_field
+
+        since = request.query_params.get(self.since_query_param)
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.polling = bool(since)
+        if since:
+            field = self.get_since_field()
+            value, pk = decode_cursor(since, queryset.model._meta.get_field(field).to_python)
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+            ).order_by(field, 'id')
+        else:
+            if cursor:
+                value, pk = decode_cursor(cursor)
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+                )
+            queryset = queryset.order_by(f'-{field}', '-id')
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+
+        # Cursor for the next poll: the newest row the client has after this page
+        self.since = since
+        if self.page and (since or not cursor):
+            if since:
+                newest = self.page[-1]
+            else:
+                since_field = self.get_since_field()
+                newest = max(self.page, key=lambda row: (getattr(row, since_field), row.id))
+            self.since = self.encode(newest, self.get_since_field())
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_since_field(self):
+        return self.since_field or self.ordering_field
+
+    def encode(self, row, field=None):
+        return encode_cursor(getattr(row, field or self.ordering_field), row.id)
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.polling:
+            return replace_query_param(url, self.since_query_param, self.encode(self.page[-1], self.get_since_field()))
+        cursor = self.encode(self.page[-1])
+        return replace_query_param(remove_query_param(url, self.since_query_param), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'since': self.since,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'since': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class BidHistoryPagination(KeysetPagination):
+    """
+    Bid history of one auction, backed by the (auction, bid_time, id) index
+
+    bid_time is taken before the auction row is locked (and ledger bids are
+    written with their acceptance time), so polling keys on the id.
+    """
+    ordering_field = 'bid_time'
+    since_field = 'id'
+    page_size = 100
+    max_page_size = 1000
+
+
+class FeedPagination(BasePagination):
+    """
+    Keyset pagination for the product and listing feeds
+
+    Pages on (ordering field, id) for any of the view's ordering_fields, in
+    either direction, and on search relevance when ?search= is given without
+    ?ordering=. Each supported ordering has a matching composite index.
+
+    The response keeps the page-number paginator's shape ({'count', 'next',
+    'results'}), but count comes from a cache keyed by the filters, so it may
+    lag behind by up to settings.FEED_COUNT_CACHE_SECONDS. There is no
+    'previous', and ?page= is rejected rather than silently serving page 1.
+
+    Redis keys:
+        feed_count:<sha1 of path, filters and user>   total matching rows
+    """
+    default_ordering = '-created_at'
+    relevance_field = 'search_rank'
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    # Parameters that don't change which rows match
+    non_filter_params = {'cursor', 'page_size', 'ordering', 'format'}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if 'page' in request.query_params:
+            raise ParseError('Page numbers are not supported; follow the next link instead.')
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+
+        descending, field = self.get_ordering(queryset, request, view)
+        self.field = field
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = decode_cursor(cursor, self.get_converter(queryset, field))
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': pk})
+            )
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset, request, view):
+        """
+        Returns:
+            (descending, field) tuple
+        """
+        ordering = None
+        if OrderingFilter.ordering_param in request.query_params:
+            # Validated against the view's ordering_fields
+            ordering = (OrderingFilter().get_ordering(request, queryset, view) or [None])[0]
+        if ordering is None and self.relevance_field in queryset.query.annotations:
+            ordering = f'-{self.relevance_field}'
+        ordering = ordering or self.default_ordering
+        return ordering.startswith('-'), ordering.lstrip('-')
+
+    def get_converter(self, queryset, field):
+        try:
+            return queryset.model._meta.get_field(field).to_python
+        except FieldDoesNotExist:
+            # Annotations such as search_rank are floats
+            return float
+
+    def get_count(self, queryset, request):
+        params = sorted(
+            (key, value) for key, value in request.query_params.lists()
+            if key not in self.non_filter_params
+        )
+        user_id = request.user.pk if request.user.is_authenticated else None
+        digest = hashlib.sha1(repr((request.path, params, user_id)).encode()).hexdigest()
+        key = f'feed_count:{digest}'
+
+        try:
+            cached = get_redis_connection().get(key)
+        except redis.RedisError as e:
+            print(f"Failed to read feed count: {str(e)}")
+            cached = None
+        if cached is not None:
+            return int(cached)
+
+        count = queryset.order_by().count()
+        try:
+            get_redis_connection().set(key, count, ex=settings.FEED_COUNT_CACHE_SECONDS)
+        except redis.RedisError as e:
+            print(f"Failed to cache feed count: {str(e)}")
+        return count
+
+    def get_next_link(self):
+        if not self.has_more:
+            return None
+        row = self.page[-1]
+        cursor = encode_cursor(getattr(row, self.field), row.id)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,154 @@
+"""
+Running rating totals
+
+Product ratings used to be summed in Python from every review on each read,
+and a seller's rating was re-aggregated from all their feedback (exists,
+aggregate, count) on every Feedback.save(). Both now keep running totals:
+
+    Product         rating_sum, rating_count
+    SellerProfile   rating_sum, total_feedbacks and the derived average_rating
+
+which are adjusted by one atomic F() UPDATE whenever a review or feedback is
+created, edited or deleted (see signals), in the same transaction as the
+change itself.
+
+The totals only drift if rows are changed behind the ORM's back (raw SQL,
+QuerySet.update()); rebuild_product_ratings() and rebuild_seller_ratings()
+recompute them with one GROUP BY pass per table (rebuild_ratings command,
+SellerProfile admin action).
+"""
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
+
+from .models import Product, SellerProfile
+
+RATING_DECIMAL = models.DecimalField(max_digits=12, decimal_places=2)
+
+# Only rows whose totals are wrong are written, so a rebuild leaves
+# updated_at (and with it ETags) alone wherever nothing drifted
+RESET_PRODUCTS_SQL = """
+UPDATE products SET rating_sum = 0, rating_count = 0, updated_at = %s
+WHERE rating_count <> 0
+    AND NOT EXISTS (SELECT 1 FROM product_reviews WHERE product_id = products.id) {products}
+"""
+
+FILL_PRODUCTS_SQL = """
+UPDATE products SET rating_sum = r.rating_sum, rating_count = r.rating_count, updated_at = %s
+FROM (
+    SELECT product_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count
+    FROM product_reviews GROUP BY product_id
+) AS r
+WHERE products.id = r.product_id
+    AND (products.rating_sum <> r.rating_sum OR products.rating_count <> r.rating_count) {products}
+"""
+
+RESET_SELLERS_SQL = """
+UPDATE seller_profiles SET rating_sum = 0, total_feedbacks = 0, average_rating = 0, updated_at = %s
+WHERE (total_feedbacks <> 0 OR rating_sum <> 0 OR average_rating <> 0)
+    AND NOT EXISTS (SELECT 1 FROM feedbacks WHERE seller_id = seller_profiles.user_id) {sellers}
+"""
+
+FILL_SELLERS_SQL = """
+UPDATE seller_profiles SET
+    rating_sum = f.rating_sum,
+    total_feedbacks = f.rating_count,
+    average_rating = f.average_rating,
+    updated_at = %s
+FROM (
+    SELECT seller_id, SUM(seller_rating) AS rating_sum, COUNT(*) AS rating_count,
+        ROUND(CAST(SUM(seller_rating) AS NUMERIC) / COUNT(*), 2) AS average_rating
+    FROM feedbacks GROUP BY seller_id
+) AS f
+WHERE seller_profiles.user_id = f.seller_id
+    AND (seller_profiles.rating_sum <> f.rating_sum OR seller_profiles.total_feedbacks <> f.rating_count
+         OR seller_profiles.average_rating <> f.average_rating) {sellers}
+"""
+
+
+def rating_average(rating_sum, rating_count):
+    """SQL expression for round(sum / count, 2), 0 when there are no ratings"""
+    return Coalesce(
+        Round(Cast(rating_sum, RATING_DECIMAL) / Cast(NullIf(rating_count, 0), RATING_DECIMAL), 2),
+        Value(Decimal('0.00')),
+        output_field=SellerProfile._meta.get_field('average_rating'),
+    )
+
+
+def adjust_product_rating(product_id, rating_delta, count_delta):
+    """
+    Apply a review insert (+rating, +1), edit (new - old, 0) or delete
+    (-rating, -1) to the product's totals
+    """
+    Product.objects.filter(id=product_id).update(
+        rating_sum=F('rating_sum') + rating_delta,
+        rating_count=F('rating_count') + count_delta,
+        # Ratings are part of the product's representation
+        updated_at=timezone.now(),
+    )
+
+
+def adjust_seller_rating(seller_id, rating_delta, count_delta):
+    """Same as adjust_product_rating, for feedback on a seller"""
+    rating_sum = F('rating_sum') + rating_delta
+    total_feedbacks = F('total_feedbacks') + count_delta
+    SellerProfile.objects.filter(user_id=seller_id).update(
+        rating_sum=rating_sum,
+        total_feedbacks=total_feedbacks,
+        average_rating=rating_average(rating_sum, total_feedbacks),
+        # Same as products: the rating is part of the profile's representation
+        updated_at=timezone.now(),
+    )
+
+
+def _id_filter(column, ids):
+    if ids is None:
+        return '', []
+    ids = list(ids)
+    if not ids:
+        return 'AND FALSE', []
+    return f"AND {column} IN ({', '.join(['%s'] * len(ids))})", ids
+
+
+def rebuild_product_ratings(product_ids=None):
+    """
+    Recompute product totals from the reviews table
+
+    Args:
+        product_ids: limit to these products (default: all)
+
+    Returns:
+        Number of products corrected
+    """
+    where, ids = _id_filter('products.id', product_ids)
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Hold off review writes so their increments can't be lost or doubled
+        cursor.execute('LOCK TABLE product_reviews IN SHARE MODE')
+        cursor.execute(RESET_PRODUCTS_SQL.format(products=where), [now] + ids)
+        corrected = cursor.rowcount
+        cursor.execute(FILL_PRODUCTS_SQL.format(products=where), [now] + ids)
+        return corrected + cursor.rowcount
+
+
+def rebuild_seller_ratings(seller_ids=None):
+    """
+    Recompute seller totals and averages from the feedbacks table
+
+    Args:
+        seller_ids: limit to these seller users (default: all)
+
+    Returns:
+        Number of seller profiles corrected
+    """
+    where, ids = _id_filter('seller_profiles.user_id', seller_ids)
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('LOCK TABLE feedbacks IN SHARE MODE')
+        cursor.execute(RESET_SELLERS_SQL.format(sellers=where), [now] + ids)
+        corrected = cursor.rowcount
+        cursor.execute(FILL_SELLERS_SQL.format(sellers=where), [now] + ids)
+        return corrected + cursor.rowcount
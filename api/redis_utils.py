@@ -0,0 +1,20 @@
+"""
+Redis helpers shared by the real-time auction features
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis_connection():
+    """
+    Get the process-wide Redis client
+
+    The client keeps its own connection pool, so it is safe to share
+    between threads (Django request threads, Channels sync workers, Celery).
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
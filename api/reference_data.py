@@ -0,0 +1,106 @@
+"""
+Reference data bundle
+
+Provinces, cities and categories hardly ever change (they're seeded by
+populate_locations and populate_categories), yet every app start fetched
+them page by page from the database. They're now served together from
+/api/reference/ as one JSON document, built ahead of time and held in
+process memory, with a hash of its content as the version and ETag.
+
+The bundle is built when the server starts. A committed change to any of
+the three tables only marks it stale: the process that made the change
+drops its bundle and deletes the published version from Redis, and the
+next request rebuilds it and publishes the new version. Other processes
+compare against the published version at most every
+settings.REFERENCE_DATA_CHECK_SECONDS and rebuild when it differs or is
+missing.
+
+Redis keys:
+    reference_data:version   version of the most recently built bundle
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError
+
+from . import category_tree
+from .models import City, Province
+from .redis_utils import get_redis_connection
+from .serializers import CitySerializer, ProvinceSerializer
+
+VERSION_KEY = 'reference_data:version'
+
+Bundle = namedtuple('Bundle', ['version', 'body'])
+
+_bundle = None
+_checked_at = 0
+_lock = threading.Lock()
+
+
+def build():
+    data = {
+        'provinces': ProvinceSerializer(Province.objects.order_by('id'), many=True).data,
+        'cities': CitySerializer(City.objects.select_related('province').order_by('id'), many=True).data,
+        'categories': category_tree.build_tree(),
+    }
+    content = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    version = hashlib.sha256(content.encode()).hexdigest()[:32]
+    body = json.dumps({'version': version, **data}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return Bundle(version, body.encode())
+
+
+def get_bundle():
+    """
+    Returns:
+        The current Bundle (version, pre-rendered JSON body)
+    """
+    global _bundle, _checked_at
+    with _lock:
+        if _bundle is not None and time.monotonic() - _checked_at < settings.REFERENCE_DATA_CHECK_SECONDS:
+            return _bundle
+
+        try:
+            published = get_redis_connection().get(VERSION_KEY)
+        except redis.RedisError as e:
+            print(f"Failed to read reference data version: {str(e)}")
+            published = _bundle.version.encode() if _bundle else None
+
+        if _bundle is None or published != _bundle.version.encode():
+            # Changed elsewhere, or invalidated: rebuild once, on demand
+            _bundle = build()
+            if published != _bundle.version.encode():
+                _publish(_bundle.version)
+        _checked_at = time.monotonic()
+        return _bundle
+
+
+def invalidate():
+    """Mark the bundle stale here and in every other process; rebuilt on next use"""
+    global _bundle
+    with _lock:
+        _bundle = None
+    try:
+        get_redis_connection().delete(VERSION_KEY)
+    except redis.RedisError as e:
+        print(f"Failed to invalidate reference data version: {str(e)}")
+
+
+def warm():
+    """Build the bundle at server start; skipped if the database isn't ready yet"""
+    try:
+        get_bundle()
+    except DatabaseError as e:
+        print(f"Failed to build reference data: {str(e)}")
+
+
+def _publish(version):
+    try:
+        get_redis_connection().set(VERSION_KEY, version)
+    except redis.RedisError as e:
+        print(f"Failed to publish reference data version: {str(e)}")
@@ -0,0 +1,148 @@
+"""
+Response cache for anonymous browsing
+
+The public browse endpoints (products, auctions and listings, and the
+category pages built from them) were queried and serialized again for every
+visitor. For anonymous JSON GETs, the serialized data is now kept in the
+Django cache (Redis, settings.CACHES), keyed on the URL with its query
+parameters normalized.
+
+Every entry is tagged with the objects it contains ('product:12',
+'seller:5', ...) and with its collection ('product', 'listing', 'auction'),
+which changes whenever a row is added, removed or saved. Model signals
+bump a tag's version on commit, and an entry only counts as a hit while all
+its tags are still at the versions it was built with. Writes that bypass
+signals (bids, bulk auction closing) invalidate their tags explicitly.
+settings.RESPONSE_CACHE_SECONDS bounds anything that slips through.
+
+When a popular entry is missing, only one request recomputes it. The others
+wait up to settings.RESPONSE_CACHE_WAIT_SECONDS for it to be stored.
+
+Cache keys:
+    response:<sha1 of URL>        {'data', 'validators', 'tags': {tag: version}}
+    response_tag:<tag>            tag version, bumped to invalidate
+    response_lock:<sha1 of URL>   held while one request recomputes the entry
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+# Versions must outlive every entry built against them, or a reset version
+# could match an old entry again
+TAG_TIMEOUT_SECONDS = 24 * 60 * 60
+
+WAIT_INTERVAL_SECONDS = 0.05
+
+
+def cache_key(request):
+    """Key for the request's URL; parameter order and empty parameters don't matter"""
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+    url = f'{request.build_absolute_uri(request.path)}?{urlencode(params)}'
+    return f'response:{hashlib.sha1(url.encode()).hexdigest()}'
+
+
+def tag_key(tag):
+    return f'response_tag:{tag}'
+
+
+def lock_key(key):
+    return f'response_lock:{key.split(":", 1)[1]}'
+
+
+def product_tags(product):
+    """Tags for a Product instance"""
+    return [f'product:{product.id}', f'seller:{product.seller_id}', f'category:{product.category_id}']
+
+
+def get_versions(tags):
+    found = cache.get_many([tag_key(tag) for tag in tags])
+    return {tag: found.get(tag_key(tag), 0) for tag in tags}
+
+
+def current_versions(tags):
+    """Tag versions right now, or None if they can't be read"""
+    try:
+        return get_versions(tags)
+    except redis.RedisError as e:
+        print(f"Failed to read response cache tags: {str(e)}")
+        return None
+
+
+def get(key):
+    """
+    Returns:
+        The entry for key if none of its tags changed since it was stored, else None
+    """
+    try:
+        entry = cache.get(key)
+        if entry and get_versions(entry['tags']) == entry['tags']:
+            return entry
+    except redis.RedisError as e:
+        print(f"Failed to read cached response: {str(e)}")
+    return None
+
+
+def store(key, data, validators, versions):
+    """
+    Args:
+        versions: {tag: version} for every tag the data depends on, read
+            before the data was computed
+    """
+    try:
+        cache.set(
+            key, {'data': data, 'validators': validators, 'tags': versions},
+            timeout=settings.RESPONSE_CACHE_SECONDS,
+        )
+    except redis.RedisError as e:
+        print(f"Failed to cache response: {str(e)}")
+
+
+def acquire(key):
+    """Claim the recomputation of a missing entry; False if another request has it"""
+    try:
+        return cache.add(lock_key(key), 1, timeout=settings.RESPONSE_CACHE_LOCK_SECONDS)
+    except redis.RedisError as e:
+        print(f"Failed to lock cached response: {str(e)}")
+        return True
+
+
+def release(key):
+    try:
+        cache.delete(lock_key(key))
+    except redis.RedisError as e:
+        print(f"Failed to unlock cached response: {str(e)}")
+
+
+def wait(key):
+    """
+    Wait for the request holding the lock to store the entry
+
+    Returns:
+        The entry, or None if it didn't appear in time
+    """
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL_SECONDS)
+        entry = get(key)
+        if entry:
+            return entry
+    return None
+
+
+def invalidate(*tags):
+    """Drop every entry tagged with any of the tags"""
+    try:
+        for tag in tags:
+            cache.add(tag_key(tag), 0, timeout=TAG_TIMEOUT_SECONDS)
+            cache.incr(tag_key(tag))
+    except (redis.RedisError, ValueError) as e:
+        # ValueError: the version expired between add and incr
+        print(f"Failed to invalidate cached responses {tags}: {str(e)}")
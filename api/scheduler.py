@@ -0,0 +1,92 @@
+"""
+Exact-time deadline scheduler
+
+Every upcoming deadline (auction end, order payment deadline, discount
+start/end, outbid digest) is a member of one Redis sorted set, scored by its due time in
+epoch milliseconds. The dispatch_deadlines Celery task polls the set every
+second, atomically pops what is due and hands each kind to its batch handler,
+so nothing has to scan the tables to find the next thing to do.
+
+Deadlines are (re)scheduled from post_save signals. Scheduling is idempotent:
+saving an object again simply moves its member to the new time. Handlers
+always re-check the database, so a stale member is harmless. The periodic
+sweeps in tasks.py remain as a reconciliation safety net if Redis loses data.
+
+Redis keys:
+    deadlines    sorted set of '<kind>:<id>' members scored by due time (ms)
+"""
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .redis_utils import get_redis_connection
+
+DEADLINES_KEY = 'deadlines'
+
+AUCTION_END = 'auction_end'
+PAYMENT_DEADLINE = 'payment_deadline'
+DISCOUNT_START = 'discount_start'
+DISCOUNT_END = 'discount_end'
+OUTBID_DIGEST = 'outbid_digest'  # id is the user to notify
+
+# Max members handed to the handlers per dispatch
+DISPATCH_BATCH_SIZE = 500
+
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def member(kind, object_id):
+    return f'{kind}:{object_id}'
+
+
+def to_millis(value):
+    return int(value.timestamp() * 1000)
+
+
+def schedule(kind, object_id, when):
+    """Schedule (or move) a deadline"""
+    client = get_redis_connection()
+    client.zadd(DEADLINES_KEY, {member(kind, object_id): to_millis(when)})
+
+
+def schedule_many(entries):
+    """
+    Schedule deadlines in one round trip
+
+    Args:
+        entries: iterable of (kind, object_id, when) tuples
+    """
+    mapping = {member(kind, object_id): to_millis(when) for kind, object_id, when in entries}
+    if mapping:
+        get_redis_connection().zadd(DEADLINES_KEY, mapping)
+    return len(mapping)
+
+
+def cancel(kind, object_id):
+    """Remove a deadline that no longer applies"""
+    get_redis_connection().zrem(DEADLINES_KEY, member(kind, object_id))
+
+
+def pop_due(now=None, limit=DISPATCH_BATCH_SIZE):
+    """
+    Atomically remove and return the deadlines that are due
+
+    Returns:
+        dict of kind -> list of object ids
+    """
+    now = now or timezone.now()
+    client = get_redis_connection()
+    members = client.eval(POP_DUE_SCRIPT, 1, DEADLINES_KEY, to_millis(now), limit)
+
+    due = defaultdict(list)
+    for raw in members:
+        kind, _, object_id = raw.decode().partition(':')
+        due[kind].append(int(object_id))
+    return due
+
@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Value
 from .models import (
     Province, City, Address, Category, Product, ProductImage,
-    AuctionListing, Bid, FixedPriceListing, Order, Payment,
+    AuctionListing, Bid, ProxyBid, FixedPriceListing, Order, Payment,
     Feedback, Conversation, Message, Notification, Complaint, Wishlist, SellerProfile, ProductReview,
     Cart, CartItem, OrderItem, SellerTransfer
 )
@@ -157,6 +158,9 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'parent', 'subcategories']
     
     def get_subcategories(self, obj):
+        subcategories = self.context.get('subcategories')
+        if subcategories is not None:
+            return subcategories.get(obj.id, [])
         if obj.subcategories.exists():
             return CategorySerializer(obj.subcategories.all(), many=True).data
         return []
@@ -196,6 +200,20 @@ class ProductSerializer(serializers.ModelSerializer):
                   'is_in_wishlist', 'created_at', 'updated_at']
         read_only_fields = ['seller', 'created_at', 'updated_at']
     
+    @staticmethod
+    def setup_eager_loading(queryset, request):
+        """
+        Load everything this serializer reads along with the products, so a
+        page costs a fixed number of queries instead of several per product
+        """
+        if request and request.user.is_authenticated:
+            in_wishlist = Exists(Wishlist.objects.filter(user=request.user, product=OuterRef('pk')))
+        else:
+            in_wishlist = Value(False)
+        return queryset.select_related(
+            'seller__seller_profile', 'category', 'province', 'auction', 'fixed_price'
+        ).prefetch_related('images').annotate(in_wishlist=in_wishlist)
+    
     def get_listing_type(self, obj):
         if hasattr(obj, 'auction'):
             return 'auction'
@@ -205,16 +223,14 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def get_average_rating(self, obj):
         """Only for fixed-price products"""
-        if hasattr(obj, 'fixed_price'):
-            reviews = obj.reviews.all()
-            if reviews.exists():
-                return round(sum(r.rating for r in reviews) / reviews.count(), 2)
+        if hasattr(obj, 'fixed_price') and obj.rating_count:
+            return round(obj.rating_sum / obj.rating_count, 2)
         return None
     
     def get_total_reviews(self, obj):
         """Only for fixed-price products"""
         if hasattr(obj, 'fixed_price'):
-            return obj.reviews.count()
+            return obj.rating_count
         return 0
     
     def get_seller_profile(self, obj):
@@ -240,6 +256,8 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def get_is_in_wishlist(self, obj):
         """Check if the product is in the current user's wishlist"""
+        if hasattr(obj, 'in_wishlist'):
+            return obj.in_wishlist
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Wishlist.objects.filter(user=request.user, product=obj).exists()
@@ -289,7 +307,8 @@ class AuctionListingSerializer(serializers.ModelSerializer):
     winner_username = serializers.CharField(source='winner.username', read_only=True)
     winner_email = serializers.SerializerMethodField()
     latest_bids = serializers.SerializerMethodField()
-    total_bids = serializers.SerializerMethodField()
+    total_bids = serializers.IntegerField(source='bid_count', read_only=True)
+    leading_bidder_username = serializers.CharField(source='leading_bidder.username', read_only=True)
     time_remaining = serializers.SerializerMethodField()
     winning_bid_amount = serializers.SerializerMethodField()
     order_info = serializers.SerializerMethodField()
@@ -298,8 +317,9 @@ class AuctionListingSerializer(serializers.ModelSerializer):
         model = AuctionListing
         fields = ['id', 'product', 'starting_price', 'current_price',
                   'start_time', 'end_time', 'status', 'winner', 'winner_username', 'winner_email',
-                  'latest_bids', 'total_bids', 'time_remaining', 'winning_bid_amount', 'order_info', 'created_at']
-        read_only_fields = ['current_price', 'status', 'winner', 'created_at']
+                  'latest_bids', 'total_bids', 'leading_bidder_username', 'last_bid_at',
+                  'time_remaining', 'winning_bid_amount', 'order_info', 'created_at']
+        read_only_fields = ['current_price', 'status', 'winner', 'last_bid_at', 'created_at']
     
     def get_winner_email(self, obj):
         """Only show winner email to the seller"""
@@ -309,12 +329,12 @@ class AuctionListingSerializer(serializers.ModelSerializer):
         return None
     
     def get_latest_bids(self, obj):
-        bids = obj.bids.select_related('bidder').order_by('-bid_time')[:5]
+        # Lists prefetch the latest bids of every auction in one query
+        bids = getattr(obj, 'latest_bid_list', None)
+        if bids is None:
+            bids = obj.bids.select_related('bidder').order_by('-bid_time')[:5]
         return BidSerializer(bids, many=True).data
     
-    def get_total_bids(self, obj):
-        return obj.bids.count()
-    
     def get_time_remaining(self, obj):
         if obj.is_active():
             from django.utils import timezone
@@ -324,10 +344,9 @@ class AuctionListingSerializer(serializers.ModelSerializer):
     
     def get_winning_bid_amount(self, obj):
         """Get the winning bid amount"""
-        if obj.winner:
-            winning_bid = obj.bids.filter(bidder=obj.winner, is_winning=True).first()
-            if winning_bid:
-                return str(winning_bid.amount)
+        # The winner is the leading bidder at close, and the leading bid sets current_price
+        if obj.winner_id and obj.winner_id == obj.leading_bidder_id:
+            return str(obj.current_price)
         return None
     
     def get_order_info(self, obj):
@@ -474,38 +493,18 @@ class AuctionCreateSerializer(serializers.ModelSerializer):
 
 
 class BidCreateSerializer(serializers.ModelSerializer):
+    """Validates the bid payload; placement happens in bidding.place_bid"""
     class Meta:
         model = Bid
         fields = ['amount']
-    
-    def validate_amount(self, value):
-        auction = self.context['auction']
-        if value <= auction.current_price:
-            raise serializers.ValidationError(
-                f"Bid must be higher than current price of {auction.current_price}"
-            )
-        return value
-    
-    def create(self, validated_data):
-        auction = self.context['auction']
-        user = self.context['request'].user
-        
-        # Mark previous winning bids as not winning
-        Bid.objects.filter(auction=auction, is_winning=True).update(is_winning=False)
-        
-        # Create new bid
-        bid = Bid.objects.create(
-            auction=auction,
-            bidder=user,
-            is_winning=True,
-            **validated_data
-        )
-        
-        # Update auction current price
-        auction.current_price = bid.amount
-        auction.save()
-        
-        return bid
+
+
+class ProxyBidSerializer(serializers.ModelSerializer):
+    """Maximum bid payload; placement happens in bidding.place_proxy_bid"""
+    class Meta:
+        model = ProxyBid
+        fields = ['id', 'auction', 'max_amount', 'is_active', 'updated_at']
+        read_only_fields = ['auction', 'is_active', 'updated_at']
 
 
 # Fixed Price Listing Serializers
@@ -0,0 +1,318 @@
+"""
+Model signal handlers
+"""
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import (
+    auction_snapshot, bid_engine, bid_events, category_tree, ratings, reference_data, response_cache, scheduler,
+    token_cache,
+)
+from .models import (
+    Address, AuctionListing, Category, City, Feedback, Order, FixedPriceListing, Product, ProductImage,
+    ProductReview, Province, SellerProfile, User
+)
+
+
+def _schedule_on_commit(updates):
+    """
+    Apply deadline changes once the row is committed
+
+    Args:
+        updates: list of (kind, object_id, when) tuples; when=None cancels
+    """
+    def apply():
+        try:
+            for kind, object_id, when in updates:
+                if when is None:
+                    scheduler.cancel(kind, object_id)
+                else:
+                    scheduler.schedule(kind, object_id, when)
+        except redis.RedisError as e:
+            # The reconciliation sweeps will still pick these up
+            print(f"Failed to schedule deadlines {updates}: {str(e)}")
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=AuctionListing)
+def schedule_auction_end(sender, instance, **kwargs):
+    """Close the auction exactly at its end time"""
+    when = instance.end_time if instance.status == 'active' else None
+    _schedule_on_commit([(scheduler.AUCTION_END, instance.id, when)])
+
+
+@receiver(post_save, sender=AuctionListing)
+def sync_bid_ledger(sender, instance, created, **kwargs):
+    """Push status and timing edits to the auction's Redis ledger, if it has one"""
+    if created or not bid_engine.is_enabled():
+        return
+
+    def apply():
+        try:
+            bid_engine.sync_auction(instance)
+        except redis.RedisError as e:
+            print(f"Failed to sync bid ledger for auction {instance.id}: {str(e)}")
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=AuctionListing)
+def announce_new_auction(sender, instance, created, **kwargs):
+    """Let multiplexed feeds following the category pick up the new auction"""
+    if not created or instance.status != 'active':
+        return
+    category_id = instance.product.category_id
+    if not category_id:
+        return
+
+    def announce():
+        channel_layer = get_channel_layer()
+        if channel_layer:
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    f'auction_lobby_{category_id}',
+                    {'type': 'auction_listed', 'auction_id': instance.id}
+                )
+            except redis.RedisError as e:
+                print(f"Failed to announce auction {instance.id}: {str(e)}")
+
+    transaction.on_commit(announce)
+
+
+def invalidate_snapshot_on_commit(auction_id, reset_events=False):
+    """Drop the auction's WebSocket snapshot once the edit is committed"""
+    def apply():
+        try:
+            auction_snapshot.invalidate(auction_id)
+            if reset_events:
+                # Reconnecting clients can't replay past an edit; they need a snapshot
+                bid_events.append(auction_id, bid_events.RESET, {})
+        except redis.RedisError as e:
+            print(f"Failed to invalidate auction snapshot {auction_id}: {str(e)}")
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=AuctionListing)
+def invalidate_auction_snapshot(sender, instance, created, **kwargs):
+    """Rebuild the WebSocket connect payload after direct edits (admin, views)"""
+    invalidate_snapshot_on_commit(instance.id, reset_events=not created)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_auction_snapshot(sender, instance, created, **kwargs):
+    if created:
+        return
+    auction_id = AuctionListing.objects.filter(product=instance).values_list('id', flat=True).first()
+    if auction_id:
+        invalidate_snapshot_on_commit(auction_id)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_image_auction_snapshot(sender, instance, **kwargs):
+    auction_id = AuctionListing.objects.filter(
+        product_id=instance.product_id
+    ).values_list('id', flat=True).first()
+    if auction_id:
+        invalidate_snapshot_on_commit(auction_id)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product_on_image_change(sender, instance, **kwargs):
+    """Images are part of the product, so they count as a product change (ETags)"""
+    Product.objects.filter(id=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Order)
+def schedule_payment_deadline(sender, instance, **kwargs):
+    """Expire the order exactly at its payment deadline"""
+    when = instance.payment_deadline if instance.status == 'pending_payment' else None
+    _schedule_on_commit([(scheduler.PAYMENT_DEADLINE, instance.id, when)])
+
+
+@receiver(post_save, sender=FixedPriceListing)
+def schedule_discount_window(sender, instance, **kwargs):
+    """Refresh the listing exactly when its discount starts and ends"""
+    now = timezone.now()
+    start = instance.discount_start_date
+    end = instance.discount_end_date
+    if not instance.discount_percentage or not start or not end:
+        start = end = None
+
+    _schedule_on_commit([
+        (scheduler.DISCOUNT_START, instance.id, start if start and start > now else None),
+        (scheduler.DISCOUNT_END, instance.id, end if end and end > now else None),
+    ])
+
+
+def invalidate_user_tokens_on_commit(user_ids):
+    """Drop cached token lookups once the users' new state is committed"""
+    user_ids = list(user_ids)
+
+    def apply():
+        try:
+            token_cache.invalidate_users(user_ids)
+        except redis.RedisError as e:
+            print(f"Failed to invalidate cached tokens for users {user_ids}: {str(e)}")
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Blocking, role changes and deactivation must reach token auth right away"""
+    if not created:
+        invalidate_user_tokens_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Logout deletes the token; stop accepting it"""
+    def apply():
+        try:
+            token_cache.invalidate_token(instance.key)
+        except redis.RedisError as e:
+            print(f"Failed to invalidate cached token: {str(e)}")
+
+    transaction.on_commit(apply)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    transaction.on_commit(category_tree.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Province)
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_reference_data(sender, instance, **kwargs):
+    """Mark the bundle stale once per transaction, however many rows it touches"""
+    pending = transaction.get_connection().run_on_commit
+    if any(callback is reference_data.invalidate for _, callback, *_ in pending):
+        return
+    transaction.on_commit(reference_data.invalidate)
+
+
+@receiver(pre_save, sender=Product)
+def set_product_region(sender, instance, **kwargs):
+    """New products inherit the seller's region"""
+    if instance._state.adding and instance.province_id is None:
+        instance.province_id = Product.find_seller_province_id(instance.seller_id)
+
+
+@receiver([post_save, post_delete], sender=Address)
+def refresh_region_on_address_change(sender, instance, **kwargs):
+    """A seller's region follows their business and default addresses"""
+    Product.refresh_region(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Address)
+def touch_seller_profile_on_address_change(sender, instance, **kwargs):
+    """Seller profiles embed the business address, so it counts as a profile change (ETags)"""
+    SellerProfile.objects.filter(user_id=instance.user_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=SellerProfile)
+def refresh_region_on_business_address_change(sender, instance, update_fields=None, **kwargs):
+    # The FK field is itself named business_address_id; save() also accepts its attname
+    if update_fields is not None and not {'business_address_id', 'business_address_id_id'} & update_fields:
+        return
+    Product.refresh_region(instance.user_id)
+
+
+def _previous_rating(sender, instance, field):
+    """The rating stored before this save, None for new rows"""
+    if instance._state.adding:
+        return None
+    return sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._previous_rating = _previous_rating(sender, instance, 'rating')
+
+
+@receiver(post_save, sender=ProductReview)
+def count_review_rating(sender, instance, created, **kwargs):
+    """Keep the product's running rating totals current"""
+    previous = getattr(instance, '_previous_rating', None)
+    if created:
+        ratings.adjust_product_rating(instance.product_id, instance.rating, 1)
+    elif previous is not None and instance.rating != previous:
+        ratings.adjust_product_rating(instance.product_id, instance.rating - previous, 0)
+
+
+@receiver(post_delete, sender=ProductReview)
+def uncount_review_rating(sender, instance, **kwargs):
+    ratings.adjust_product_rating(instance.product_id, -instance.rating, -1)
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_feedback_rating(sender, instance, **kwargs):
+    instance._previous_rating = _previous_rating(sender, instance, 'seller_rating')
+
+
+@receiver(post_save, sender=Feedback)
+def count_feedback_rating(sender, instance, created, **kwargs):
+    """Keep the seller's running rating totals and average current"""
+    previous = getattr(instance, '_previous_rating', None)
+    if created:
+        ratings.adjust_seller_rating(instance.seller_id, instance.seller_rating, 1)
+    elif previous is not None and instance.seller_rating != previous:
+        ratings.adjust_seller_rating(instance.seller_id, instance.seller_rating - previous, 0)
+
+
+@receiver(post_delete, sender=Feedback)
+def uncount_feedback_rating(sender, instance, **kwargs):
+    ratings.adjust_seller_rating(instance.seller_id, -instance.seller_rating, -1)
+
+
+def invalidate_responses_on_commit(*tags):
+    """Drop cached responses with any of the tags once the change is committed"""
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    invalidate_responses_on_commit('product', f'product:{instance.id}')
+
+
+@receiver([post_save, post_delete], sender=AuctionListing)
+def invalidate_auction_responses(sender, instance, **kwargs):
+    invalidate_responses_on_commit('auction', f'auction:{instance.id}')
+
+
+@receiver([post_save, post_delete], sender=FixedPriceListing)
+def invalidate_listing_responses(sender, instance, **kwargs):
+    invalidate_responses_on_commit('listing', f'listing:{instance.id}')
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductReview)
+def invalidate_product_detail_responses(sender, instance, **kwargs):
+    """Images and rating totals are part of the product's payload"""
+    invalidate_responses_on_commit(f'product:{instance.product_id}')
+
+
+@receiver([post_save, post_delete], sender=SellerProfile)
+@receiver([post_save, post_delete], sender=Address)
+def invalidate_seller_responses(sender, instance, **kwargs):
+    """Products embed the seller's profile and region"""
+    invalidate_responses_on_commit(f'seller:{instance.user_id}')
+
+
+@receiver([post_save, post_delete], sender=Feedback)
+def invalidate_seller_rating_responses(sender, instance, **kwargs):
+    invalidate_responses_on_commit(f'seller:{instance.seller_id}')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    invalidate_responses_on_commit(f'category:{instance.id}')
@@ -0,0 +1,80 @@
+"""
+Search typeahead
+
+The search box used to call /api/products/?search= for its dropdown, which
+serializes images, seller profiles, ratings and wishlist flags for every
+keystroke. suggest() returns only ids and labels of matching products,
+categories and brands, matched with pg_trgm word similarity on GIN trigram
+indexes (see migration 0023), so prefixes and small typos both match.
+
+Popular prefixes are typed by many users within seconds of each other, so
+results are cached in Redis for settings.SEARCH_SUGGEST_CACHE_SECONDS.
+
+Redis keys:
+    search_suggest:<limit>:<normalized query>   JSON result
+"""
+import json
+
+import redis
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+
+from .models import Category, Product, SellerProfile
+from .redis_utils import get_redis_connection
+
+# Shorter queries match nearly everything and can't use the trigram index well
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 100
+
+
+def normalize(query):
+    return ' '.join(query.lower().split())[:MAX_QUERY_LENGTH]
+
+
+def cache_key(query, limit):
+    return f'search_suggest:{limit}:{query}'
+
+
+def suggest(query, limit):
+    """
+    Get the best matching products, categories and brands for a typed query
+
+    Returns:
+        dict with 'products', 'categories' and 'brands' lists of
+        {'id', 'label'}, best match first. Brand ids are seller user ids,
+        as used by the ?seller= filters.
+    """
+    query = normalize(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        return {'products': [], 'categories': [], 'brands': []}
+
+    key = cache_key(query, limit)
+    try:
+        cached = get_redis_connection().get(key)
+    except redis.RedisError as e:
+        print(f"Failed to read search suggestions: {str(e)}")
+        cached = None
+    if cached:
+        return json.loads(cached)
+
+    result = {
+        'products': top_matches(Product.objects.all(), 'name', query, limit),
+        'categories': top_matches(Category.objects.all(), 'name', query, limit),
+        'brands': top_matches(
+            SellerProfile.objects.exclude(brand_name=''), 'brand_name', query, limit, id_field='user_id'
+        ),
+    }
+
+    try:
+        get_redis_connection().set(key, json.dumps(result), ex=settings.SEARCH_SUGGEST_CACHE_SECONDS)
+    except redis.RedisError as e:
+        print(f"Failed to cache search suggestions: {str(e)}")
+    return result
+
+
+def top_matches(queryset, field, query, limit, id_field='id'):
+    # The %> lookup is what the trigram index serves; similarity only ranks its hits
+    rows = queryset.filter(**{f'{field}__trigram_word_similar': query}).annotate(
+        similarity=TrigramWordSimilarity(query, field)
+    ).order_by('-similarity', field).values_list(id_field, field)[:limit]
+    return [{'id': row_id, 'label': label} for row_id, label in rows]
@@ -1,189 +1,415 @@
+import redis
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 
+from . import auction_snapshot, bid_engine, bid_events, outbid_digest, response_cache, scheduler
+
 
 @shared_task
 def check_auction_endings():
-    """Check for auctions that have ended and process winners"""
-    from .models import AuctionListing, Order, Notification
+    """
+    Reconciliation sweep for ended auctions
+    
+    Auctions are normally closed at their exact end time by dispatch_deadlines;
+    this only catches ones the scheduler missed (e.g. Redis was flushed).
+    """
+    from .models import AuctionListing
+    
+    auction_ids = list(AuctionListing.objects.filter(
+        status='active',
+        end_time__lte=timezone.now()
+    ).values_list('id', flat=True))
+    
+    return enqueue_auction_closing(auction_ids)
+
+
+def enqueue_auction_closing(auction_ids):
+    """Split ended auctions into batches so several workers close them in parallel"""
+    batch_size = settings.AUCTION_CLOSE_BATCH_SIZE
+    for i in range(0, len(auction_ids), batch_size):
+        close_auction_batch.delay(auction_ids[i:i + batch_size])
+    return len(auction_ids)
+
+
+@shared_task
+def close_auction_batch(auction_ids):
+    """Close a batch of ended auctions"""
+    return close_auctions(auction_ids)
+
+
+def close_auctions(auction_ids):
+    """
+    Close the given auctions if they have ended and process winners
+    
+    The whole batch is handled set-wise: auctions are claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED (so concurrent workers split the work),
+    winning bids and addresses are fetched in bulk, and orders and
+    notifications are bulk-created. Stripe sessions are created after the
+    claim commits, in a bounded thread pool, and the WebSocket broadcasts
+    are sent together at the end.
+    """
+    from .models import AuctionListing, Bid, Address, Order, Notification
     from decimal import Decimal
     from channels.layers import get_channel_layer
-    from asgiref.sync import async_to_sync
     import uuid
     
-    # Get auctions that have ended but not yet processed
     now = timezone.now()
-    ended_auctions = AuctionListing.objects.filter(
+    due_ids = list(AuctionListing.objects.filter(
+        id__in=auction_ids,
         status='active',
         end_time__lte=now
-    ).select_related('product', 'product__seller')
+    ).values_list('id', flat=True))
+    if not due_ids:
+        return 0
     
-    channel_layer = get_channel_layer()
+    # Persist any bids still held in the Redis ledger before picking the winners.
+    # This commits on its own: the pending list is trimmed once the bids are written.
+    if bid_engine.is_enabled():
+        for auction_id in due_ids:
+            bid_engine.close_auction(auction_id)
     
-    for auction in ended_auctions:
-        # Get the winning bid
-        winning_bid = auction.bids.filter(is_winning=True).first()
+    with transaction.atomic():
+        # Auctions locked by another worker are skipped; their deadline was
+        # already popped, so they are retried shortly in case that lock wasn't
+        # a close (an edit, a ledger flush)
+        auctions = list(AuctionListing.objects.select_for_update(
+            skip_locked=True, of=('self',)
+        ).filter(
+            id__in=due_ids,
+            status='active'
+        ).select_related('product', 'product__seller'))
+        retry_at = now + timedelta(seconds=settings.AUCTION_CLOSE_RETRY_SECONDS)
+        retries = {auction_id: retry_at for auction_id in set(due_ids) - {auction.id for auction in auctions}}
+        transaction.on_commit(lambda: _retry_auction_closing(retries))
+        if not auctions:
+            return 0
         
-        if winning_bid:
-            # Update auction with winner
-            auction.winner = winning_bid.bidder
-            auction.status = 'ended'
-            auction.save()
-            
-            # Create order
-            total_amount = winning_bid.amount
-            platform_fee = total_amount * Decimal(str(settings.STRIPE_PLATFORM_FEE_PERCENTAGE))
-            seller_amount = total_amount - platform_fee
-            
-            # Get buyer's default shipping address
-            default_address = winning_bid.bidder.addresses.filter(is_default=True).first()
-            if not default_address:
-                # Use any address if no default
-                default_address = winning_bid.bidder.addresses.first()
-            
-            order = Order.objects.create(
-                order_number=f"AUC-{uuid.uuid4().hex[:12].upper()}",
-                buyer=winning_bid.bidder,
-                seller=auction.product.seller,
-                product=auction.product,
-                order_type='auction',
-                auction=auction,
-                quantity=1,
-                unit_price=winning_bid.amount,
-                total_amount=total_amount,
-                platform_fee=platform_fee,
-                seller_amount=seller_amount,
-                shipping_address=default_address,
-                status='pending_payment',
-                payment_deadline=now + timedelta(hours=settings.PAYMENT_DEADLINE_HOURS)
-            )
-            
-            # Create Stripe payment URL
-            try:
-                from .stripe_utils import create_payment_intent_for_order
-                import os
+        winning_bids = {
+            bid.auction_id: bid
+            for bid in Bid.objects.filter(
+                auction__in=auctions, is_winning=True
+            ).select_related('bidder')
+        }
+        
+        # Buyer's default shipping address, or any address if no default
+        addresses = {}
+        for address in Address.objects.filter(
+            user_id__in={bid.bidder_id for bid in winning_bids.values()}
+        ).order_by('-is_default', 'id'):
+            addresses.setdefault(address.user_id, address)
+        
+        # Winners already asked for an address, so they're only asked once
+        asked = set(Notification.objects.filter(
+            auction__in=auctions, notification_type='auction_won', order__isnull=True
+        ).values_list('auction_id', flat=True))
+        address_wait = timedelta(hours=settings.AUCTION_ADDRESS_WAIT_HOURS)
+        
+        closed_auctions = []
+        orders = []
+        unsold = {}  # auction id -> winning bid whose bidder never added an address
+        address_requests = []
+        for auction in auctions:
+            winning_bid = winning_bids.get(auction.id)
+            if winning_bid:
+                shipping_address = addresses.get(winning_bid.bidder_id)
+                if not shipping_address and now - auction.end_time < address_wait:
+                    # Can't create the order yet; retry, backing off as the wait goes on
+                    print(f"Winner {winning_bid.bidder.username} of auction {auction.id} has no shipping address")
+                    delay = min(
+                        max((now - auction.end_time).total_seconds(), settings.AUCTION_CLOSE_RETRY_SECONDS),
+                        settings.AUCTION_CLOSE_MAX_RETRY_SECONDS,
+                    )
+                    retries[auction.id] = now + timedelta(seconds=delay)
+                    if auction.id not in asked:
+                        address_requests.append(Notification(
+                            user=winning_bid.bidder,
+                            notification_type='auction_won',
+                            title='You won the auction - add a shipping address',
+                            message=(f'You won the auction for {auction.product.name}. Add a shipping address '
+                                     f'within {settings.AUCTION_ADDRESS_WAIT_HOURS} hours to complete your order.'),
+                            auction=auction
+                        ))
+                    continue
+                if not shipping_address:
+                    # Waited long enough; the auction ends without a sale
+                    unsold[auction.id] = winning_bid
+                    auction.status = 'ended'
+                    auction.updated_at = now
+                    closed_auctions.append(auction)
+                    continue
                 
-                base_url = os.getenv('BACKEND_URL', 'http://localhost:8000')
-                frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+                auction.winner = winning_bid.bidder
                 
-                payment_result = create_payment_intent_for_order(
-                    order=order,
-                    success_url=f"{base_url}/api/payments/success/?order_id={order.id}",
-                    cancel_url=f"{frontend_url}/auctions/{auction.id}?payment_cancelled=true"
-                )
+                # Create order
+                total_amount = winning_bid.amount
+                platform_fee = total_amount * Decimal(str(settings.STRIPE_PLATFORM_FEE_PERCENTAGE))
+                seller_amount = total_amount - platform_fee
                 
-                # Use frontend payment URL for the email
-                order.payment_url = payment_result['checkout_url']
-                if payment_result.get('session_id'):
-                    order.stripe_payment_intent_id = payment_result['session_id']
-                order.save()
-            except Exception as e:
-                print(f"Failed to create payment URL for auction order {order.id}: {str(e)}")
-                # Fallback to frontend order details page
-                frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
-                order.payment_url = f"{frontend_url}/my-orders"
-                order.save()
-            
-            # Create notification for winner
-            notification = Notification.objects.create(
-                user=winning_bid.bidder,
-                notification_type='auction_won',
-                title='Congratulations! You won the auction',
-                message=f'You won the auction for {auction.product.name}. Please complete payment within 24 hours: {order.payment_url}',
-                auction=auction,
-                order=order
-            )
+                orders.append(Order(
+                    order_number=f"AUC-{uuid.uuid4().hex[:12].upper()}",
+                    buyer=winning_bid.bidder,
+                    seller=auction.product.seller,
+                    product=auction.product,
+                    order_type='auction',
+                    auction=auction,
+                    quantity=1,
+                    unit_price=winning_bid.amount,
+                    total_amount=total_amount,
+                    platform_fee=platform_fee,
+                    seller_amount=seller_amount,
+                    shipping_address=shipping_address,
+                    status='pending_payment',
+                    payment_deadline=now + timedelta(hours=settings.PAYMENT_DEADLINE_HOURS)
+                ))
             
-            # Send email notification
-            send_auction_won_email.delay(order.id)
-            
-            # Notify seller
-            Notification.objects.create(
+            auction.status = 'ended'
+            auction.updated_at = now
+            closed_auctions.append(auction)
+        
+        AuctionListing.objects.bulk_update(closed_auctions, ['status', 'winner', 'updated_at'])
+        Order.objects.bulk_create(orders)
+        Notification.objects.bulk_create(address_requests)
+        
+        # bulk_create skips post_save, so schedule the payment deadlines here
+        deadlines = [(scheduler.PAYMENT_DEADLINE, order.id, order.payment_deadline) for order in orders]
+        transaction.on_commit(lambda: scheduler.schedule_many(deadlines))
+        # bulk_update skips post_save too, so drop cached auction responses here
+        closed_tags = ['auction', *[f'auction:{auction.id}' for auction in closed_auctions]]
+        transaction.on_commit(lambda: response_cache.invalidate(*closed_tags))
+    
+    # Stripe calls happen outside the transaction so no row stays locked on the network
+    _create_auction_payment_urls(orders)
+    
+    notifications = []
+    for order in orders:
+        notifications.append(Notification(
+            user=order.buyer,
+            notification_type='auction_won',
+            title='Congratulations! You won the auction',
+            message=f'You won the auction for {order.product.name}. Please complete payment within 24 hours: {order.payment_url}',
+            auction=order.auction,
+            order=order
+        ))
+        notifications.append(Notification(
+            user=order.seller,
+            notification_type='auction_ended',
+            title='Your auction has ended',
+            message=f'Your auction for {order.product.name} has ended. Winner: {order.buyer.username}',
+            auction=order.auction,
+            order=order
+        ))
+    
+    orders_by_auction = {order.auction_id: order for order in orders}
+    broadcasts = []
+    endings = []
+    for auction in closed_auctions:
+        order = orders_by_auction.get(auction.id)
+        if order:
+            endings.append([
+                auction.id, 'ended', {'id': order.buyer.id, 'username': order.buyer.username}, str(order.unit_price)
+            ])
+            data = {
+                'auction_id': auction.id,
+                'status': 'ended',
+                'winner': order.buyer.username,
+                'final_price': str(order.unit_price),
+                'product_name': auction.product.name,
+                'message': f'Auction ended! Winner: {order.buyer.username}'
+            }
+        elif auction.id in unsold:
+            bidder = unsold[auction.id].bidder
+            endings.append([auction.id, 'ended', None, str(auction.current_price)])
+            notifications.append(Notification(
+                user=bidder,
+                notification_type='auction_lost',
+                title='Your auction win has lapsed',
+                message=f'You did not add a shipping address in time, so the auction for {auction.product.name} ended without a sale.',
+                auction=auction
+            ))
+            notifications.append(Notification(
                 user=auction.product.seller,
                 notification_type='auction_ended',
                 title='Your auction has ended',
-                message=f'Your auction for {auction.product.name} has ended. Winner: {winning_bid.bidder.username}',
-                auction=auction,
-                order=order
-            )
-            
-            # Broadcast auction end to all connected WebSocket clients
-            if channel_layer:
-                room_group_name = f'auction_{auction.id}'
-                async_to_sync(channel_layer.group_send)(
-                    room_group_name,
-                    {
-                        'type': 'auction_ended',
-                        'data': {
-                            'auction_id': auction.id,
-                            'status': 'ended',
-                            'winner': winning_bid.bidder.username,
-                            'final_price': str(winning_bid.amount),
-                            'product_name': auction.product.name,
-                            'message': f'Auction ended! Winner: {winning_bid.bidder.username}'
-                        }
-                    }
-                )
+                message=f'Your auction for {auction.product.name} has ended without a sale: the winner did not add a shipping address.',
+                auction=auction
+            ))
+            data = {
+                'auction_id': auction.id,
+                'status': 'ended',
+                'winner': None,
+                'final_price': str(auction.current_price),
+                'product_name': auction.product.name,
+                'message': 'Auction ended without a sale'
+            }
         else:
-            # No bids, mark as ended
-            auction.status = 'ended'
-            auction.save()
-            
-            # Notify seller
-            Notification.objects.create(
+            # No bids
+            endings.append([auction.id, 'ended', None, str(auction.current_price)])
+            notifications.append(Notification(
                 user=auction.product.seller,
                 notification_type='auction_ended',
                 title='Your auction has ended',
                 message=f'Your auction for {auction.product.name} has ended with no bids.',
                 auction=auction
+            ))
+            data = {
+                'auction_id': auction.id,
+                'status': 'ended',
+                'winner': None,
+                'final_price': str(auction.current_price),
+                'product_name': auction.product.name,
+                'message': 'Auction ended with no bids'
+            }
+        broadcasts.append((auction.id, {'type': 'auction_ended', 'data': data}))
+    
+    Notification.objects.bulk_create(notifications)
+    
+    # Send email notifications
+    for order in orders:
+        send_auction_won_email.delay(order.id)
+    
+    # Sequence the end events so reconnecting clients can replay them, and
+    # keep the WebSocket connect snapshots in line with the broadcast
+    try:
+        sequences = bid_events.append_many([
+            (auction_id, 'auction_ended', message['data']) for auction_id, message in broadcasts
+        ])
+        for (_, message), ending, sequence in zip(broadcasts, endings, sequences):
+            message['data']['sequence'] = sequence
+            ending.append(sequence)
+        auction_snapshot.apply_endings(endings)
+    except redis.RedisError as e:
+        print(f"Failed to update auction events: {str(e)}")
+    
+    # Broadcast auction end to all connected WebSocket clients
+    channel_layer = get_channel_layer()
+    if channel_layer and broadcasts:
+        _group_send_many(channel_layer, [
+            (f'auction_{auction_id}', message) for auction_id, message in broadcasts
+        ])
+    
+    return len(closed_auctions)
+
+
+def _retry_auction_closing(retries):
+    """
+    Put auctions a batch couldn't close back on the deadline schedule
+
+    Args:
+        retries: dict of auction id -> when to try again
+    """
+    try:
+        scheduler.schedule_many(
+            (scheduler.AUCTION_END, auction_id, retry_at) for auction_id, retry_at in retries.items()
+        )
+    except redis.RedisError as e:
+        # check_auction_endings still sweeps them up
+        print(f"Failed to reschedule auctions {sorted(retries)}: {str(e)}")
+
+
+def _create_auction_payment_urls(orders):
+    """Create Stripe Checkout sessions for auction orders in a bounded thread pool"""
+    from .models import Order
+    from .stripe_utils import create_payment_intent_for_order
+    from concurrent.futures import ThreadPoolExecutor
+    from django.db import connection
+    import os
+    
+    base_url = os.getenv('BACKEND_URL', 'http://localhost:8000')
+    frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+    
+    def create_payment_url(order):
+        try:
+            payment_result = create_payment_intent_for_order(
+                order=order,
+                success_url=f"{base_url}/api/payments/success/?order_id={order.id}",
+                cancel_url=f"{frontend_url}/auctions/{order.auction_id}?payment_cancelled=true"
             )
             
-            # Broadcast auction end to all connected WebSocket clients
-            if channel_layer:
-                room_group_name = f'auction_{auction.id}'
-                async_to_sync(channel_layer.group_send)(
-                    room_group_name,
-                    {
-                        'type': 'auction_ended',
-                        'data': {
-                            'auction_id': auction.id,
-                            'status': 'ended',
-                            'winner': None,
-                            'final_price': str(auction.current_price),
-                            'product_name': auction.product.name,
-                            'message': 'Auction ended with no bids'
-                        }
-                    }
-                )
+            # Use frontend payment URL for the email
+            order.payment_url = payment_result['checkout_url']
+            if payment_result.get('session_id'):
+                order.stripe_payment_intent_id = payment_result['session_id']
+        except Exception as e:
+            print(f"Failed to create payment URL for auction order {order.id}: {str(e)}")
+            # Fallback to frontend order details page
+            order.payment_url = f"{frontend_url}/my-orders"
+        finally:
+            connection.close()
+    
+    if not orders:
+        return
+    
+    with ThreadPoolExecutor(max_workers=settings.AUCTION_CLOSE_STRIPE_WORKERS) as executor:
+        list(executor.map(create_payment_url, orders))
+    
+    Order.objects.bulk_update(orders, ['payment_url', 'stripe_payment_intent_id'])
+
+
+def _group_send_many(channel_layer, messages):
+    """Send (group, message) pairs to the channel layer in one event loop pass"""
+    from asgiref.sync import async_to_sync
+    import asyncio
+    
+    async def send_all():
+        await asyncio.gather(*(
+            channel_layer.group_send(group, message) for group, message in messages
+        ))
+    
+    async_to_sync(send_all)()
 
 
 @shared_task
 def check_payment_deadlines():
-    """Check for orders with expired payment deadlines"""
+    """
+    Reconciliation sweep for expired payment deadlines
+    
+    Orders are normally expired at their exact deadline by dispatch_deadlines;
+    this only catches ones the scheduler missed.
+    """
+    from .models import Order
+    
+    order_ids = list(Order.objects.filter(
+        status='pending_payment',
+        payment_deadline__lte=timezone.now()
+    ).values_list('id', flat=True))
+    
+    return expire_orders(order_ids)
+
+
+def expire_orders(order_ids):
+    """Fail the given orders if their payment deadline has passed"""
     from .models import Order, PaymentViolation, User
     
     now = timezone.now()
     expired_orders = Order.objects.filter(
+        id__in=order_ids,
         status='pending_payment',
         payment_deadline__lte=now
     ).select_related('buyer', 'auction')
+    expired = 0
     
     for order in expired_orders:
-        # Mark order as payment failed
-        order.status = 'payment_failed'
-        order.save()
+        # Mark order as payment failed (only if a payment didn't land meanwhile)
+        claimed = Order.objects.filter(
+            id=order.id, status='pending_payment'
+        ).update(status='payment_failed', updated_at=now)
+        if not claimed:
+            continue
+        expired += 1
         
-        # Create payment violation record
-        PaymentViolation.objects.create(
-            user=order.buyer,
-            auction=order.auction,
-            order=order,
-            payment_deadline=order.payment_deadline,
-            notes='Payment deadline expired'
-        )
+        # Create payment violation record (violations are tracked per auction)
+        if order.auction:
+            PaymentViolation.objects.create(
+                user=order.buyer,
+                auction=order.auction,
+                order=order,
+                payment_deadline=order.payment_deadline,
+                notes='Payment deadline expired'
+            )
         
         # Increment failed payment count
         buyer = order.buyer
@@ -205,6 +431,95 @@ def check_payment_deadlines():
             send_account_blocked_email.delay(buyer.id)
         
         buyer.save()
+    
+    return expired
+
+
+def refresh_discounts(listing_ids):
+    """
+    Mark listings whose discount just started or ended as modified
+    
+    The discounted price is computed on read, so only updated_at needs to move
+    for clients and caches to notice the price change.
+    """
+    from .models import FixedPriceListing
+    
+    return FixedPriceListing.objects.filter(id__in=listing_ids).update(updated_at=timezone.now())
+
+
+def enqueue_outbid_digests(user_ids):
+    """Send the digests of users whose outbid window closed, off the dispatcher"""
+    send_outbid_digests.delay(user_ids)
+    return len(user_ids)
+
+
+DEADLINE_HANDLERS = {
+    scheduler.AUCTION_END: enqueue_auction_closing,
+    scheduler.PAYMENT_DEADLINE: expire_orders,
+    scheduler.DISCOUNT_START: refresh_discounts,
+    scheduler.DISCOUNT_END: refresh_discounts,
+    scheduler.OUTBID_DIGEST: enqueue_outbid_digests,
+}
+
+
+@shared_task
+def dispatch_deadlines():
+    """Run the handlers for every deadline that is due (polled every second)"""
+    handled = 0
+    while True:
+        due = scheduler.pop_due()
+        if not due:
+            break
+        
+        for kind, object_ids in due.items():
+            handler = DEADLINE_HANDLERS.get(kind)
+            if handler is None:
+                print(f"Unknown deadline kind: {kind}")
+                continue
+            try:
+                handler(object_ids)
+            except Exception as e:
+                # Retry shortly; the reconciliation sweeps are the last resort
+                print(f"Failed to handle {kind} deadlines {object_ids}: {str(e)}")
+                retry_at = timezone.now() + timedelta(seconds=settings.DEADLINE_RETRY_DELAY_SECONDS)
+                scheduler.schedule_many((kind, object_id, retry_at) for object_id in object_ids)
+        
+        handled += sum(len(object_ids) for object_ids in due.values())
+    
+    return handled
+
+
+@shared_task
+def sync_deadlines():
+    """
+    Re-schedule every upcoming deadline from the database
+    
+    Scheduling is idempotent, so this only matters if Redis lost the
+    deadlines set; it keeps exact-time closing working after a Redis restart.
+    """
+    from .models import AuctionListing, Order, FixedPriceListing
+    
+    now = timezone.now()
+    entries = []
+    
+    for auction_id, end_time in AuctionListing.objects.filter(
+        status='active', end_time__gt=now
+    ).values_list('id', 'end_time'):
+        entries.append((scheduler.AUCTION_END, auction_id, end_time))
+    
+    for order_id, payment_deadline in Order.objects.filter(
+        status='pending_payment', payment_deadline__gt=now
+    ).values_list('id', 'payment_deadline'):
+        entries.append((scheduler.PAYMENT_DEADLINE, order_id, payment_deadline))
+    
+    for listing_id, start, end in FixedPriceListing.objects.filter(
+        discount_end_date__gt=now
+    ).values_list('id', 'discount_start_date', 'discount_end_date'):
+        if start and start > now:
+            entries.append((scheduler.DISCOUNT_START, listing_id, start))
+        entries.append((scheduler.DISCOUNT_END, listing_id, end))
+    
+    return scheduler.schedule_many(entries)
 
 
 @shared_task
@@ -213,7 +528,7 @@ def send_pending_notifications():
     from .models import Notification
     
     pending_notifications = Notification.objects.filter(
-        is_sent_via_email=False
+        is_sent_via_email=False, email_failed=False
     ).select_related('user')[:50]  # Process 50 at a time
     
     for notification in pending_notifications:
@@ -437,3 +752,146 @@ Thank you for using MadeInPK!
         print(f"Auction {auction_id} not found")
     except Exception as e:
         print(f"Failed to send outbid email: {str(e)}")
+
+
+@shared_task
+def notify_outbid_bidder(user_id, auction_id, new_bid_amount, product_name):
+    """Create the in-app outbid notification and queue the email"""
+    from .models import Notification
+    
+    Notification.objects.create(
+        user_id=user_id,
+        notification_type='bid_outbid',
+        title='You have been outbid',
+        message=f'Someone placed a higher bid of Rs. {new_bid_amount} on {product_name}',
+        auction_id=auction_id
+    )
+    
+    send_outbid_notification_email.delay(
+        user_id=user_id,
+        auction_id=auction_id,
+        new_bid_amount=new_bid_amount,
+        product_name=product_name
+    )
+
+
+@shared_task
+def send_outbid_digests(user_ids):
+    """
+    Send one outbid notification and email per (user, auction) buffered in the window
+    
+    Emails go out over one SMTP connection, one digest at a time, and each
+    digest leaves the drained buffer as soon as its email is out.
+    Notifications for the sent digests are created in one query. When an
+    email fails, the user's remaining digests are retried shortly; after
+    OUTBID_DIGEST_MAX_ATTEMPTS failures they get only the in-app
+    notification, marked so send_pending_notifications doesn't email it
+    again. If nothing could be sent at all, every digest is retried.
+    """
+    from django.core.mail import EmailMessage, get_connection
+    from .models import User, Notification
+    
+    def retry(retry_ids):
+        retry_at = timezone.now() + timedelta(seconds=settings.DEADLINE_RETRY_DELAY_SECONDS)
+        scheduler.schedule_many((scheduler.OUTBID_DIGEST, user_id, retry_at) for user_id in retry_ids)
+    
+    try:
+        digests = outbid_digest.drain(user_ids)
+        attempts = outbid_digest.get_attempts(list(digests))
+        users = User.objects.in_bulk(list(digests), field_name='id')
+        connection = get_connection(fail_silently=False)
+        connection.open()
+    except Exception as e:
+        print(f"Failed to send outbid digests for users {user_ids}: {str(e)}")
+        retry(user_ids)
+        return 0
+    
+    notifications = []
+    done_ids = [user_id for user_id in user_ids if user_id not in users]
+    failed_ids = []
+    try:
+        for user_id, user in users.items():
+            give_up = False
+            for auction_id, entry in digests[user_id].items():
+                amount, product_name, count = entry['amount'], entry['product_name'], entry['count']
+                if count > 1:
+                    message = (f'You were outbid {count} times on {product_name}. '
+                               f'The highest bid is now Rs. {amount}')
+                else:
+                    message = f'Someone placed a higher bid of Rs. {amount} on {product_name}'
+                notification = Notification(
+                    user_id=user_id,
+                    notification_type='bid_outbid',
+                    title='You have been outbid',
+                    message=message,
+                    auction_id=auction_id,
+                )
+                
+                if give_up:
+                    notification.email_failed = True
+                    notifications.append(notification)
+                    continue
+                try:
+                    connection.send_messages([EmailMessage(
+                        f'You have been outbid on {product_name}',
+                        f"""
+Dear {user.username},
+
+{message}.
+
+If you're still interested, you can place a higher bid to regain the lead.
+
+Log in to your MadeInPK account to view the auction and place a new bid.
+
+Thank you for using MadeInPK!
+                        """,
+                        settings.DEFAULT_FROM_EMAIL,
+                        [user.email],
+                        connection=connection,
+                    )])
+                except Exception as e:
+                    print(f"Failed to send outbid digest to user {user_id}: {str(e)}")
+                    if attempts[user_id] + 1 < settings.OUTBID_DIGEST_MAX_ATTEMPTS:
+                        failed_ids.append(user_id)
+                        break
+                    # Give up on the emails; the in-app notifications still go out
+                    give_up = True
+                    notification.email_failed = True
+                    notifications.append(notification)
+                    continue
+                
+                notification.is_sent_via_email = True
+                notification.email_sent_at = timezone.now()
+                notifications.append(notification)
+                try:
+                    outbid_digest.mark_sent(user_id, auction_id)
+                except redis.RedisError as e:
+                    print(f"Failed to mark outbid digest {auction_id} sent for user {user_id}: {str(e)}")
+            else:
+                done_ids.append(user_id)
+    finally:
+        connection.close()
+    
+    try:
+        Notification.objects.bulk_create(notifications)
+        outbid_digest.finish(done_ids)
+    except Exception as e:
+        # The emails are out; retrying would send them again
+        print(f"Failed to record outbid digests for users {done_ids}: {str(e)}")
+    
+    if failed_ids:
+        try:
+            outbid_digest.record_failures(failed_ids)
+            retry(failed_ids)
+        except redis.RedisError as e:
+            print(f"Failed to reschedule outbid digests for users {failed_ids}: {str(e)}")
+    
+    return len(notifications)
+
+
+@shared_task
+def flush_bid_ledger():
+    """Persist bids accepted by the Redis bid ledger to the bids table"""
+    if not bid_engine.is_enabled():
+        return 0
+    return bid_engine.flush_all()
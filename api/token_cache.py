@@ -0,0 +1,196 @@
+"""
+Cached token authentication
+
+Every authenticated REST request and WebSocket connect used to look the token
+up in PostgreSQL. Token -> user lookups are now served from a small
+per-process LRU, backed by Redis, and only fall through to the database on a
+miss.
+
+Entries are dropped explicitly when a token is deleted (logout) and whenever
+the user row is saved (blocking, role changes), which clears Redis and this
+process's LRU. Other processes keep their local entry for at most
+settings.AUTH_TOKEN_LOCAL_CACHE_TTL_SECONDS, which bounds how long a revoked
+token can still be used there.
+
+A request that read the database just before an invalidation must not put
+the stale user back, so invalidations leave a short-lived marker that blocks
+re-caching until they are safely committed.
+
+Redis keys:
+    auth_token:<sha256 of key>        pickled user for the token ('' = revoked)
+    auth_token_user:<user id>         sha256 of the user's token (for invalidation)
+    auth_token_user:<user id>:revoked set while the user's row is changing
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from .redis_utils import get_redis_connection
+
+# How long an invalidation blocks re-caching the old user
+REVOKED_TTL_SECONDS = 30
+
+STORE_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[3]) then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class LocalCache:
+    """Thread-safe LRU with a per-entry TTL"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + settings.AUTH_TOKEN_LOCAL_CACHE_TTL_SECONDS, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_LOCAL_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            stale = [key for key, (_, user) in self.entries.items() if user.pk == user_id]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache()
+
+
+def digest(token_key):
+    # Raw tokens never end up in Redis key names
+    return hashlib.sha256(token_key.encode()).hexdigest()
+
+
+def token_cache_key(token_hash):
+    return f'auth_token:{token_hash}'
+
+
+def user_index_key(user_id):
+    return f'auth_token_user:{user_id}'
+
+
+def user_revoked_key(user_id):
+    return f'auth_token_user:{user_id}:revoked'
+
+
+def get_cached_user(token_key):
+    """
+    Get the user a token belongs to without touching the database
+
+    Returns:
+        User instance, or None on a cache miss
+    """
+    token_hash = digest(token_key)
+    user = local_cache.get(token_hash)
+    if user is not None:
+        return user
+
+    try:
+        cached = get_redis_connection().get(token_cache_key(token_hash))
+    except redis.RedisError as e:
+        print(f"Failed to read token cache: {str(e)}")
+        return None
+    if not cached:
+        return None
+    user = pickle.loads(cached)
+    local_cache.set(token_hash, user)
+    return user
+
+
+def get_user(token_key):
+    """
+    Get the user a token belongs to, loading it from the database on a miss
+
+    Returns:
+        User instance, or None if the token doesn't exist
+    """
+    user = get_cached_user(token_key)
+    if user is not None:
+        return user
+
+    try:
+        token = Token.objects.select_related('user').get(key=token_key)
+    except Token.DoesNotExist:
+        return None
+
+    store(digest(token_key), token.user)
+    return token.user
+
+
+def store(token_hash, user):
+    try:
+        stored = get_redis_connection().eval(
+            STORE_SCRIPT, 3, token_cache_key(token_hash), user_index_key(user.pk), user_revoked_key(user.pk),
+            pickle.dumps(user), token_hash, settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+        )
+    except redis.RedisError as e:
+        print(f"Failed to cache token: {str(e)}")
+        return
+    if stored:
+        local_cache.set(token_hash, user)
+
+
+def invalidate_token(token_key):
+    """Forget a deleted token (logout)"""
+    token_hash = digest(token_key)
+    local_cache.delete(token_hash)
+    # The revoked marker outlives any read that started before the delete
+    get_redis_connection().set(token_cache_key(token_hash), b'', ex=REVOKED_TTL_SECONDS)
+
+
+def invalidate_users(user_ids):
+    """Forget the cached tokens of users whose row changed (blocked, role)"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        local_cache.delete_user(user_id)
+
+    client = get_redis_connection()
+    index_keys = [user_index_key(user_id) for user_id in user_ids]
+    token_hashes = client.mget(index_keys)
+
+    pipe = client.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.set(user_revoked_key(user_id), 1, ex=REVOKED_TTL_SECONDS)
+    pipe.delete(*index_keys)
+    for token_hash in token_hashes:
+        if token_hash:
+            pipe.delete(token_cache_key(token_hash.decode()))
+    pipe.execute()
@@ -37,6 +37,12 @@ urlpatterns = [
     path('seller/transactions/', views.seller_transactions, name='seller-transactions'),
     path('seller/product-performance/', views.product_performance, name='product-performance'),
     
+    # Search
+    path('search/suggest/', views.search_suggest, name='search-suggest'),
+    
+    # Provinces, cities and categories in one versioned document
+    path('reference/', views.reference_bundle, name='reference-bundle'),
+    
     # Stripe webhook
     path('stripe/webhook/', views.stripe_webhook, name='stripe-webhook'),
     
@@ -3,9 +3,13 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Prefetch
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.utils import timezone
 from decimal import Decimal
 from dateutil import parser
@@ -14,7 +18,7 @@ import os
 
 from .models import (
     Province, City, Address, Category, Product, ProductImage,
-    AuctionListing, Bid, FixedPriceListing, Order, Payment,
+    AuctionListing, Bid, ProxyBid, FixedPriceListing, Order, Payment,
     Feedback, Conversation, Message, Notification, Complaint, Wishlist, SellerProfile, ProductReview,
     Cart, CartItem, OrderItem, SellerTransfer
 )
@@ -23,7 +27,7 @@ from .serializers import (
     ProvinceSerializer, CitySerializer, AddressSerializer,
     CategorySerializer, ProductSerializer, ProductCreateSerializer,
     ProductImageSerializer, AuctionListingSerializer, AuctionCreateSerializer,
-    BidSerializer, BidCreateSerializer, FixedPriceListingSerializer,
+    BidSerializer, BidCreateSerializer, ProxyBidSerializer, FixedPriceListingSerializer,
     FixedPriceCreateSerializer, OrderSerializer, OrderCreateSerializer,
     PaymentSerializer, FeedbackSerializer, FeedbackCreateSerializer,
     MessageSerializer, ConversationSerializer, NotificationSerializer,
@@ -33,6 +37,10 @@ from .serializers import (
     UpdateCartItemSerializer, CartCheckoutSerializer, OrderItemSerializer, SellerTransferSerializer,
     SellerEarningsSerializer, SellerTransactionSerializer, ProductPerformanceSerializer
 )
+from . import bidding, category_tree, facets, reference_data, response_cache, suggest
+from .filters import ProductSearchFilter
+from .mixins import ConditionalGetMixin, ResponseCacheMixin, WishlistConditionalGetMixin
+from .pagination import BidHistoryPagination, FeedPagination
 from .stripe_utils import (
     create_stripe_connect_account, create_account_link, get_account_status,
     create_payment_intent_for_order
@@ -220,15 +228,59 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Nested subcategories come from the cached tree, not a query per node
+        context['subcategories'] = category_tree.get_subcategories()
+        return context
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """The whole category tree in one unpaginated response"""
+        return Response(category_tree.get_tree())
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_suggest(request):
+    """Typeahead: ids and labels of products, categories and brands matching ?q="""
+    try:
+        limit = int(request.query_params.get('limit', settings.SEARCH_SUGGEST_DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(max(limit, 1), settings.SEARCH_SUGGEST_MAX_LIMIT)
+
+    return Response(suggest.suggest(request.query_params.get('q', ''), limit))
+
+
+@cache_control(public=True, max_age=settings.REFERENCE_DATA_MAX_AGE_SECONDS)
+@condition(etag_func=lambda request: reference_data.get_bundle().version)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def reference_bundle(request):
+    """
+    Provinces, cities and the category tree in one document, served from
+    memory. The ETag is the bundle's version; If-None-Match gets a 304.
+    """
+    return HttpResponse(reference_data.get_bundle().body, content_type='application/json')
+
 
 # Product ViewSet
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ResponseCacheMixin, WishlistConditionalGetMixin, viewsets.ModelViewSet):
     """CRUD operations for products"""
-    queryset = Product.objects.select_related('seller', 'category').prefetch_related('images').all()
+    queryset = Product.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description']
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
+    search_vector_field = 'search_vector'
     ordering_fields = ['created_at', 'name']
+    pagination_class = FeedPagination
+    validator_fields = (
+        'updated_at', 'seller__seller_profile__updated_at', 'auction__updated_at', 'fixed_price__updated_at'
+    )
+    cache_tag = 'product'
+    
+    def get_cache_tags(self, obj):
+        return response_cache.product_tags(obj)
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -236,32 +288,28 @@ class ProductViewSet(viewsets.ModelViewSet):
         return ProductSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = ProductSerializer.setup_eager_loading(super().get_queryset(), self.request)
         
         # Filter by seller
         seller_id = self.request.query_params.get('seller')
         if seller_id:
             queryset = queryset.filter(seller_id=seller_id)
         
-        # Filter by category
+        # Filter by category, including its subcategories
         category_id = self.request.query_params.get('category')
         if category_id:
-            queryset = queryset.filter(category_id=category_id)
+            path = category_tree.get_path(category_id)
+            queryset = queryset.filter(category__path__startswith=path) if path else queryset.none()
         
         # Filter by condition
         condition = self.request.query_params.get('condition')
         if condition:
             queryset = queryset.filter(condition=condition)
         
-        # Filter by province (based on seller's business address or default address)
+        # Filter by province (the seller's region, see Product.refresh_region)
         province_id = self.request.query_params.get('province')
         if province_id:
-            # Filter by sellers who have business address in the specified province
-            # OR sellers who have default address in the specified province
-            queryset = queryset.filter(
-                Q(seller__seller_profile__business_address_id__city__province_id=province_id) |
-                Q(seller__addresses__city__province_id=province_id, seller__addresses__is_default=True)
-            ).distinct()
+            queryset = queryset.filter(province_id=province_id)
         
         return queryset
     
@@ -325,15 +373,29 @@ class ProductViewSet(viewsets.ModelViewSet):
         
         return Response(status=status.HTTP_204_NO_CONTENT)
 # Auction ViewSet
-class AuctionListingViewSet(viewsets.ModelViewSet):
+class AuctionListingViewSet(ResponseCacheMixin, WishlistConditionalGetMixin, viewsets.ModelViewSet):
     """CRUD operations for auction listings"""
     queryset = AuctionListing.objects.select_related(
-        'product__seller', 'product__category', 'winner'
-    ).prefetch_related('product__images', 'bids').all()
+        'winner', 'leading_bidder'
+    ).prefetch_related(
+        Prefetch(
+            'bids',
+            queryset=Bid.objects.select_related('bidder').order_by('-bid_time')[:5],
+            to_attr='latest_bid_list'
+        )
+    ).all()
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['product__name', 'product__description']
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
+    search_vector_field = 'product__search_vector'
     ordering_fields = ['end_time', 'current_price', 'created_at']
+    pagination_class = FeedPagination
+    # Bids bump the auction's updated_at, see bidding.py
+    validator_fields = ('updated_at', 'product__updated_at', 'product__seller__seller_profile__updated_at')
+    validator_schedule_fields = ('end_time',)
+    cache_tag = 'auction'
+    
+    def get_cache_tags(self, obj):
+        return [f'auction:{obj.id}', *response_cache.product_tags(obj.product)]
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -341,7 +403,9 @@ class AuctionListingViewSet(viewsets.ModelViewSet):
         return AuctionListingSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().prefetch_related(
+            Prefetch('product', queryset=ProductSerializer.setup_eager_loading(Product.objects.all(), self.request))
+        )
         
         # Filter by status
         status_param = self.request.query_params.get('status')
@@ -358,72 +422,112 @@ class AuctionListingViewSet(viewsets.ModelViewSet):
         if my_auctions and self.request.user.is_authenticated:
             queryset = queryset.filter(product__seller=self.request.user)
         
-        # Filter by category
+        # Filter by category, including its subcategories
         category_id = self.request.query_params.get('category')
         if category_id:
-            queryset = queryset.filter(product__category_id=category_id)
+            path = category_tree.get_path(category_id)
+            queryset = queryset.filter(product__category__path__startswith=path) if path else queryset.none()
         
         return queryset
     
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def place_bid(self, request, pk=None):
         """Place a bid on an auction"""
-        auction = self.get_object()
+        serializer = BidCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Validation
-        if not auction.is_active():
-            return Response({'error': 'Auction is not active'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
+        result = bidding.place_bid(pk, request.user, serializer.validated_data['amount'])
+        if not result['success']:
+            return Response({'error': result['error']}, status=result['status_code'])
+        
+        # Let WebSocket viewers see bids placed over REST too
+        bidding.broadcast_new_bid(pk, result['bid_data'], result.get('bid_count', 1))
+        
+        if result.get('outbid'):
+            # A maximum bid answered straight away; the bid stands but doesn't lead
+            data = BidSerializer(result['placed_bid']).data
+            data['outbid'] = True
+            data['current_price'] = result['bid_data']['current_price']
+            return Response(data, status=status.HTTP_201_CREATED)
+        if result.get('bid'):
+            return Response(BidSerializer(result['bid']).data, status=status.HTTP_201_CREATED)
+        return Response(result['bid_data'], status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get', 'post', 'delete'], permission_classes=[IsAuthenticated])
+    def max_bid(self, request, pk=None):
+        """Get, set or cancel the user's maximum (proxy) bid on an auction"""
+        if request.method == 'GET':
+            proxy_bid = ProxyBid.objects.filter(auction_id=pk, bidder=request.user).first()
+            if not proxy_bid:
+                return Response({'error': 'No maximum bid set'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(ProxyBidSerializer(proxy_bid).data)
         
-        if request.user.is_blocked:
-            return Response({'error': 'Your account is blocked'}, 
-                          status=status.HTTP_403_FORBIDDEN)
+        if request.method == 'DELETE':
+            bidding.cancel_proxy_bid(pk, request.user)
+            return Response(status=status.HTTP_204_NO_CONTENT)
         
-        if auction.product.seller == request.user:
-            return Response({'error': 'You cannot bid on your own auction'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
+        serializer = ProxyBidSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = BidCreateSerializer(
-            data=request.data,
-            context={'request': request, 'auction': auction}
-        )
+        result = bidding.place_proxy_bid(pk, request.user, serializer.validated_data['max_amount'])
+        if not result['success']:
+            return Response({'error': result['error']}, status=result['status_code'])
         
-        if serializer.is_valid():
-            bid = serializer.save()
-            
-            # Create notification for previous highest bidder
-            previous_bid = auction.bids.filter(is_winning=False).order_by('-bid_time').first()
-            if previous_bid:
-                Notification.objects.create(
-                    user=previous_bid.bidder,
-                    notification_type='bid_outbid',
-                    title='You have been outbid',
-                    message=f'Someone placed a higher bid on {auction.product.name}',
-                    auction=auction
-                )
-            
-            return Response(BidSerializer(bid).data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if result['bid_data']:
+            bidding.broadcast_new_bid(pk, result['bid_data'], result['bid_count'])
+        
+        return Response({
+            'max_bid': ProxyBidSerializer(result['proxy_bid']).data,
+            'bid': BidSerializer(result['bid']).data if result['bid'] else None,
+        }, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['get'])
     def bids(self, request, pk=None):
-        """Get all bids for an auction"""
-        auction = self.get_object()
-        bids = auction.bids.select_related('bidder').order_by('-bid_time')
-        serializer = BidSerializer(bids, many=True)
-        return Response(serializer.data)
+        """
+        Get an auction's bid history, newest first (keyset-paginated)
+        ?since=<cursor> returns only bids newer than a previous response
+        ?layout=columnar returns parallel arrays of times (epoch ms) and amounts
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            return Response({'error': 'Auction not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not AuctionListing.objects.filter(pk=pk).exists():
+            return Response({'error': 'Auction not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        paginator = BidHistoryPagination()
+        if request.query_params.get('layout') == 'columnar':
+            bids = paginator.paginate_queryset(
+                Bid.objects.filter(auction_id=pk).only('id', 'bid_time', 'amount'), request, view=self
+            )
+            return paginator.get_paginated_response({
+                'times': [int(bid.bid_time.timestamp() * 1000) for bid in bids],
+                'amounts': [str(bid.amount) for bid in bids],
+            })
+        
+        bids = paginator.paginate_queryset(
+            Bid.objects.filter(auction_id=pk).select_related('bidder'), request, view=self
+        )
+        return paginator.get_paginated_response(BidSerializer(bids, many=True).data)
 
 
 # Fixed Price Listing ViewSet
-class FixedPriceListingViewSet(viewsets.ModelViewSet):
+class FixedPriceListingViewSet(ResponseCacheMixin, WishlistConditionalGetMixin, viewsets.ModelViewSet):
     """CRUD operations for fixed price listings"""
-    queryset = FixedPriceListing.objects.select_related(
-        'product__seller', 'product__category'
-    ).prefetch_related('product__images').all()
+    queryset = FixedPriceListing.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['product__name', 'product__description']
+    filter_backends = [ProductSearchFilter, filters.OrderingFilter]
+    search_vector_field = 'product__search_vector'
     ordering_fields = ['price', 'created_at']
+    pagination_class = FeedPagination
+    validator_fields = ('updated_at', 'product__updated_at', 'product__seller__seller_profile__updated_at')
+    validator_schedule_fields = ('discount_start_date', 'discount_end_date')
+    cache_tag = 'listing'
+    
+    def get_cache_tags(self, obj):
+        return [f'listing:{obj.id}', *response_cache.product_tags(obj.product)]
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -431,7 +535,9 @@ class FixedPriceListingViewSet(viewsets.ModelViewSet):
         return FixedPriceListingSerializer
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().prefetch_related(
+            Prefetch('product', queryset=ProductSerializer.setup_eager_loading(Product.objects.all(), self.request))
+        )
         
         # Filter by status
         status_param = self.request.query_params.get('status')
@@ -448,18 +554,16 @@ class FixedPriceListingViewSet(viewsets.ModelViewSet):
         if seller_id:
             queryset = queryset.filter(product__seller_id=seller_id)
         
-        # Filter by category
+        # Filter by category, including its subcategories
         category_id = self.request.query_params.get('category')
         if category_id:
-            queryset = queryset.filter(product__category_id=category_id)
+            path = category_tree.get_path(category_id)
+            queryset = queryset.filter(product__category__path__startswith=path) if path else queryset.none()
         
         # Filter by province
         province_id = self.request.query_params.get('province')
         if province_id:
-            queryset = queryset.filter(
-                Q(product__seller__seller_profile__business_address_id__city__province_id=province_id) |
-                Q(product__seller__addresses__city__province_id=province_id, product__seller__addresses__is_default=True)
-            ).distinct()
+            queryset = queryset.filter(product__province_id=province_id)
         
         # Price range filter
         min_price = self.request.query_params.get('min_price')
@@ -479,6 +583,17 @@ class FixedPriceListingViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Counts per category, condition, province and price bucket for the current filters"""
+        queryset = self.filter_queryset(self.get_queryset())
+        filter_params = set(request.query_params) - facets.NON_FILTER_PARAMS
+        return Response(facets.get_listing_facets(
+            queryset,
+            cacheable=filter_params <= {'status'},
+            status=request.query_params.get('status'),
+        ))
+    
     def update(self, request, *args, **kwargs):
         """Update listing - only seller can modify"""
         listing = self.get_object()
@@ -647,7 +762,7 @@ class FixedPriceListingViewSet(viewsets.ModelViewSet):
 
 
 # Order ViewSet
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """View orders"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -725,6 +840,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
             
             # Mark all seller's items as shipped
             seller_items.update(is_shipped=True, shipped_at=timezone.now())
+            Order.objects.filter(id=order.id).update(updated_at=timezone.now())  # Items are part of the order
             
             # Notify buyer about this seller's shipment
             Notification.objects.create(
@@ -1011,7 +1127,7 @@ class WishlistViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         return Wishlist.objects.filter(user=self.request.user).select_related(
-            'product__seller', 'product__category'
+            'product__seller', 'product__category', 'product__province'
         ).prefetch_related('product__images')
     
     def get_serializer_class(self):
@@ -1031,10 +1147,11 @@ class WishlistViewSet(viewsets.ModelViewSet):
 
 
 # Seller Profile ViewSet
-class SellerProfileViewSet(viewsets.ModelViewSet):
+class SellerProfileViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """CRUD operations for seller profiles"""
     serializer_class = SellerProfileSerializer
     permission_classes = [IsAuthenticated]
+    validator_fields = ('updated_at', 'user__updated_at')
     
     def get_queryset(self):
         # Admins can see all profiles, sellers can see their own